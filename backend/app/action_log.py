@@ -0,0 +1,312 @@
+# ============================================================
+# Bitácora de acciones con escritura diferida (write-behind)
+# ============================================================
+#
+# log_action ya no escribe en Firestore en la ruta de la petición: arma el
+# registro localmente (id generado en el cliente, fecha local), lo encola y
+# lo regresa. Un hilo en segundo plano vacía la cola con commits de
+# db.batch() cuando se juntan ACTION_LOG_BATCH_SIZE entradas o pasan
+# ACTION_LOG_FLUSH_INTERVAL segundos. close() vacía lo pendiente al apagar.
+#
+# Es una bitácora de auditoría: nada se descarta. Si Firestore no responde y
+# la cola en memoria llega a ACTION_LOG_MAX_PENDING, lo que sigue se guarda en
+# un SQLite local (spill) y el hilo lo escribe cuando Firestore se recupera,
+# también tras reiniciar el proceso. Los ids se generan aquí, así que
+# escribir dos veces la misma entrada (p.ej. padre e hijo tras un fork) es
+# idempotente.
+
+import json
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.metrics import counter, gauge, track
+
+ACTION_LOG_BATCH_SIZE = int(os.getenv("ACTION_LOG_BATCH_SIZE", "200"))
+ACTION_LOG_FLUSH_INTERVAL = float(os.getenv("ACTION_LOG_FLUSH_INTERVAL", "1.0"))
+# Tope de la cola en memoria; lo que exceda se guarda en ACTION_LOG_SPILL_DB
+ACTION_LOG_MAX_PENDING = int(os.getenv("ACTION_LOG_MAX_PENDING", "10000"))
+ACTION_LOG_SPILL_DB = os.getenv(
+    "ACTION_LOG_SPILL_DB", str(Path(__file__).resolve().parents[1] / "action_log_spill.sqlite")
+)
+
+FIRESTORE_BATCH_LIMIT = 500
+
+PENDING = gauge("action_log_pending", "Acciones en la cola en memoria")
+SPILLED = counter("action_log_spilled_total", "Acciones guardadas en disco por cola llena")
+DROPPED = counter("action_log_dropped_total", "Acciones perdidas (ni cola ni disco)")
+FAILED = counter("action_log_failed_commits_total", "Commits de la bitácora que fallaron")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spill (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    doc TEXT NOT NULL
+);
+"""
+
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+def new_doc_id() -> str:
+    """Id de 20 caracteres como los automáticos de Firestore, sin ir a Firestore."""
+    return "".join(random.choices(_ID_CHARS, k=20))
+
+
+def _encode(doc: Dict[str, Any]) -> str:
+    return json.dumps(
+        {k: {"$date": v.isoformat()} if isinstance(v, datetime) else v for k, v in doc.items()},
+        ensure_ascii=False,
+    )
+
+
+def _decode(text: str) -> Dict[str, Any]:
+    return {
+        k: datetime.fromisoformat(v["$date"]) if isinstance(v, dict) and "$date" in v else v
+        for k, v in json.loads(text).items()
+    }
+
+
+class ActionLogWriter:
+    def __init__(self, db_getter, collection: str = "actions", batch_size: int = ACTION_LOG_BATCH_SIZE,
+                 flush_interval: float = ACTION_LOG_FLUSH_INTERVAL,
+                 max_pending: int = ACTION_LOG_MAX_PENDING, spill_path: str = ACTION_LOG_SPILL_DB):
+        # Función que regresa el cliente: Firestore se inicializa en el hilo de
+        # escritura, nunca en la ruta de la petición
+        self._db_getter = db_getter
+        self._collection = collection
+        self._batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self._flush_interval = flush_interval
+        self._pending: deque = deque()
+        self._max_pending = max_pending
+        self._spill_path = spill_path
+        self._spill_conn: Optional[sqlite3.Connection] = None
+        self._spill_lock = threading.Lock()
+        # Para avisar una vez por episodio de cola llena, no por cada entrada
+        self._spilling = False
+        self._cond = threading.Condition()
+        # Serializa los commits entre el hilo de fondo y flush() explícitos
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.stats = {"queued": 0, "written": 0, "commits": 0, "failed_commits": 0, "spilled": 0, "dropped": 0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # El hijo no hereda el hilo de escritura ni la conexión SQLite. Lo
+        # pendiente se conserva: los ids son locales, así que si el padre
+        # también lo escribe, la segunda escritura es idéntica
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._spill_conn = None
+        self._thread = None
+
+    # --------------------------------------------------------
+    # Encolar
+    # --------------------------------------------------------
+    def append(self, doc: Dict[str, Any]) -> str:
+        """Encola el documento y regresa su id (generado sin ir a Firestore)."""
+        doc_id = new_doc_id()
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._ensure_thread()
+                if len(self._pending) < self._max_pending:
+                    self._pending.append((doc_id, doc))
+                    self.stats["queued"] += 1
+                    PENDING.set(len(self._pending))
+                    if len(self._pending) >= self._batch_size:
+                        self._cond.notify()
+                    return doc_id
+        if closed:
+            # Ya se está apagando: escritura directa, y a disco si falla
+            try:
+                self._ref(doc_id).set(doc)
+                self.stats["written"] += 1
+                return doc_id
+            except Exception as e:
+                print(f"[ACTION_LOG] Error guardando acción al apagar: {e}")
+        self._spill([(doc_id, doc)])
+        return doc_id
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+            self._thread.start()
+
+    def _ref(self, doc_id: str):
+        return self._db_getter().collection(self._collection).document(doc_id)
+
+    # --------------------------------------------------------
+    # Spill a disco
+    # --------------------------------------------------------
+    def _spill_connection(self) -> sqlite3.Connection:
+        if self._spill_conn is None:
+            # Sin autocommit: `with conn` hace de cada INSERT/DELETE múltiple una transacción
+            conn = sqlite3.connect(self._spill_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._spill_conn = conn
+        return self._spill_conn
+
+    def _spill(self, entries: List[Tuple[str, Dict[str, Any]]]):
+        try:
+            with self._spill_lock:
+                conn = self._spill_connection()
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO spill (doc_id, doc) VALUES (?, ?)",
+                        [(doc_id, _encode(doc)) for doc_id, doc in entries],
+                    )
+        except Exception as e:
+            self.stats["dropped"] += len(entries)
+            DROPPED.inc(amount=len(entries))
+            print(f"[ACTION_LOG] PERDIDAS {len(entries)} acciones: no se pudieron guardar en "
+                  f"{self._spill_path}: {e}")
+            return
+        self.stats["spilled"] += len(entries)
+        SPILLED.inc(amount=len(entries))
+        if not self._spilling:
+            self._spilling = True
+            print(f"[ACTION_LOG] Cola llena ({self._max_pending}); las acciones se guardan en "
+                  f"{self._spill_path} hasta que Firestore responda")
+
+    def _spilled(self, limit: int) -> List[Tuple[int, str, Dict[str, Any]]]:
+        if self._spill_conn is None and not os.path.exists(self._spill_path):
+            return []
+        with self._spill_lock:
+            rows = self._spill_connection().execute(
+                "SELECT seq, doc_id, doc FROM spill ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, doc_id, _decode(doc)) for seq, doc_id, doc in rows]
+
+    def _unspill(self, seqs: List[int]):
+        with self._spill_lock:
+            conn = self._spill_connection()
+            with conn:
+                conn.executemany("DELETE FROM spill WHERE seq = ?", [(s,) for s in seqs])
+
+    def spilled_count(self) -> int:
+        if self._spill_conn is None and not os.path.exists(self._spill_path):
+            return 0
+        with self._spill_lock:
+            return self._spill_connection().execute("SELECT COUNT(*) FROM spill").fetchone()[0]
+
+    def resume(self):
+        """Al arrancar: si quedaron acciones en disco, arranca el hilo para escribirlas."""
+        spilled = self.spilled_count()
+        if spilled:
+            print(f"[ACTION_LOG] {spilled} acciones pendientes en disco de la ejecución anterior")
+            with self._cond:
+                self._ensure_thread()
+                self._cond.notify()
+
+    # --------------------------------------------------------
+    # Vaciar
+    # --------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self._batch_size:
+                    # Esperar a que se junte un lote o venza el intervalo
+                    self._cond.wait(self._flush_interval)
+                closing = self._closed
+            failed = self.stats["failed_commits"]
+            try:
+                self.flush()
+            except Exception as e:
+                # Firestore sin configurar, disco con error...: reintentar después
+                print(f"[ACTION_LOG] Error vaciando la bitácora: {e}")
+                time.sleep(self._flush_interval)
+            if closing:
+                return
+            if self.stats["failed_commits"] != failed:
+                time.sleep(self._flush_interval)
+
+    def _take(self):
+        with self._cond:
+            n = min(len(self._pending), self._batch_size)
+            chunk = [self._pending.popleft() for _ in range(n)]
+            PENDING.set(len(self._pending))
+            return chunk
+
+    def _commit(self, entries) -> bool:
+        # Todo dentro del try: si get_db() falla (p.ej. sin service_account.json)
+        # las entradas vuelven a la cola en lugar de perderse
+        try:
+            batch = self._db_getter().batch()
+            for doc_id, doc in entries:
+                batch.set(self._ref(doc_id), doc)
+            with track("firestore", "batch.commit"):
+                batch.commit()
+        except Exception as e:
+            self.stats["failed_commits"] += 1
+            FAILED.inc()
+            print(f"[ACTION_LOG] Error guardando {len(entries)} acciones: {e}")
+            return False
+        self.stats["written"] += len(entries)
+        self.stats["commits"] += 1
+        return True
+
+    def flush(self) -> int:
+        """Escribe todo lo pendiente (memoria y disco); regresa cuántas entradas se guardaron."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                chunk = self._take()
+                if chunk:
+                    if not self._commit(chunk):
+                        # Se devuelven al frente de la cola para el siguiente intento
+                        with self._cond:
+                            self._pending.extendleft(reversed(chunk))
+                            PENDING.set(len(self._pending))
+                        return written
+                    written += len(chunk)
+                    continue
+                # Memoria vacía: lo que se guardó en disco, en orden
+                spilled = self._spilled(self._batch_size)
+                if not spilled:
+                    self._spilling = False
+                    return written
+                if not self._commit([(doc_id, doc) for _, doc_id, doc in spilled]):
+                    return written
+                self._unspill([seq for seq, _, _ in spilled])
+                written += len(spilled)
+
+    def close(self, timeout: float = 10.0):
+        """Vacía lo pendiente y detiene el hilo (al apagar la app)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        # Si el último commit falló, reintentar hasta el límite de tiempo
+        while self._pending and time.monotonic() < deadline:
+            try:
+                if self.flush():
+                    continue
+            except Exception as e:
+                print(f"[ACTION_LOG] Error vaciando la bitácora: {e}")
+            time.sleep(0.2)
+        if self._pending:
+            # Lo que no llegó a Firestore queda en disco para el próximo arranque
+            with self._cond:
+                remaining = list(self._pending)
+                self._pending.clear()
+                PENDING.set(0)
+            self._spilling = True
+            self._spill(remaining)
+            print(f"[ACTION_LOG] {len(remaining)} acciones guardadas en disco para el próximo arranque")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": len(self._pending), "spilled_pending": self.spilled_count()}
@@ -0,0 +1,162 @@
+# ============================================================
+# Disponibilidad de grupo — motor vectorizado con NumPy
+# ============================================================
+#
+# Generaliza find_free_slots_for_day/chunk_slots a muchos asistentes:
+# los intervalos ocupados de cada calendario se convierten a minutos
+# epoch (enteros), se arma un bitmap asistentes × minutos (1 byte por celda)
+# con un barrido (diferencias + cumsum en int16) y cada slot candidato se
+# evalúa con un OR deslizante sobre el bitmap, sin ciclos de Python por
+# asistente ni por minuto y sin matrices int32/int64 del tamaño del rango.
+
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from app.calendar import TIMEZONE
+
+
+def epoch_minute(dt: datetime) -> int:
+    return int(dt.timestamp()) // 60
+
+
+def busy_to_minutes(busy_list, origin: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Convierte [{"start", "end"}, ...] a arreglos (inicio, fin) en minutos desde origin."""
+    starts = np.fromiter(
+        (epoch_minute(datetime.fromisoformat(b["start"])) for b in busy_list),
+        dtype=np.int64, count=len(busy_list),
+    )
+    ends = np.fromiter(
+        (epoch_minute(datetime.fromisoformat(b["end"])) for b in busy_list),
+        dtype=np.int64, count=len(busy_list),
+    )
+    return starts - origin, ends - origin
+
+
+def busy_matrix(intervals: Sequence[Tuple[np.ndarray, np.ndarray]], n_minutes: int) -> np.ndarray:
+    """
+    Matriz booleana (asistentes × minutos): True si el asistente está ocupado.
+
+    Sweep-line vectorizado: +1 en cada inicio y -1 en cada fin sobre un
+    arreglo aplanado de todos los asistentes, y un cumsum por fila hecho en
+    el mismo arreglo int16 (2 bytes por celda; soporta hasta 32767 eventos
+    superpuestos en un minuto).
+    """
+    n = len(intervals)
+    if n == 0:
+        return np.zeros((0, n_minutes), dtype=bool)
+    width = n_minutes + 1
+    diff = np.zeros(n * width, dtype=np.int16)
+
+    rows = np.concatenate([np.full(len(s), k, dtype=np.int64) for k, (s, _) in enumerate(intervals)])
+    starts = np.concatenate([s for s, _ in intervals])
+    ends = np.concatenate([e for _, e in intervals])
+
+    starts = np.clip(starts, 0, n_minutes)
+    ends = np.clip(ends, 0, n_minutes)
+    keep = ends > starts
+    rows, starts, ends = rows[keep], starts[keep], ends[keep]
+
+    np.add.at(diff, rows * width + starts, 1)
+    np.add.at(diff, rows * width + ends, -1)
+    diff = diff.reshape(n, width)
+    np.cumsum(diff, axis=1, dtype=np.int16, out=diff)
+    return diff[:, :n_minutes] > 0
+
+
+def window_any(bitmap: np.ndarray, length: int) -> np.ndarray:
+    """
+    out[:, i] = bitmap[:, i:i + length].any() para i en [0, minutos - length].
+
+    OR deslizante por duplicación: log2(length) pasadas sobre una copia
+    booleana, en lugar de sumas prefijas que necesitan int32 por celda.
+    """
+    out = bitmap.copy()
+    span = 1
+    while span * 2 <= length:
+        out[:, :-span] |= out[:, span:]
+        span *= 2
+    if span < length:
+        # Dos ventanas de `span` que se traslapan cubren [i, i + length)
+        rest = length - span
+        out[:, :-rest] |= out[:, rest:]
+    return out[:, : bitmap.shape[1] - length + 1]
+
+
+def allowed_mask(windows, origin: int, n_minutes: int) -> np.ndarray:
+    """Minutos dentro de alguna ventana laboral [(día, inicio, fin), ...]."""
+    mask = np.zeros(n_minutes, dtype=bool)
+    for _, win_start, win_end in windows:
+        lo = max(epoch_minute(win_start) - origin, 0)
+        hi = min(epoch_minute(win_end) - origin, n_minutes)
+        mask[lo:hi] = True
+    return mask
+
+
+def rank_slots(busy: np.ndarray, allowed: np.ndarray, duration: int, step: int, top_k: int):
+    """
+    Evalúa todos los inicios candidatos (cada `step` minutos) y regresa
+    (inicios, asistentes_libres, matriz_libre) de los top_k mejores,
+    ordenados por asistentes libres desc y luego por hora asc.
+    """
+    n, n_minutes = busy.shape
+    if duration > n_minutes:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.zeros((n, 0), dtype=bool)
+
+    candidates = np.arange(0, n_minutes - duration + 1, step, dtype=np.int64)
+
+    # Candidato válido si toda su duración cae en horario laboral
+    blocked = np.concatenate([[0], np.cumsum(~allowed, dtype=np.int64)])
+    candidates = candidates[blocked[candidates + duration] - blocked[candidates] == 0]
+
+    # Libre si no tiene ningún minuto ocupado dentro del candidato
+    free = ~window_any(busy, duration)[:, candidates]
+    score = free.sum(axis=0, dtype=np.int64)
+
+    if len(candidates) > top_k:
+        # Preselección O(n) y orden estable sólo del top_k
+        cut = np.argpartition(-score, top_k - 1)[:top_k]
+        threshold = score[cut].min()
+        cut = np.flatnonzero(score >= threshold)
+    else:
+        cut = np.arange(len(candidates))
+    order = cut[np.lexsort((candidates[cut], -score[cut]))][:top_k]
+    return candidates[order], score[order], free[:, order]
+
+
+def group_slots(busy_by_attendee: Dict[str, list], windows, duration_minutes: int,
+                step_minutes: int = 15, top_k: int = 10, tz_name: str = TIMEZONE) -> List[dict]:
+    """
+    Top-k slots para un grupo, ordenados por cuántos asistentes están libres.
+
+    busy_by_attendee: {email: [{"start", "end"}, ...]} tal como lo da freebusy.
+    windows: ventanas laborales de working_windows().
+    """
+    if not windows:
+        return []
+
+    attendees = list(busy_by_attendee)
+    origin = epoch_minute(windows[0][1])
+    n_minutes = epoch_minute(windows[-1][2]) - origin
+
+    intervals = [busy_to_minutes(busy_by_attendee[a], origin) for a in attendees]
+    busy = busy_matrix(intervals, n_minutes)
+    allowed = allowed_mask(windows, origin, n_minutes)
+    starts, scores, free = rank_slots(busy, allowed, duration_minutes, step_minutes, top_k)
+
+    tz = ZoneInfo(tz_name)
+    base = datetime.fromtimestamp(origin * 60, tz=timezone.utc)
+    delta = timedelta(minutes=duration_minutes)
+    out = []
+    for col, (start, score) in enumerate(zip(starts.tolist(), scores.tolist())):
+        slot_start = base + timedelta(minutes=start)
+        out.append({
+            "start": slot_start.astimezone(tz).isoformat(),
+            "end": (slot_start + delta).astimezone(tz).isoformat(),
+            "free_count": score,
+            "total": len(attendees),
+            "busy_attendees": [a for a, ok in zip(attendees, free[:, col].tolist()) if not ok],
+        })
+    return out
@@ -1,15 +1,18 @@
 from datetime import date, datetime, time, timedelta
-import os.path
+import os
+import threading
+from typing import Optional
 from zoneinfo import ZoneInfo
 import pytz
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from pathlib import Path
 
+from app.calendar_quota import calendar_scheduler
+from app.tracing import span
+
+# Las librerías de Google (auth, oauthlib, discovery) se importan dentro de
+# las funciones que las usan: importar este módulo no carga nada de eso.
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
@@ -21,39 +24,181 @@ Prints the start and name of the next 10 events on the user's calendar.
 SA_PATH = Path(__file__).resolve().parents[1] / "calendar_service_account.json"
 TOKEN_FILE = Path(__file__).resolve().parents[1] / "token.json"
 
-def create_calendar_meeting(event):
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-    # Si no hay token o está vencido sin refresh_token, corre el flujo
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            # local server flow (abre navegador). Para “offline” y refresh_token garantizado:
-            flow = InstalledAppFlow.from_client_secrets_file(SA_PATH, SCOPES)
-            # En “Web app” o si no puedes abrir navegador, usa: flow.run_console()
-            creds = flow.run_local_server(
-                port=0,
-                prompt="consent",       # fuerza pantalla de consentimiento
-                access_type="offline",  # asegura refresh_token
-                include_granted_scopes="true"
-            )
+# Refresca el token un poco antes de que expire para no pagar el refresh
+# dentro de una llamada a la API.
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class CalendarAuthorizationRequired(Exception):
+    """
+    El usuario no tiene credenciales válidas. Nunca se abre el flujo de
+    consentimiento dentro de una petición: se autoriza fuera de línea con
+    `python -m app.credential_pool authorize`.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        super().__init__(f"El usuario {user_id} no ha autorizado Google Calendar")
+
+
+def run_authorization_flow(client_secrets: Path = SA_PATH, scopes=SCOPES):
+    """Flujo de consentimiento interactivo (abre navegador). Sólo para la CLI."""
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    # local server flow (abre navegador). Para “offline” y refresh_token garantizado:
+    flow = InstalledAppFlow.from_client_secrets_file(client_secrets, scopes)
+    # En “Web app” o si no puedes abrir navegador, usa: flow.run_console()
+    return flow.run_local_server(
+        port=0,
+        prompt="consent",       # fuerza pantalla de consentimiento
+        access_type="offline",  # asegura refresh_token
+        include_granted_scopes="true"
+    )
+
+
+# ============================================================
+# CLIENTE COMPARTIDO DE CALENDAR
+# ============================================================
+class CalendarClientManager:
+    """
+    Mantiene las credenciales en memoria y un cliente de Calendar por hilo
+    para todo el proceso.
+
+    - token.json se lee una sola vez y se reescribe solo si el token cambia.
+    - El refresh se hace antes de expirar y nunca hay dos refresh a la vez.
+    - El documento de discovery es el que viene empaquetado con
+      googleapiclient, así que build() no hace ninguna petición de red.
+    """
+
+    def __init__(self, token_file: Path = TOKEN_FILE, client_secrets: Path = SA_PATH,
+                 scopes=SCOPES, refresh_margin: timedelta = REFRESH_MARGIN):
+        self._token_file = token_file
+        self._client_secrets = client_secrets
+        self._scopes = scopes
+        self._refresh_margin = refresh_margin
+        self._creds = None
+        self._saved_token = None
+        self._discovery_doc = None
+        self._lock = threading.Lock()
+        # httplib2 no es thread-safe: un service por hilo, construido una vez
+        self._local = threading.local()
+
+    def _needs_refresh(self) -> bool:
+        creds = self._creds
+        if creds is None or not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth guarda expiry como datetime UTC naive
+        return datetime.utcnow() >= creds.expiry - self._refresh_margin
+
+    def _load(self):
+        from google.oauth2.credentials import Credentials
+
+        creds = None
+        # The file token.json stores the user's access and refresh tokens, and is
+        # created by `python -m app.credential_pool authorize`.
+        if os.path.exists(self._token_file):
+            creds = Credentials.from_authorized_user_file(self._token_file, self._scopes)
+            self._saved_token = creds.token
+
+        if creds is None or (not creds.valid and not creds.refresh_token):
+            # Sin token utilizable: nada de abrir un navegador a mitad de una petición
+            raise CalendarAuthorizationRequired("default")
+        return creds
+
+    def _persist(self):
         # Guarda token.json con token, refresh_token, client_id, client_secret, etc.
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
+        if self._creds.token == self._saved_token:
+            return
+        with open(self._token_file, "w") as f:
+            f.write(self._creds.to_json())
+        self._saved_token = self._creds.token
+
+    def credentials(self) -> "Credentials":
+        """Devuelve credenciales válidas, refrescándolas si están por expirar."""
+        if not self._needs_refresh():
+            return self._creds
+
+        with self._lock:
+            # Otro hilo pudo haber refrescado mientras esperábamos el lock
+            if self._needs_refresh():
+                if self._creds is None:
+                    with span("calendar.credentials.load"):
+                        self._creds = self._load()
+                if self._needs_refresh():
+                    from google.auth.exceptions import RefreshError
+                    from google.auth.transport.requests import Request
+
+                    with span("calendar.credentials.refresh"):
+                        try:
+                            self._creds.refresh(Request())
+                        except RefreshError:
+                            # refresh_token revocado o vencido
+                            raise CalendarAuthorizationRequired("default")
+                self._persist()
+        return self._creds
+
+    def service(self):
+        """Cliente de Calendar v3 del hilo actual (se construye una sola vez)."""
+        creds = self.credentials()
+        service = getattr(self._local, "service", None)
+        if service is None or getattr(self._local, "creds", None) is not creds:
+            from googleapiclient.discovery import build_from_document
+            from googleapiclient.discovery_cache import get_static_doc
+
+            with span("calendar.build"):
+                if self._discovery_doc is None:
+                    self._discovery_doc = get_static_doc("calendar", "v3")
+                service = build_from_document(self._discovery_doc, credentials=creds)
+            self._local.service = service
+            self._local.creds = creds
+        return service
+
+    def cached_token(self):
+        """Access token en memoria si sigue vigente; None si hay que refrescar."""
+        if self._needs_refresh():
+            return None
+        return self._creds.token
+
+    def access_token(self) -> str:
+        return self.credentials().token
+
+    def _after_fork(self):
+        # Los locks y los clientes httplib2 del padre no sirven en el hijo
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+calendar_manager = CalendarClientManager()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=calendar_manager._after_fork)
+
+
+def _http_error_info(error: Exception):
+    # (status, cuerpo, Retry-After) para decidir reintentos en calendar_quota
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return error.resp.status, error.content, error.resp.get("retry-after")
+    return None
+
+
+def _execute(request, op: str, idempotent: bool = True):
+    """Ejecuta la petición de googleapiclient con cuota, prioridad y reintentos."""
+    return calendar_scheduler.run(request.execute, op, _http_error_info, idempotent=idempotent)
+
+
+def create_calendar_meeting(event):
+    from googleapiclient.errors import HttpError
 
     try:
-        service = build("calendar", "v3", credentials=creds)
-        created = service.events().insert(
+        service = calendar_manager.service()
+        created = _execute(service.events().insert(
             calendarId="primary",
             body=event,
             conferenceDataVersion=1
-        ).execute()
+        ), "events.insert", idempotent="id" in event)
 
         return created
 
@@ -61,40 +206,17 @@ def create_calendar_meeting(event):
         print(f"An error occurred: {error}")
 
 def update_calendar_meeting(event_id: str, updates: dict):
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-    # Si no hay token o está vencido sin refresh_token, corre el flujo
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            # local server flow (abre navegador). Para “offline” y refresh_token garantizado:
-            flow = InstalledAppFlow.from_client_secrets_file(SA_PATH, SCOPES)
-            # En “Web app” o si no puedes abrir navegador, usa: flow.run_console()
-            creds = flow.run_local_server(
-                port=0,
-                prompt="consent",       # fuerza pantalla de consentimiento
-                access_type="offline",  # asegura refresh_token
-                include_granted_scopes="true"
-            )
-        # Guarda token.json con token, refresh_token, client_id, client_secret, etc.
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
-    
+    from googleapiclient.errors import HttpError
+
     try:
-        service = build("calendar", "v3", credentials=creds)
+        service = calendar_manager.service()
 
-        updated = service.events().patch(
+        updated = _execute(service.events().patch(
             calendarId="primary",
             eventId=event_id,
             body=updates,
             conferenceDataVersion=1
-        ).execute()
+        ), "events.patch")
 
         return updated
 
@@ -104,74 +226,40 @@ def update_calendar_meeting(event_id: str, updates: dict):
 
 
 def cancel_calendar_meeting(event_id):
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-    # Si no hay token o está vencido sin refresh_token, corre el flujo
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            # local server flow (abre navegador). Para “offline” y refresh_token garantizado:
-            flow = InstalledAppFlow.from_client_secrets_file(SA_PATH, SCOPES)
-            # En “Web app” o si no puedes abrir navegador, usa: flow.run_console()
-            creds = flow.run_local_server(
-                port=0,
-                prompt="consent",       # fuerza pantalla de consentimiento
-                access_type="offline",  # asegura refresh_token
-                include_granted_scopes="true"
-            )
-        # Guarda token.json con token, refresh_token, client_id, client_secret, etc.
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
+    from googleapiclient.errors import HttpError
 
     try:
-        service = build("calendar", "v3", credentials=creds)
+        service = calendar_manager.service()
         
         # o guarda este ID en tu BD
-        service.events().delete(
+        _execute(service.events().delete(
             calendarId="primary",
             eventId=event_id,
             sendUpdates="all"  # envía cancelación a los invitados
-        ).execute()
+        ), "events.delete")
     except HttpError as error:
         print(f"An error occurred: {error}")
 
 TIMEZONE = "America/Mexico_City"
 
+# Respuesta parcial (fields=) para events.list: sólo lo que usan GET
+# /v1/meetings, la cache de eventos y busy_between. El recurso completo trae
+# además conferenceData, creator, organizer, reminders, htmlLink, iCalUID...
+# Vacío = recurso completo.
+CALENDAR_EVENT_FIELDS = os.getenv(
+    "CALENDAR_EVENT_FIELDS",
+    "id,status,summary,location,start,end,transparency,hangoutLink,attendees(email,responseStatus)",
+)
+EVENT_LIST_FIELDS = (
+    f"items({CALENDAR_EVENT_FIELDS}),nextPageToken,nextSyncToken" if CALENDAR_EVENT_FIELDS else None
+)
+
 def list_events_for_date(target_date: date, timezone: str = "America/Mexico_City"):
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-    # Si no hay token o está vencido sin refresh_token, corre el flujo
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            # local server flow (abre navegador). Para “offline” y refresh_token garantizado:
-            flow = InstalledAppFlow.from_client_secrets_file(SA_PATH, SCOPES)
-            # En “Web app” o si no puedes abrir navegador, usa: flow.run_console()
-            creds = flow.run_local_server(
-                port=0,
-                prompt="consent",       # fuerza pantalla de consentimiento
-                access_type="offline",  # asegura refresh_token
-                include_granted_scopes="true"
-            )
-        # Guarda token.json con token, refresh_token, client_id, client_secret, etc.
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
+    from googleapiclient.errors import HttpError
 
     events = []
     try:
-        service = build("calendar", "v3", credentials=creds)
+        service = calendar_manager.service()
         # Inicio del día en la zona indicada
         start_dt = datetime.combine(target_date, datetime.min.time(), tzinfo=ZoneInfo(timezone))
         end_dt = start_dt + timedelta(days=1)
@@ -179,14 +267,16 @@ def list_events_for_date(target_date: date, timezone: str = "America/Mexico_City
         time_min = start_dt.isoformat()  # se recomienda añadir 'Z' si usas UTC, aquí usamos TZ local lógica
         time_max = end_dt.isoformat()
 
-        events_result = service.events().list(
+        params = {"fields": EVENT_LIST_FIELDS} if EVENT_LIST_FIELDS else {}
+        events_result = _execute(service.events().list(
             calendarId="primary",
             timeMin=time_min,
             timeMax=time_max,
             timeZone=timezone,
             singleEvents=True,
             orderBy="startTime",
-        ).execute()
+            **params,
+        ), "events.list")
 
         events = events_result.get("items", [])
     except HttpError as error:
@@ -195,25 +285,7 @@ def list_events_for_date(target_date: date, timezone: str = "America/Mexico_City
     return events
 
 def get_calendar_service():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(SA_PATH, SCOPES)
-            creds = flow.run_local_server(
-                port=0,
-                prompt="consent",
-                access_type="offline",
-                include_granted_scopes="true"
-            )
-        with open(TOKEN_FILE, "w") as f:
-            f.write(creds.to_json())
-
-    return build("calendar", "v3", credentials=creds)
+    return calendar_manager.service()
 
 
 def find_free_slots_for_day(date, min_slot_minutes=30):
@@ -231,9 +303,14 @@ def find_free_slots_for_day(date, min_slot_minutes=30):
         "items": [{"id": "primary"}],
     }
 
-    resp = service.freebusy().query(body=body).execute()
+    resp = _execute(service.freebusy().query(body=body), "freebusy.query")
     busy_list = resp["calendars"]["primary"]["busy"]  # lista de intervalos ocupados
 
+    return free_gaps(busy_list, start_dt, end_dt, min_slot_minutes)
+
+
+def free_gaps(busy_list, start_dt: datetime, end_dt: datetime, min_slot_minutes=30):
+    """Huecos libres de al menos min_slot_minutes entre start_dt y end_dt."""
     # Si no hay eventos: el día completo está libre
     if not busy_list:
         return [(start_dt, end_dt)]
@@ -263,12 +340,118 @@ def find_free_slots_for_day(date, min_slot_minutes=30):
     return free_slots
 
 
-def chunk_slots(start: datetime, end: datetime, duration_minutes: int):
-    """Divide un hueco [start, end] en slots contiguos de duración fija."""
-    slots = []
+def working_windows(start_date: date, end_date: date, work_start: time, work_end: time,
+                    exclude_weekdays=(), exclude_dates=(), timezone: str = TIMEZONE):
+    """Ventanas [inicio, fin] de horario laboral por día, en orden, ambos extremos incluidos."""
+    tz = pytz.timezone(timezone)
+    exclude_weekdays = set(exclude_weekdays)
+    exclude_dates = set(exclude_dates)
+    windows = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() not in exclude_weekdays and day not in exclude_dates:
+            windows.append((
+                day,
+                tz.localize(datetime.combine(day, work_start)),
+                tz.localize(datetime.combine(day, work_end)),
+            ))
+        day += timedelta(days=1)
+    return windows
+
+
+def iter_free_gaps(busy_list, windows, min_slot_minutes=30):
+    """
+    Genera (día, inicio, fin) de los huecos libres de cada ventana, en orden,
+    en una sola pasada sobre busy_list (ordenada por inicio, como la regresa
+    freebusy). Es perezoso: quien sólo necesita los primeros huecos no paga
+    por el resto del rango.
+    """
+    busy = [
+        (datetime.fromisoformat(b["start"]), datetime.fromisoformat(b["end"]))
+        for b in busy_list
+    ]
+    min_gap = timedelta(minutes=min_slot_minutes)
+    i = 0
+    for day, win_start, win_end in windows:
+        # Descarta lo ocupado que terminó antes de esta ventana
+        while i < len(busy) and busy[i][1] <= win_start:
+            i += 1
+
+        cursor = win_start
+        # j no avanza i: un evento largo puede abarcar varias ventanas
+        j = i
+        while j < len(busy) and busy[j][0] < win_end:
+            busy_start, busy_end = busy[j]
+            if busy_start - cursor >= min_gap:
+                yield day, cursor, busy_start
+            if busy_end > cursor:
+                cursor = busy_end
+            j += 1
+        if win_end - cursor >= min_gap:
+            yield day, cursor, win_end
+
+
+def free_gaps_by_day(busy_list, windows, min_slot_minutes=30):
+    """Huecos libres de cada ventana: {día: [(inicio, fin), ...]}."""
+    result = {day: [] for day, _, _ in windows}
+    for day, gap_start, gap_end in iter_free_gaps(busy_list, windows, min_slot_minutes):
+        result[day].append((gap_start, gap_end))
+    return result
+
+
+def align_up(dt: datetime, align_minutes: int) -> datetime:
+    """Primer instante >= dt que cae en múltiplo de align_minutes en hora local (dt con zona)."""
+    local_seconds = dt.timestamp() + dt.utcoffset().total_seconds()
+    remainder = local_seconds % (align_minutes * 60)
+    if remainder == 0:
+        return dt
+    return dt + timedelta(seconds=align_minutes * 60 - remainder)
+
+
+def iter_slots(start: datetime, end: datetime, duration_minutes: int,
+               step_minutes: Optional[int] = None, align_minutes: Optional[int] = None,
+               after: Optional[datetime] = None):
+    """
+    Genera slots (inicio, fin) de duración fija dentro del hueco [start, end].
+
+    step_minutes: distancia entre inicios (por defecto la duración: contiguos).
+    align_minutes: el primer inicio se redondea hacia arriba a un múltiplo en
+    hora local (p.ej. 15 -> :00, :15, :30, :45).
+    after: sólo inicios estrictamente posteriores (para reanudar una página).
+    """
     delta = timedelta(minutes=duration_minutes)
-    cursor = start
+    step = timedelta(minutes=step_minutes or duration_minutes)
+    cursor = align_up(start, align_minutes) if align_minutes else start
+    if after is not None and after >= cursor:
+        # Salta directo al primer inicio > after, sin recorrer los anteriores
+        cursor += step * ((after - cursor) // step + 1)
     while cursor + delta <= end:
-        slots.append((cursor, cursor + delta))
-        cursor += delta
-    return slots
+        yield cursor, cursor + delta
+        cursor += step
+
+
+def chunk_slots(start: datetime, end: datetime, duration_minutes: int):
+    """Divide un hueco [start, end] en slots contiguos de duración fija."""
+    return list(iter_slots(start, end, duration_minutes))
+
+
+def iter_slot_suggestions(busy_list, windows, duration_minutes: int,
+                          step_minutes: Optional[int] = None, align_minutes: Optional[int] = None,
+                          after: Optional[datetime] = None, timezone: str = TIMEZONE):
+    """
+    Slots reservables (día, inicio, fin) en orden cronológico a partir de los
+    huecos libres. Todo es perezoso: con islice(..., n) sólo se calculan los
+    huecos y slots necesarios para llenar la página.
+    """
+    tz = ZoneInfo(timezone)
+    if after is not None:
+        # Las ventanas que terminaron antes del cursor ni se recorren
+        windows = [w for w in windows if w[2] > after]
+    for day, gap_start, gap_end in iter_free_gaps(busy_list, windows, duration_minutes):
+        if after is not None and gap_end <= after:
+            continue
+        # freebusy regresa UTC: los slots (y la alineación) van en hora local
+        gap_start, gap_end = gap_start.astimezone(tz), gap_end.astimezone(tz)
+        for slot_start, slot_end in iter_slots(gap_start, gap_end, duration_minutes,
+                                               step_minutes, align_minutes, after):
+            yield day, slot_start, slot_end
@@ -0,0 +1,592 @@
+# ============================================================
+# Calendar asíncrono — backend asyncio sobre httpx
+# ============================================================
+#
+# Mismas operaciones que app/calendar.py (events insert/patch/delete/list y
+# freebusy.query) pero sin bloquear el threadpool de Starlette: todas las
+# llamadas comparten un AsyncClient con conexiones keep-alive (HTTP/2 si el
+# paquete `h2` está instalado).
+
+import asyncio
+import copy
+import json
+import os
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from itertools import islice
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from zoneinfo import ZoneInfo
+
+import httpx
+import pytz
+
+from app.calendar import (
+    EVENT_LIST_FIELDS, TIMEZONE, CalendarAuthorizationRequired, calendar_manager, free_gaps, free_gaps_by_day, iter_slot_suggestions,
+    working_windows,
+)
+from app.calendar_quota import CALENDAR_QUOTA_USER, CalendarRateLimited, calendar_scheduler
+from app.credential_pool import credential_pool, current_calendar_user
+from app.event_cache import get_event_store
+from app.singleflight import SingleFlight
+from app.metrics import track
+
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Permite apuntar a fakes/calendar_server.py en pruebas locales
+CALENDAR_API_BASE = os.getenv("CALENDAR_API_BASE", "https://www.googleapis.com/calendar/v3")
+CALENDAR_MAX_CONNECTIONS = int(os.getenv("CALENDAR_MAX_CONNECTIONS", "100"))
+CALENDAR_MAX_KEEPALIVE = int(os.getenv("CALENDAR_MAX_KEEPALIVE", "50"))
+# Google sólo comprime la respuesta si el User-Agent contiene "gzip"
+CALENDAR_USER_AGENT = os.getenv("CALENDAR_USER_AGENT", "sma-backend (gzip)")
+# freebusy.query acepta como máximo 50 calendarios por llamada
+FREEBUSY_MAX_ITEMS = 50
+# Calendar acepta hasta 50 llamadas por petición batch
+BATCH_MAX_OPERATIONS = 50
+
+
+class CalendarAPIError(Exception):
+    """Respuesta de error (>= 400) de la API de Calendar."""
+
+    def __init__(self, status_code: int, payload: Any, retry_after: Optional[str] = None):
+        self.status_code = status_code
+        self.payload = payload
+        self.retry_after = retry_after
+        super().__init__(f"Calendar API {status_code}: {payload}")
+
+
+def _error_info(error: Exception):
+    # (status, cuerpo, Retry-After) para decidir reintentos en calendar_quota
+    if isinstance(error, CalendarAPIError):
+        return error.status_code, error.payload, error.retry_after
+    return None
+
+
+async def _default_token_provider() -> str:
+    # Camino rápido: token en memoria; el refresh (bloqueante) va a un hilo
+    token = calendar_manager.cached_token()
+    if token:
+        return token
+    return await asyncio.to_thread(calendar_manager.access_token)
+
+
+class BatchCall:
+    """Una llamada dentro de una petición batch de Calendar."""
+
+    __slots__ = ("method", "path", "params", "body")
+
+    def __init__(self, method: str, path: str, params: Optional[dict] = None, body: Optional[dict] = None):
+        self.method = method
+        self.path = path
+        self.params = params or {}
+        self.body = body
+
+
+def _encode_batch(calls: List[BatchCall], path_prefix: str) -> Tuple[str, bytes]:
+    """Arma el cuerpo multipart/mixed; cada parte es una petición application/http."""
+    boundary = f"batch_{uuid.uuid4().hex}"
+    parts = []
+    for n, call in enumerate(calls):
+        query = str(httpx.QueryParams(call.params))
+        target = f"{path_prefix}{call.path}" + (f"?{query}" if query else "")
+        inner = f"{call.method} {target} HTTP/1.1\r\n"
+        payload = ""
+        if call.body is not None:
+            payload = json.dumps(call.body)
+            inner += "Content-Type: application/json\r\n"
+        inner += f"\r\n{payload}"
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <item-{n}>\r\n\r\n"
+            f"{inner}\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return f"multipart/mixed; boundary={boundary}", "".join(parts).encode()
+
+
+def _decode_batch(content_type: str, content: bytes, n_calls: int) -> List[Tuple[int, Any]]:
+    """Regresa [(status, cuerpo)] en el orden de las llamadas originales."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + content
+    )
+    results: List[Tuple[int, Any]] = [(500, "Sin respuesta en el batch")] * n_calls
+    for position, part in enumerate(message.iter_parts()):
+        content_id = part.get("Content-ID", "")
+        # Calendar responde con Content-ID: <response-item-N>
+        index = position
+        if "item-" in content_id:
+            index = int(content_id.rsplit("item-", 1)[1].rstrip(">"))
+        raw = part.get_payload(decode=True) or b""
+        head, _, body = raw.replace(b"\r\n", b"\n").partition(b"\n\n")
+        status = int(head.split(b"\n", 1)[0].split()[1])
+        body = body.strip()
+        try:
+            payload = json.loads(body) if body else None
+        except ValueError:
+            payload = body.decode(errors="replace")
+        if 0 <= index < n_calls:
+            results[index] = (status, payload)
+    return results
+
+
+class AsyncCalendarClient:
+    """Cliente mínimo de Calendar v3 con un pool de conexiones compartido."""
+
+    def __init__(self, base_url: str = CALENDAR_API_BASE, token_provider=None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_connections: int = CALENDAR_MAX_CONNECTIONS,
+                 max_keepalive: int = CALENDAR_MAX_KEEPALIVE, quota_user: str = CALENDAR_QUOTA_USER):
+        self._token_provider = token_provider or _default_token_provider
+        # Bucket de cuota por usuario en calendar_quota
+        self.quota_user = quota_user
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=_HTTP2_AVAILABLE and transport is None,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            # httpx descomprime la respuesta de forma transparente
+            headers={"Accept-Encoding": "gzip", "User-Agent": CALENDAR_USER_AGENT},
+        )
+        # https://www.googleapis.com/calendar/v3 -> /calendar/v3 y /batch/calendar/v3
+        self._path_prefix = urlsplit(base_url).path.rstrip("/")
+        self._batch_url = httpx.URL(base_url).copy_with(path=f"/batch{self._path_prefix}")
+
+    async def _request(self, op: str, method: str, path: str, *, params=None, json=None,
+                       priority: Optional[str] = None, idempotent: bool = True):
+        async def send():
+            token = await self._token_provider()
+            async with track("calendar", op):
+                resp = await self._client.request(
+                    method, path, params=params, json=json,
+                    headers={"Authorization": f"Bearer {token}"},
+                )
+                if resp.status_code >= 400:
+                    try:
+                        payload = resp.json()
+                    except ValueError:
+                        payload = resp.text
+                    raise CalendarAPIError(resp.status_code, payload, resp.headers.get("retry-after"))
+            return resp
+
+        resp = await calendar_scheduler.arun(send, op, _error_info, priority=priority, user=self.quota_user,
+                                             idempotent=idempotent)
+        if resp.status_code == 204 or not resp.content:
+            return None
+        return resp.json()
+
+    async def events_insert(self, calendar_id: str, body: dict, conference_data_version: int = 1):
+        # Sólo con id propio un reintento tras 5xx no puede duplicar el evento
+        # (responde 409 y acreate_calendar_meeting lo recupera)
+        return await self._request(
+            "events.insert", "POST", f"/calendars/{calendar_id}/events",
+            params={"conferenceDataVersion": conference_data_version}, json=body,
+            idempotent="id" in body,
+        )
+
+    async def events_patch(self, calendar_id: str, event_id: str, body: dict,
+                           conference_data_version: int = 1):
+        return await self._request(
+            "events.patch", "PATCH", f"/calendars/{calendar_id}/events/{quote(event_id, safe='')}",
+            params={"conferenceDataVersion": conference_data_version}, json=body,
+        )
+
+    async def events_delete(self, calendar_id: str, event_id: str, send_updates: str = "all"):
+        return await self._request(
+            "events.delete", "DELETE", f"/calendars/{calendar_id}/events/{quote(event_id, safe='')}",
+            params={"sendUpdates": send_updates},
+        )
+
+    async def events_get(self, calendar_id: str, event_id: str):
+        return await self._request(
+            "events.get", "GET", f"/calendars/{calendar_id}/events/{quote(event_id, safe='')}"
+        )
+
+    async def events_list(self, calendar_id: str, fields: Optional[str] = EVENT_LIST_FIELDS, **params):
+        # httpx serializa bool como "true"/"false", igual que la API espera
+        if fields:
+            params["fields"] = fields
+        return await self._request(
+            "events.list", "GET", f"/calendars/{calendar_id}/events", params=params,
+        )
+
+    async def freebusy_query(self, body: dict):
+        return await self._request("freebusy.query", "POST", "/freeBusy", json=body)
+
+    async def batch(self, calls: List[BatchCall]) -> List[Tuple[int, Any]]:
+        """
+        Envía hasta BATCH_MAX_OPERATIONS llamadas en una sola petición
+        multipart. Cada llamada trae su propio (status, cuerpo).
+        """
+        if len(calls) > BATCH_MAX_OPERATIONS:
+            raise ValueError(f"Un batch admite como máximo {BATCH_MAX_OPERATIONS} llamadas")
+        content_type, content = _encode_batch(calls, self._path_prefix)
+
+        async def send():
+            token = await self._token_provider()
+            async with track("calendar", "batch"):
+                resp = await self._client.post(
+                    self._batch_url, content=content,
+                    headers={"Authorization": f"Bearer {token}", "Content-Type": content_type},
+                )
+                if resp.status_code >= 400:
+                    raise CalendarAPIError(resp.status_code, resp.text, resp.headers.get("retry-after"))
+            return resp
+
+        # Cada llamada del batch cuenta contra la cuota; es trabajo en lote.
+        # Si trae inserts sin id, un 5xx no se reintenta (podrían duplicarse)
+        idempotent = all(c.body and "id" in c.body for c in calls if c.method == "POST")
+        resp = await calendar_scheduler.arun(send, "batch", _error_info, user=self.quota_user, cost=len(calls),
+                                             idempotent=idempotent)
+        return _decode_batch(resp.headers["content-type"], resp.content, len(calls))
+
+    def for_user(self, user_id: str, token_provider) -> "AsyncCalendarClient":
+        """Vista con las credenciales y la cuota de otro usuario sobre el mismo pool httpx."""
+        view = copy.copy(self)
+        view._token_provider = token_provider
+        view.quota_user = user_id
+        return view
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# ------------------------------------------------------------
+# Cliente compartido del proceso
+# ------------------------------------------------------------
+_client: Optional[AsyncCalendarClient] = None
+
+
+def get_async_calendar() -> AsyncCalendarClient:
+    """Cliente del usuario de la petición (X-Calendar-User) o el de token.json."""
+    global _client
+    if _client is None:
+        _client = AsyncCalendarClient()
+    user = current_calendar_user.get()
+    if user is None:
+        return _client
+    return _client.for_user(user, lambda: credential_pool.access_token(user))
+
+
+def _calendar_owner() -> str:
+    # Las lecturas compartidas (single-flight) no se mezclan entre usuarios
+    return current_calendar_user.get() or "default"
+
+
+def _event_store():
+    # La cache de eventos (syncToken) es sólo para el calendario de token.json:
+    # una por usuario no cabe en memoria con miles de usuarios
+    if current_calendar_user.get() is not None:
+        return None
+    return get_event_store("primary")
+
+
+def set_async_calendar(client: Optional[AsyncCalendarClient]):
+    """Reemplaza el cliente compartido (p.ej. por uno apuntando a un fake)."""
+    global _client
+    _client = client
+
+
+async def close_async_calendar():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _after_fork():
+    # Las conexiones del pool pertenecen al padre: el hijo abre las suyas
+    global _client
+    _client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+# ------------------------------------------------------------
+# Operaciones (equivalentes async de app/calendar.py)
+# ------------------------------------------------------------
+async def acreate_calendar_meeting(event: Dict[str, Any]):
+    client = get_async_calendar()
+    try:
+        created = await client.events_insert("primary", event)
+    except CalendarAPIError as error:
+        if error.status_code == 409 and event.get("id"):
+            # Id elegido por nosotros (Idempotency-Key) que ya existe: es el
+            # mismo evento creado por un intento anterior
+            try:
+                created = await client.events_get("primary", event["id"])
+            except CalendarAPIError as get_error:
+                print(f"An error occurred: {get_error}")
+                return None
+        else:
+            print(f"An error occurred: {error}")
+            return None
+    _write_through(created)
+    return created
+
+
+async def aupdate_calendar_meeting(event_id: str, updates: dict):
+    """None si el evento no existe (404/410); otros errores de Calendar se propagan."""
+    try:
+        updated = await get_async_calendar().events_patch("primary", event_id, updates)
+    except CalendarAPIError as error:
+        print(f"An error occurred: {error}")
+        if error.status_code in (404, 410):
+            return None
+        raise
+    _write_through(updated)
+    return updated
+
+
+async def acancel_calendar_meeting(event_id: str) -> bool:
+    """True si Calendar confirmó la cancelación o el evento ya no existe."""
+    try:
+        await get_async_calendar().events_delete("primary", event_id, send_updates="all")
+    except CalendarAPIError as error:
+        print(f"An error occurred: {error}")
+        # 404/410: ya estaba borrado, el espejo también debe irse
+        if error.status_code not in (404, 410):
+            return False
+    store = _event_store()
+    if store is not None:
+        store.remove_local(event_id)
+    _invalidate_reads()
+    return True
+
+
+def _write_through(event):
+    # Nuestras propias escrituras se ven de inmediato en la cache de eventos
+    store = _event_store()
+    if store is not None:
+        store.apply_local(event)
+    _invalidate_reads()
+
+
+# Lecturas idénticas simultáneas comparten una llamada (app/singleflight.py)
+events_flight = SingleFlight("events_for_date")
+free_slots_flight = SingleFlight("free_slots_for_day")
+
+
+def _invalidate_reads():
+    events_flight.invalidate()
+    free_slots_flight.invalidate()
+
+
+async def alist_events_for_date(target_date: date, timezone: str = TIMEZONE):
+    return await events_flight.do(
+        (_calendar_owner(), target_date, timezone),
+        lambda: _list_events_for_date(target_date, timezone),
+    )
+
+
+async def _list_events_for_date(target_date: date, timezone: str):
+    store = _event_store()
+    if store is not None and timezone == TIMEZONE:
+        try:
+            return await store.events_for_date(target_date)
+        except CalendarAPIError as error:
+            print(f"An error occurred: {error}")
+            return []
+
+    start_dt = datetime.combine(target_date, datetime.min.time(), tzinfo=ZoneInfo(timezone))
+    end_dt = start_dt + timedelta(days=1)
+    try:
+        result = await get_async_calendar().events_list(
+            "primary",
+            timeMin=start_dt.isoformat(),
+            timeMax=end_dt.isoformat(),
+            timeZone=timezone,
+            singleEvents=True,
+            orderBy="startTime",
+        )
+    except CalendarAPIError as error:
+        print(f"An error occurred: {error}")
+        return []
+    return result.get("items", [])
+
+
+async def afind_free_slots_for_day(date, min_slot_minutes=30):
+    return await free_slots_flight.do(
+        (_calendar_owner(), date, min_slot_minutes),
+        lambda: _find_free_slots_for_day(date, min_slot_minutes),
+    )
+
+
+async def _find_free_slots_for_day(date, min_slot_minutes):
+    tz = pytz.timezone(TIMEZONE)
+
+    # Día completo en TZ local
+    start_dt = tz.localize(datetime(date.year, date.month, date.day, 0, 0, 0))
+    end_dt = start_dt + timedelta(days=1)
+
+    body = {
+        "timeMin": start_dt.isoformat(),
+        "timeMax": end_dt.isoformat(),
+        "timeZone": TIMEZONE,
+        "items": [{"id": "primary"}],
+    }
+
+    store = _event_store()
+    if store is not None:
+        busy_list = await store.busy_between(start_dt, end_dt)
+    else:
+        resp = await get_async_calendar().freebusy_query(body)
+        busy_list = resp["calendars"]["primary"]["busy"]
+    return free_gaps(busy_list, start_dt, end_dt, min_slot_minutes)
+
+
+async def afind_free_slots_for_range(start_date: date, end_date: date,
+                                     work_start: time, work_end: time,
+                                     exclude_weekdays=(), exclude_dates=(),
+                                     min_slot_minutes=30):
+    """Huecos libres por día entre start_date y end_date con un solo freebusy.query."""
+    windows = working_windows(start_date, end_date, work_start, work_end,
+                              exclude_weekdays, exclude_dates)
+    if not windows:
+        return {}
+
+    busy_list = await _busy_between(windows[0][1], windows[-1][2])
+    return free_gaps_by_day(busy_list, windows, min_slot_minutes)
+
+
+async def _busy_between(time_min: datetime, time_max: datetime):
+    """Ocupado del calendario principal con un solo freebusy.query."""
+    # Si todo el rango está en memoria no hace falta ir a la API
+    store = _event_store()
+    if store is not None and store.covers(time_min, time_max):
+        return await store.busy_between(time_min, time_max)
+    body = {
+        "timeMin": time_min.isoformat(),
+        "timeMax": time_max.isoformat(),
+        "timeZone": TIMEZONE,
+        "items": [{"id": "primary"}],
+    }
+    resp = await get_async_calendar().freebusy_query(body)
+    return resp["calendars"]["primary"]["busy"]
+
+
+async def afind_slot_suggestions(start_date: date, end_date: date,
+                                 work_start: time, work_end: time,
+                                 duration_minutes: int, step_minutes: Optional[int] = None,
+                                 align_minutes: Optional[int] = None, limit: int = 10,
+                                 after: Optional[datetime] = None,
+                                 exclude_weekdays=(), exclude_dates=()):
+    """
+    Los primeros `limit` slots reservables a partir de `after` (exclusivo).
+    Regresa (slots, hay_más). Sólo se generan limit + 1 slots, sin importar
+    qué tan largo sea el rango.
+    """
+    windows = working_windows(start_date, end_date, work_start, work_end,
+                              exclude_weekdays, exclude_dates)
+    if after is not None:
+        windows = [w for w in windows if w[2] > after]
+    if not windows:
+        return [], False
+
+    # Al reanudar, freebusy sólo desde el cursor
+    time_min = windows[0][1] if after is None else max(windows[0][1], after)
+    busy_list = await _busy_between(time_min, windows[-1][2])
+    page = list(islice(
+        iter_slot_suggestions(busy_list, windows, duration_minutes, step_minutes, align_minutes, after),
+        limit + 1,
+    ))
+    return page[:limit], len(page) > limit
+
+
+async def afetch_busy_by_calendar(calendar_ids: List[str], time_min: datetime, time_max: datetime):
+    """
+    Intervalos ocupados de varios calendarios; se parte en grupos de
+    FREEBUSY_MAX_ITEMS y los grupos se consultan en paralelo.
+    Regresa ({id: busy}, {id: errores}).
+    """
+    client = get_async_calendar()
+    chunks = [calendar_ids[i:i + FREEBUSY_MAX_ITEMS]
+              for i in range(0, len(calendar_ids), FREEBUSY_MAX_ITEMS)]
+    responses = await asyncio.gather(*(
+        client.freebusy_query({
+            "timeMin": time_min.isoformat(),
+            "timeMax": time_max.isoformat(),
+            "timeZone": TIMEZONE,
+            "items": [{"id": cid} for cid in chunk],
+        })
+        for chunk in chunks
+    ))
+
+    busy, errors = {}, {}
+    for resp in responses:
+        for cid, cal in resp["calendars"].items():
+            if cal.get("errors"):
+                errors[cid] = cal["errors"]
+            else:
+                busy[cid] = cal.get("busy", [])
+    return busy, errors
+
+
+async def afind_group_slots(attendees: List[str], start_date: date, end_date: date,
+                            work_start: time, work_end: time, duration_minutes: int = 30,
+                            step_minutes: int = 15, top_k: int = 10,
+                            exclude_weekdays=(), exclude_dates=()):
+    """Top-k slots comunes a varios asistentes, ordenados por cuántos pueden asistir."""
+    windows = working_windows(start_date, end_date, work_start, work_end,
+                              exclude_weekdays, exclude_dates)
+    if not windows:
+        return [], {}
+
+    # NumPy se carga con la primera consulta de grupo, no al importar
+    from app.availability import group_slots
+
+    busy, errors = await afetch_busy_by_calendar(attendees, windows[0][1], windows[-1][2])
+    # Los calendarios con error (p.ej. sin permiso) no cuentan en el ranking
+    slots = await asyncio.to_thread(
+        group_slots, busy, windows, duration_minutes, step_minutes, top_k,
+    )
+    return slots, errors
+
+
+async def abatch_calendar_operations(calls: List[BatchCall]) -> List[Tuple[int, Any]]:
+    """
+    Ejecuta las llamadas en peticiones batch de BATCH_MAX_OPERATIONS.
+    Un batch que falla completo marca todas sus llamadas con ese error.
+    """
+    client = get_async_calendar()
+    chunks = [calls[i:i + BATCH_MAX_OPERATIONS] for i in range(0, len(calls), BATCH_MAX_OPERATIONS)]
+    responses = await asyncio.gather(*(client.batch(chunk) for chunk in chunks), return_exceptions=True)
+
+    results: List[Tuple[int, Any]] = []
+    for chunk, resp in zip(chunks, responses):
+        if isinstance(resp, CalendarAPIError):
+            results.extend([(resp.status_code, resp.payload)] * len(chunk))
+        elif isinstance(resp, CalendarRateLimited):
+            results.extend([(429, str(resp))] * len(chunk))
+        elif isinstance(resp, CalendarAuthorizationRequired):
+            results.extend([(401, str(resp))] * len(chunk))
+        elif isinstance(resp, Exception):
+            results.extend([(502, str(resp))] * len(chunk))
+        else:
+            results.extend(resp)
+
+    # Refleja en la cache de eventos lo que sí se aplicó
+    store = _event_store()
+    if store is not None:
+        for call, (status, payload) in zip(calls, results):
+            if status >= 300:
+                continue
+            if call.method == "DELETE":
+                store.remove_local(call.path.rsplit("/", 1)[1])
+            elif isinstance(payload, dict):
+                store.apply_local(payload)
+    _invalidate_reads()
+    return results
@@ -0,0 +1,286 @@
+# ============================================================
+# Planificador de cuota para la API de Google Calendar
+# ============================================================
+#
+# Todas las llamadas a Calendar (app/calendar.py y app/calendar_async.py)
+# pasan por aquí antes de salir:
+#   - token bucket por proyecto y por usuario, para no rebasar la cuota y
+#     provocar ráfagas de 403/429;
+#   - prioridad: las llamadas interactivas (lecturas y escrituras sueltas de
+#     un usuario) pasan antes que el trabajo en lote (batch), que además deja
+#     libre una reserva de tokens; quien llama puede fijar la prioridad;
+#   - reintentos con backoff exponencial (con jitter y Retry-After) para
+#     403 rateLimitExceeded / userRateLimitExceeded, 429 y 5xx. Un 5xx sólo se
+#     reintenta si la llamada es idempotente: un insert sin id pudo crearse
+#     aunque la respuesta se perdiera, y repetirlo duplicaría la reunión.
+# Si la espera en cola o los reintentos se agotan se lanza CalendarRateLimited
+# (la app responde 429 con Retry-After) en lugar de regresar None.
+#
+# Profundidad de la cola, espera y reintentos se ven en GET /metrics.
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.metrics import counter, gauge, histogram, track
+
+CALENDAR_PROJECT_QPS = float(os.getenv("CALENDAR_PROJECT_QPS", "150"))
+CALENDAR_PROJECT_BURST = float(os.getenv("CALENDAR_PROJECT_BURST", "300"))
+CALENDAR_USER_QPS = float(os.getenv("CALENDAR_USER_QPS", "10"))
+CALENDAR_USER_BURST = float(os.getenv("CALENDAR_USER_BURST", "20"))
+# Fracción de cada bucket que las escrituras en lote no pueden consumir
+CALENDAR_INTERACTIVE_RESERVE = float(os.getenv("CALENDAR_INTERACTIVE_RESERVE", "0.2"))
+CALENDAR_MAX_QUEUE_WAIT = float(os.getenv("CALENDAR_MAX_QUEUE_WAIT", "10"))
+CALENDAR_MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "5"))
+CALENDAR_BACKOFF_BASE = float(os.getenv("CALENDAR_BACKOFF_BASE", "0.5"))
+CALENDAR_BACKOFF_CAP = float(os.getenv("CALENDAR_BACKOFF_CAP", "32"))
+CALENDAR_QUOTA_USER = os.getenv("CALENDAR_QUOTA_USER", "default")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+_BULK_OPS = {"batch"}
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+QUEUE_DEPTH = gauge("calendar_quota_queue_depth", "Llamadas a Calendar esperando cuota", ("priority",))
+QUEUE_WAIT = histogram("calendar_quota_wait_seconds", "Espera por cuota antes de llamar a Calendar", ("priority",))
+RETRIES = counter("calendar_quota_retries_total", "Reintentos de llamadas a Calendar", ("operation", "reason"))
+REJECTED = counter("calendar_quota_rejected_total", "Llamadas a Calendar rechazadas por cuota", ("priority",))
+
+
+class CalendarRateLimited(Exception):
+    """Sin cuota de Calendar disponible tras esperar / reintentar."""
+
+    def __init__(self, retry_after: float, detail: str = "Cuota de Google Calendar agotada"):
+        self.retry_after = retry_after
+        super().__init__(detail)
+
+
+def priority_for(op: str) -> str:
+    """Prioridad por defecto: BULK sólo para el trabajo en lote."""
+    return BULK if op in _BULK_OPS else INTERACTIVE
+
+
+def retry_reason(status: int, payload: Any) -> Optional[str]:
+    """Motivo de reintento para una respuesta de error, o None si no se reintenta."""
+    if status == 429:
+        return "429"
+    if status >= 500:
+        return "5xx"
+    if status == 403:
+        if isinstance(payload, (bytes, str)):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                return None
+        error = payload.get("error") if isinstance(payload, dict) else None
+        for item in (error.get("errors") or []) if isinstance(error, dict) else []:
+            if isinstance(item, dict) and item.get("reason") in _RATE_LIMIT_REASONS:
+                return item["reason"]
+    return None
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+
+class CalendarScheduler:
+    def __init__(self, project_qps: float = CALENDAR_PROJECT_QPS, project_burst: float = CALENDAR_PROJECT_BURST,
+                 user_qps: float = CALENDAR_USER_QPS, user_burst: float = CALENDAR_USER_BURST,
+                 reserve: float = CALENDAR_INTERACTIVE_RESERVE, max_wait: float = CALENDAR_MAX_QUEUE_WAIT,
+                 max_retries: int = CALENDAR_MAX_RETRIES, backoff_base: float = CALENDAR_BACKOFF_BASE,
+                 backoff_cap: float = CALENDAR_BACKOFF_CAP):
+        self._lock = threading.Lock()
+        self._project = _TokenBucket(project_qps, project_burst)
+        self._user_qps = user_qps
+        self._user_burst = user_burst
+        self._users: Dict[str, _TokenBucket] = {}
+        self._reserve = reserve
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    # --------------------------------------------------------
+    # Tokens
+    # --------------------------------------------------------
+    def _try_acquire(self, priority: str, user: str, cost: float = 1.0) -> float:
+        """Toma `cost` tokens de ambos buckets (0.0) o regresa cuánto esperar."""
+        with self._lock:
+            bucket = self._users.get(user)
+            if bucket is None:
+                bucket = self._users[user] = _TokenBucket(self._user_qps, self._user_burst)
+            now = time.monotonic()
+            buckets = (self._project, bucket)
+            for b in buckets:
+                b.refill(now)
+            # Un batch grande no puede esperar más tokens de los que caben en el
+            # bucket: espera a tenerlo lleno, pero paga su costo completo y el
+            # bucket queda en negativo (la deuda la esperan los siguientes)
+            if priority == BULK:
+                # Lo interactivo que ya espera va primero
+                if self._waiting[INTERACTIVE]:
+                    return max(b.time_until(min(cost, b.burst)) for b in buckets) or 1.0 / bucket.rate
+                need = max(b.time_until(min(cost + b.burst * self._reserve, b.burst)) for b in buckets)
+            else:
+                need = max(b.time_until(min(cost, b.burst)) for b in buckets)
+            if need > 0:
+                return need
+            for b in buckets:
+                b.tokens -= cost
+            return 0.0
+
+    def _enter(self, priority: str):
+        with self._lock:
+            self._waiting[priority] += 1
+        QUEUE_DEPTH.inc(priority)
+
+    def _leave(self, priority: str, waited: float):
+        with self._lock:
+            self._waiting[priority] -= 1
+        QUEUE_DEPTH.dec(priority)
+        QUEUE_WAIT.observe(waited, priority)
+
+    def _reject(self, priority: str, delay: float):
+        REJECTED.inc(priority)
+        raise CalendarRateLimited(retry_after=delay)
+
+    def acquire(self, priority: str = INTERACTIVE, user: str = CALENDAR_QUOTA_USER, cost: float = 1.0):
+        delay = self._try_acquire(priority, user, cost)
+        if not delay:
+            QUEUE_WAIT.observe(0.0, priority)
+            return
+        t0 = time.monotonic()
+        self._enter(priority)
+        try:
+            while delay:
+                waited = time.monotonic() - t0
+                if waited + delay > self.max_wait:
+                    self._reject(priority, delay)
+                time.sleep(delay)
+                delay = self._try_acquire(priority, user, cost)
+        finally:
+            self._leave(priority, time.monotonic() - t0)
+
+    async def aacquire(self, priority: str = INTERACTIVE, user: str = CALENDAR_QUOTA_USER,
+                       cost: float = 1.0):
+        delay = self._try_acquire(priority, user, cost)
+        if not delay:
+            QUEUE_WAIT.observe(0.0, priority)
+            return
+        t0 = time.monotonic()
+        self._enter(priority)
+        try:
+            while delay:
+                waited = time.monotonic() - t0
+                if waited + delay > self.max_wait:
+                    self._reject(priority, delay)
+                await asyncio.sleep(delay)
+                delay = self._try_acquire(priority, user, cost)
+        finally:
+            self._leave(priority, time.monotonic() - t0)
+
+    # --------------------------------------------------------
+    # Reintentos
+    # --------------------------------------------------------
+    def backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_cap)
+            except ValueError:
+                pass
+        # Full jitter: reparte los reintentos de muchos clientes
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, op: str, attempt: int, info: Optional[Tuple[int, Any, Optional[str]]],
+                      idempotent: bool = True):
+        """(motivo, espera) si el error se reintenta; None si hay que propagarlo."""
+        if info is None:
+            return None
+        status, payload, retry_after = info
+        reason = retry_reason(status, payload)
+        if reason is None:
+            return None
+        if reason == "5xx" and not idempotent:
+            # 429/403 de cuota se rechazan sin aplicar nada; un 5xx no garantiza eso
+            return None
+        if attempt >= self.max_retries:
+            if reason != "5xx":
+                raise CalendarRateLimited(retry_after=self.backoff(attempt, retry_after))
+            return None
+        RETRIES.inc(op, reason)
+        return reason, self.backoff(attempt, retry_after)
+
+    def run(self, fn: Callable[[], Any], op: str, classify: Callable[[Exception], Optional[tuple]],
+            priority: Optional[str] = None, user: str = CALENDAR_QUOTA_USER, cost: float = 1.0,
+            idempotent: bool = True):
+        """Versión síncrona (googleapiclient): fn() hace la llamada."""
+        priority = priority or priority_for(op)
+        attempt = 0
+        while True:
+            self.acquire(priority, user, cost)
+            try:
+                with track("calendar", op):
+                    return fn()
+            except Exception as e:
+                decision = self._should_retry(op, attempt, classify(e), idempotent)
+                if decision is None:
+                    raise
+            print(f"[CALENDAR_QUOTA] {op}: {decision[0]}, reintento {attempt + 1} en {decision[1]:.2f}s")
+            time.sleep(decision[1])
+            attempt += 1
+
+    async def arun(self, fn: Callable[[], Awaitable[Any]], op: str,
+                   classify: Callable[[Exception], Optional[tuple]],
+                   priority: Optional[str] = None, user: str = CALENDAR_QUOTA_USER, cost: float = 1.0,
+                   idempotent: bool = True):
+        """Versión asyncio (httpx): await fn() hace la llamada."""
+        priority = priority or priority_for(op)
+        attempt = 0
+        while True:
+            await self.aacquire(priority, user, cost)
+            try:
+                return await fn()
+            except Exception as e:
+                decision = self._should_retry(op, attempt, classify(e), idempotent)
+                if decision is None:
+                    raise
+            print(f"[CALENDAR_QUOTA] {op}: {decision[0]}, reintento {attempt + 1} en {decision[1]:.2f}s")
+            await asyncio.sleep(decision[1])
+            attempt += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "waiting": dict(self._waiting),
+                "project_tokens": round(self._project.tokens, 2),
+                "users": {u: round(b.tokens, 2) for u, b in self._users.items()},
+            }
+
+
+def _after_fork():
+    # El lock pudo quedar tomado por un hilo del padre
+    calendar_scheduler._lock = threading.Lock()
+
+
+calendar_scheduler = CalendarScheduler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
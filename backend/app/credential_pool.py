@@ -0,0 +1,494 @@
+# ============================================================
+# Credenciales de Google Calendar por usuario
+# ============================================================
+#
+# Cada usuario trae su propio refresh_token. En memoria se mantiene un LRU de
+# usuarios autorizados (credenciales + access token vigente); al expulsar a
+# uno se guarda cifrado en un SQLite local y se vuelve a leer de ahí la
+# próxima vez. Los refresh se hacen en hilos, en paralelo entre usuarios (con
+# un tope) y deduplicados por usuario: mil peticiones simultáneas del mismo
+# usuario esperan un solo refresh.
+#
+# Una petición nunca abre el flujo de consentimiento: si el usuario no tiene
+# credenciales (o su refresh_token fue revocado) se lanza
+# CalendarAuthorizationRequired y la API responde 401. La autorización se
+# hace fuera de línea:
+#
+#   cd backend
+#   python -m app.credential_pool authorize --user ana@example.com
+#   python -m app.credential_pool import --user ana@example.com token.json
+#   python -m app.credential_pool stats
+#   CALENDAR_USER_SECRET=... python -m app.credential_pool sign --user ana@example.com
+#
+# Requiere `cryptography` (Fernet). La clave se toma de CREDENTIAL_STORE_KEY o
+# se genera una vez en CREDENTIAL_STORE_KEY_FILE (permisos 0600).
+#
+# El usuario de la petición (X-Calendar-User) sólo se acepta verificado, y el
+# modo multiusuario está apagado por defecto (CALENDAR_USER_AUTH=off: el
+# header se ignora). Con "hmac" el header viene firmado con un secreto
+# compartido con el proxy de autenticación; con "proxy" sólo se acepta si la
+# conexión viene de una IP de CALENDAR_TRUSTED_PROXIES. Un usuario que no se
+# puede verificar recibe 401 en lugar de usar esas credenciales.
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from starlette.responses import JSONResponse
+
+from app.calendar import REFRESH_MARGIN, SCOPES, CalendarAuthorizationRequired
+from app.metrics import counter, gauge
+from app.singleflight import SingleFlight
+from app.tracing import span
+
+_BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+CREDENTIAL_POOL_MAX_USERS = int(os.getenv("CREDENTIAL_POOL_MAX_USERS", "1000"))
+CREDENTIAL_REFRESH_CONCURRENCY = int(os.getenv("CREDENTIAL_REFRESH_CONCURRENCY", "32"))
+CREDENTIAL_STORE_DB = os.getenv("CREDENTIAL_STORE_DB", str(_BACKEND_DIR / "credentials.sqlite"))
+CREDENTIAL_STORE_KEY_FILE = os.getenv("CREDENTIAL_STORE_KEY_FILE", str(_BACKEND_DIR / "credential_store.key"))
+# Header con el usuario de Calendar; debe ponerlo el proxy de autenticación
+CALENDAR_USER_HEADER = os.getenv("CALENDAR_USER_HEADER", "X-Calendar-User")
+# off (por defecto: header ignorado) | hmac (header firmado) | proxy (IP de confianza)
+CALENDAR_USER_AUTH = os.getenv("CALENDAR_USER_AUTH", "off").strip().lower()
+CALENDAR_USER_SIGNATURE_HEADER = os.getenv("CALENDAR_USER_SIGNATURE_HEADER", "X-Calendar-User-Signature")
+CALENDAR_USER_SECRET = os.getenv("CALENDAR_USER_SECRET", "")
+# Antigüedad máxima de una firma (segundos), contra repeticiones
+CALENDAR_USER_MAX_AGE = float(os.getenv("CALENDAR_USER_MAX_AGE", "300"))
+CALENDAR_TRUSTED_PROXIES = os.getenv("CALENDAR_TRUSTED_PROXIES", "")
+# 1: con el modo activo, una petición sin usuario también es 401 (no usa token.json)
+CALENDAR_USER_REQUIRED = os.getenv("CALENDAR_USER_REQUIRED", "0") == "1"
+
+RESIDENT = gauge("credential_pool_users", "Usuarios con credenciales en memoria")
+LOOKUPS = counter("credential_pool_lookups_total", "Búsquedas de credenciales por usuario", ("outcome",))
+REFRESHES = counter("credential_refresh_total", "Refresh de access tokens", ("outcome",))
+EVICTIONS = counter("credential_pool_evictions_total", "Usuarios expulsados del LRU")
+USER_REJECTED = counter("calendar_user_rejected_total", "Peticiones con usuario de Calendar no verificado",
+                        ("reason",))
+
+# Usuario de Calendar de la petición en curso (None = token.json de siempre)
+current_calendar_user: ContextVar[Optional[str]] = ContextVar("current_calendar_user", default=None)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    user_id TEXT PRIMARY KEY,
+    blob BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def _parse_expiry(value: Optional[str]) -> Optional[float]:
+    # google-auth serializa expiry como ISO 8601 UTC ("...Z" o sin zona)
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class CredentialsRevoked(Exception):
+    """El refresh_token ya no sirve (invalid_grant): hay que autorizar de nuevo."""
+
+
+def google_refresh(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Refresca con google-auth (bloqueante) y regresa la info autorizada actualizada."""
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+
+    creds = Credentials.from_authorized_user_info(info, info.get("scopes") or SCOPES)
+    try:
+        creds.refresh(Request())
+    except RefreshError as error:
+        raise CredentialsRevoked(str(error))
+    return json.loads(creds.to_json())
+
+
+# ------------------------------------------------------------
+# Almacén cifrado en SQLite
+# ------------------------------------------------------------
+class CredentialStore:
+    def __init__(self, db_path: str = CREDENTIAL_STORE_DB, key: Optional[str] = None,
+                 key_file: str = CREDENTIAL_STORE_KEY_FILE):
+        self._path = db_path
+        self._key = key or os.getenv("CREDENTIAL_STORE_KEY")
+        self._key_file = key_file
+        self._fernet = None
+        self._conn: Optional[sqlite3.Connection] = None
+        # Serializa el uso de la conexión SQLite entre hilos
+        self._lock = threading.Lock()
+        self.stats = {"reads": 0, "writes": 0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _cipher(self):
+        if self._fernet is None:
+            from cryptography.fernet import Fernet
+
+            key = self._key
+            if not key:
+                path = Path(self._key_file)
+                if not path.exists():
+                    # Primera vez: clave local legible sólo por este usuario del sistema
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(Fernet.generate_key())
+                    print(f"[CREDENTIALS] Clave de cifrado nueva en {path}")
+                key = path.read_bytes().strip()
+            self._fernet = Fernet(key)
+        return self._fernet
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT blob FROM credentials WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        self.stats["reads"] += 1
+        if row is None:
+            return None
+        return json.loads(self._cipher().decrypt(row[0]))
+
+    def put(self, user_id: str, info: Dict[str, Any]):
+        blob = self._cipher().encrypt(json.dumps(info).encode())
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO credentials (user_id, blob, updated) VALUES (?, ?, ?)"
+                " ON CONFLICT(user_id) DO UPDATE SET blob = excluded.blob, updated = excluded.updated",
+                (user_id, blob, time.time()),
+            )
+        self.stats["writes"] += 1
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM credentials").fetchone()[0]
+
+
+# ------------------------------------------------------------
+# LRU de usuarios autorizados
+# ------------------------------------------------------------
+class _Entry:
+    __slots__ = ("info", "expiry", "dirty")
+
+    def __init__(self, info: Dict[str, Any]):
+        self.info = info
+        self.expiry = _parse_expiry(info.get("expiry"))
+        # Cambió desde que se leyó del almacén (p.ej. access token nuevo)
+        self.dirty = False
+
+
+class CredentialPool:
+    def __init__(self, store: CredentialStore, refresher: Callable[[Dict[str, Any]], Dict[str, Any]] = google_refresh,
+                 max_users: int = CREDENTIAL_POOL_MAX_USERS,
+                 refresh_concurrency: int = CREDENTIAL_REFRESH_CONCURRENCY,
+                 refresh_margin: float = REFRESH_MARGIN.total_seconds()):
+        self._store = store
+        # (info autorizada) -> info con token nuevo; bloqueante, corre en un hilo.
+        # Se puede reemplazar (p.ej. bench/bench_credentials.py)
+        self.refresher = refresher
+        self._max_users = max_users
+        self._refresh_concurrency = refresh_concurrency
+        self._refresh_margin = refresh_margin
+        # Sólo se tocan desde el event loop
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Expulsados con token nuevo que aún no terminan de guardarse en SQLite
+        self._unsaved: Dict[str, Dict[str, Any]] = {}
+        # Hilos propios para los refresh (HTTP a Google): no ocupan el executor
+        # por defecto, que es pequeño y comparten las lecturas de SQLite
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Sin ventana: sólo se comparten las llamadas simultáneas del mismo usuario
+        self._loads = SingleFlight("credential_load", window=0)
+        self._refreshes = SingleFlight("credential_refresh", window=0)
+        self.stats = {"hits": 0, "loads": 0, "refreshes": 0, "refresh_errors": 0,
+                      "revoked": 0, "evictions": 0, "persisted": 0}
+
+    def _fresh(self, entry: _Entry) -> bool:
+        if not entry.info.get("token"):
+            return False
+        return entry.expiry is None or time.time() < entry.expiry - self._refresh_margin
+
+    async def access_token(self, user_id: str) -> str:
+        """Access token vigente del usuario; lo carga y refresca si hace falta."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+            LOOKUPS.inc("hit")
+        else:
+            entry = await self._loads.do(user_id, lambda: self._load(user_id))
+        if self._fresh(entry):
+            return entry.info["token"]
+        return await self._refreshes.do(user_id, lambda: self._refresh(user_id, entry))
+
+    async def _load(self, user_id: str) -> _Entry:
+        info = self._unsaved.get(user_id)
+        if info is None:
+            info = await asyncio.to_thread(self._store.get, user_id)
+        if info is None:
+            LOOKUPS.inc("unknown")
+            raise CalendarAuthorizationRequired(user_id)
+        self.stats["loads"] += 1
+        LOOKUPS.inc("load")
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = _Entry(info)
+            # Si venía de _unsaved, el guardado sigue pendiente
+            entry.dirty = user_id in self._unsaved
+        await self._evict()
+        RESIDENT.set(len(self._entries))
+        return entry
+
+    async def _evict(self):
+        evicted = []
+        while len(self._entries) > self._max_users:
+            user_id, entry = self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+            EVICTIONS.inc()
+            if entry.dirty:
+                evicted.append((user_id, entry.info))
+        if evicted:
+            # Se guarda cifrado: al volver no hace falta otro refresh
+            await self._persist_async(evicted)
+
+    async def _persist_async(self, items):
+        # Mientras se escribe, _load lee de _unsaved y no el token viejo de SQLite
+        for user_id, info in items:
+            self._unsaved[user_id] = info
+        try:
+            await asyncio.to_thread(self._persist, items)
+        finally:
+            for user_id, info in items:
+                if self._unsaved.get(user_id) is info:
+                    del self._unsaved[user_id]
+
+    def _persist(self, items):
+        for user_id, info in items:
+            self._store.put(user_id, info)
+        self.stats["persisted"] += len(items)
+
+    async def _refresh(self, user_id: str, entry: _Entry) -> str:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self._refresh_concurrency, thread_name_prefix="credential-refresh")
+        try:
+            with span("calendar.credentials.refresh", user=user_id):
+                info = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.refresher, dict(entry.info),
+                )
+        except CredentialsRevoked:
+            self.stats["revoked"] += 1
+            REFRESHES.inc("revoked")
+            self._entries.pop(user_id, None)
+            RESIDENT.set(len(self._entries))
+            # Sin borrar, cada petición volvería a intentar el refresh con Google
+            await asyncio.to_thread(self._store.delete, user_id)
+            raise CalendarAuthorizationRequired(user_id)
+        except Exception:
+            self.stats["refresh_errors"] += 1
+            REFRESHES.inc("error")
+            raise
+        entry.info = info
+        entry.expiry = _parse_expiry(info.get("expiry"))
+        entry.dirty = True
+        self.stats["refreshes"] += 1
+        REFRESHES.inc("ok")
+        if self._entries.get(user_id) is not entry:
+            # Se expulsó del LRU durante el refresh: guardarlo ya, o el próximo
+            # _load leería el token vencido y volvería a refrescar
+            entry.dirty = False
+            await self._persist_async([(user_id, info)])
+        return info["token"]
+
+    def save(self, user_id: str, info: Dict[str, Any]):
+        """Guarda credenciales recién autorizadas (CLI); reemplaza las que estén en memoria."""
+        self._store.put(user_id, info)
+        self._entries.pop(user_id, None)
+        self._unsaved.pop(user_id, None)
+
+    def _after_fork(self):
+        # Los hilos del executor no existen en el hijo
+        self._executor = None
+
+    def close(self):
+        """Guarda lo que cambió en memoria (access tokens vigentes) antes de apagar."""
+        dirty = [(user_id, e.info) for user_id, e in self._entries.items() if e.dirty]
+        if dirty:
+            self._persist(dirty)
+            for user_id, _ in dirty:
+                self._entries[user_id].dirty = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "resident": len(self._entries), "max_users": self._max_users,
+                "stored": self._store.count()}
+
+
+credential_pool = CredentialPool(CredentialStore())
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=credential_pool._after_fork)
+
+
+# ------------------------------------------------------------
+# Usuario de la petición
+# ------------------------------------------------------------
+def sign_calendar_user(user_id: str, secret: str = CALENDAR_USER_SECRET,
+                       now: Optional[float] = None) -> str:
+    """Valor de X-Calendar-User-Signature ("t=<unix>,v1=<hex>") que arma el proxy."""
+    ts = str(int(time.time() if now is None else now))
+    digest = hmac.new(secret.encode(), f"{ts}.{user_id}".encode(), hashlib.sha256).hexdigest()
+    return f"t={ts},v1={digest}"
+
+
+def verify_calendar_user(user_id: str, signature: Optional[str], secret: str = CALENDAR_USER_SECRET,
+                         max_age: float = CALENDAR_USER_MAX_AGE, now: Optional[float] = None) -> Optional[str]:
+    """None si la firma es válida; si no, el motivo."""
+    if not signature:
+        return "missing_signature"
+    fields = dict(part.split("=", 1) for part in signature.split(",") if "=" in part)
+    ts, digest = fields.get("t", ""), fields.get("v1", "")
+    if not ts.isdigit():
+        return "bad_signature"
+    if abs((time.time() if now is None else now) - int(ts)) > max_age:
+        return "expired_signature"
+    expected = sign_calendar_user(user_id, secret, int(ts)).split("v1=", 1)[1]
+    if not hmac.compare_digest(digest, expected):
+        return "bad_signature"
+    return None
+
+
+def _trusted_networks(spec: str):
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in spec.split(",") if item.strip()]
+
+
+class CalendarUserMiddleware:
+    """
+    Middleware ASGI puro: fija el usuario de Calendar de la petición sólo si
+    se puede verificar (firma HMAC o proxy de confianza); si no, 401.
+    """
+
+    def __init__(self, app, mode: str = CALENDAR_USER_AUTH, header: str = CALENDAR_USER_HEADER,
+                 signature_header: str = CALENDAR_USER_SIGNATURE_HEADER, secret: str = CALENDAR_USER_SECRET,
+                 trusted_proxies: str = CALENDAR_TRUSTED_PROXIES, required: bool = CALENDAR_USER_REQUIRED):
+        if mode not in ("off", "hmac", "proxy"):
+            raise ValueError(f"CALENDAR_USER_AUTH inválido: {mode!r} (off, hmac o proxy)")
+        if mode == "hmac" and not secret:
+            raise RuntimeError("CALENDAR_USER_AUTH=hmac requiere CALENDAR_USER_SECRET")
+        self.app = app
+        self._mode = mode
+        self._header = header.lower().encode()
+        self._signature_header = signature_header.lower().encode()
+        self._secret = secret
+        self._networks = _trusted_networks(trusted_proxies) if mode == "proxy" else []
+        if mode == "proxy" and not self._networks:
+            raise RuntimeError("CALENDAR_USER_AUTH=proxy requiere CALENDAR_TRUSTED_PROXIES")
+        self._required = required
+
+    def _from_trusted_proxy(self, scope) -> bool:
+        client = scope.get("client")
+        if not client:
+            return False
+        try:
+            address = ipaddress.ip_address(client[0])
+        except ValueError:
+            return False
+        return any(address in network for network in self._networks)
+
+    def _reject_reason(self, scope, user: Optional[str], signature: Optional[str]) -> Optional[str]:
+        if user is None:
+            return "missing_user" if self._required else None
+        if self._mode == "hmac":
+            return verify_calendar_user(user, signature, self._secret)
+        return None if self._from_trusted_proxy(scope) else "untrusted_proxy"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._mode == "off":
+            await self.app(scope, receive, send)
+            return
+        user = signature = None
+        for name, value in scope["headers"]:
+            if name == self._header:
+                user = value.decode("latin-1").strip() or None
+            elif name == self._signature_header:
+                signature = value.decode("latin-1").strip()
+        reason = self._reject_reason(scope, user, signature)
+        if reason is not None:
+            USER_REJECTED.inc(reason)
+            response = JSONResponse(status_code=401, content={
+                "detail": f"Usuario de Calendar no verificado ({reason})", "user": user,
+            })
+            await response(scope, receive, send)
+            return
+        token = current_calendar_user.set(user)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_calendar_user.reset(token)
+
+
+# ------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Credenciales de Google Calendar por usuario")
+    sub = parser.add_subparsers(dest="command", required=True)
+    authorize = sub.add_parser("authorize", help="consentimiento en el navegador y guardar")
+    authorize.add_argument("--user", required=True)
+    imported = sub.add_parser("import", help="importar un token.json existente")
+    imported.add_argument("--user", required=True)
+    imported.add_argument("token_file")
+    sub.add_parser("stats", help="usuarios guardados")
+    signed = sub.add_parser("sign", help=f"valor de {CALENDAR_USER_SIGNATURE_HEADER} (CALENDAR_USER_SECRET)")
+    signed.add_argument("--user", required=True)
+    args = parser.parse_args()
+
+    if args.command == "sign":
+        if not CALENDAR_USER_SECRET:
+            parser.error("falta CALENDAR_USER_SECRET")
+        print(f"{CALENDAR_USER_HEADER}: {args.user}")
+        print(f"{CALENDAR_USER_SIGNATURE_HEADER}: {sign_calendar_user(args.user)}")
+        return
+
+    store = CredentialStore()
+    if args.command == "authorize":
+        from app.calendar import run_authorization_flow
+
+        store.put(args.user, json.loads(run_authorization_flow().to_json()))
+        print(f"[CREDENTIALS] {args.user} autorizado")
+    elif args.command == "import":
+        with open(args.token_file) as f:
+            store.put(args.user, json.load(f))
+        print(f"[CREDENTIALS] {args.user} importado de {args.token_file}")
+    else:
+        print(json.dumps({"stored": store.count(), "path": CREDENTIAL_STORE_DB}))
+
+
+if __name__ == "__main__":
+    main()
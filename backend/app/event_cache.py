@@ -0,0 +1,334 @@
+# ============================================================
+# Cache local de eventos — sincronización incremental con syncToken
+# ============================================================
+#
+# Un CalendarEventStore por calendario mantiene en memoria los eventos por
+# día local. Se hace una sincronización completa una vez y a partir de ahí
+# sólo se piden los cambios con el nextSyncToken de Calendar. Los días se
+# expulsan por LRU (máximo de días residentes) y por TTL; un día que no está
+# en memoria se pide a la API con timeMin/timeMax y queda residente.
+#
+# Si Calendar responde 410 (token inválido) se descarta todo y se repite la
+# sincronización completa.
+
+import asyncio
+import os
+import time as _time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from app.calendar import TIMEZONE
+
+EVENT_CACHE_ENABLED = os.getenv("EVENT_CACHE_ENABLED", "1") == "1"
+EVENT_CACHE_MAX_DAYS = int(os.getenv("EVENT_CACHE_MAX_DAYS", "120"))
+EVENT_CACHE_DAY_TTL = float(os.getenv("EVENT_CACHE_DAY_TTL", "3600"))
+EVENT_CACHE_SYNC_INTERVAL = float(os.getenv("EVENT_CACHE_SYNC_INTERVAL", "30"))
+EVENT_CACHE_SYNC_PAST_DAYS = int(os.getenv("EVENT_CACHE_SYNC_PAST_DAYS", "30"))
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class _Day:
+    __slots__ = ("events", "loaded_at")
+
+    def __init__(self, loaded_at: float):
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.loaded_at = loaded_at
+
+
+class CalendarEventStore:
+    """Eventos de un calendario indexados por día, al día vía syncToken."""
+
+    def __init__(self, client_getter, calendar_id: str = "primary", timezone: str = TIMEZONE,
+                 max_days: int = EVENT_CACHE_MAX_DAYS, day_ttl: float = EVENT_CACHE_DAY_TTL,
+                 sync_interval: float = EVENT_CACHE_SYNC_INTERVAL,
+                 sync_past_days: int = EVENT_CACHE_SYNC_PAST_DAYS):
+        self._client_getter = client_getter
+        self.calendar_id = calendar_id
+        self._tz = ZoneInfo(timezone)
+        self._max_days = max_days
+        self._day_ttl = day_ttl
+        self._sync_interval = sync_interval
+        self._sync_past_days = sync_past_days
+
+        self._days: "OrderedDict[date, _Day]" = OrderedDict()
+        self._event_days: Dict[str, Set[date]] = {}
+        self._sync_token: Optional[str] = None
+        self._last_sync = 0.0
+        self._sync_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "full_syncs": 0, "incremental_syncs": 0}
+
+    # --------------------------------------------------------
+    # Índice por día
+    # --------------------------------------------------------
+    def _event_dates(self, event: Dict[str, Any]) -> List[date]:
+        start, end = event.get("start", {}), event.get("end", {})
+        if "date" in start:
+            first = date.fromisoformat(start["date"])
+            # En eventos de todo el día, end.date es exclusivo
+            last = date.fromisoformat(end.get("date", start["date"])) - timedelta(days=1)
+        else:
+            start_dt = _parse_rfc3339(start["dateTime"]).astimezone(self._tz)
+            end_dt = _parse_rfc3339(end["dateTime"]).astimezone(self._tz)
+            first = start_dt.date()
+            last = (end_dt - timedelta(microseconds=1)).date() if end_dt > start_dt else first
+        days = []
+        day = first
+        while day <= max(first, last):
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def _remove(self, event_id: str):
+        for day in self._event_days.pop(event_id, ()):
+            entry = self._days.get(day)
+            if entry is not None:
+                entry.events.pop(event_id, None)
+
+    def _upsert(self, event: Dict[str, Any]):
+        """Aplica un evento a los días residentes que toca."""
+        event_id = event["id"]
+        self._remove(event_id)
+        if event.get("status") == "cancelled" or "start" not in event:
+            return
+        placed = set()
+        for day in self._event_dates(event):
+            entry = self._days.get(day)
+            if entry is not None:
+                entry.events[event_id] = event
+                placed.add(day)
+        if placed:
+            self._event_days[event_id] = placed
+
+    def _evict_day(self, day: date):
+        entry = self._days.pop(day, None)
+        if entry is None:
+            return
+        for event_id in entry.events:
+            days = self._event_days.get(event_id)
+            if days is not None:
+                days.discard(day)
+                if not days:
+                    del self._event_days[event_id]
+
+    def _put_day(self, day: date, events: List[Dict[str, Any]]):
+        self._evict_day(day)
+        self._days[day] = _Day(_time.monotonic())
+        for event in events:
+            self._upsert(event)
+        while len(self._days) > self._max_days:
+            self._evict_day(next(iter(self._days)))
+
+    def _resident(self, day: date) -> Optional[_Day]:
+        entry = self._days.get(day)
+        if entry is None:
+            return None
+        if _time.monotonic() - entry.loaded_at > self._day_ttl:
+            self._evict_day(day)
+            return None
+        self._days.move_to_end(day)
+        return entry
+
+    # --------------------------------------------------------
+    # Sincronización con la API
+    # --------------------------------------------------------
+    async def _list_all(self, **params):
+        client = self._client_getter()
+        items, page_token = [], None
+        while True:
+            if page_token:
+                params["pageToken"] = page_token
+            result = await client.events_list(self.calendar_id, **params)
+            items.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return items, result.get("nextSyncToken")
+
+    # Calendar exige que las peticiones con syncToken repitan los parámetros de
+    # la sincronización inicial (salvo timeMin/timeMax, que no acepta junto con
+    # el token); si no, el resultado no está definido y las recurrentes pueden
+    # llegar como la serie en vez de instancias
+    _SYNC_PARAMS = {"singleEvents": True, "showDeleted": True, "maxResults": 2500}
+
+    async def _full_sync(self):
+        today = datetime.now(self._tz).date()
+        first_day = today - timedelta(days=self._sync_past_days)
+        time_min = datetime.combine(first_day, datetime.min.time(), tzinfo=self._tz)
+        # Acotada a la ventana residente: con singleEvents, una recurrente sin
+        # fin tendría instancias sin límite
+        time_max = datetime.combine(first_day + timedelta(days=self._max_days), datetime.min.time(),
+                                    tzinfo=self._tz)
+        items, token = await self._list_all(timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+                                            **self._SYNC_PARAMS)
+        self._days.clear()
+        self._event_days.clear()
+
+        # La ventana [first_day, first_day + max_days) queda residente completa,
+        # incluidos los días sin eventos; lo que cae fuera se pide por día al
+        # fallar. Los cambios incrementales de eventos fuera de la ventana sólo
+        # se aplican a los días que estén en memoria.
+        now = _time.monotonic()
+        for offset in range(self._max_days):
+            self._days[first_day + timedelta(days=offset)] = _Day(now)
+        for event in items:
+            self._upsert(event)
+
+        self._sync_token = token
+        self._last_sync = _time.monotonic()
+        self.stats["full_syncs"] += 1
+
+    async def _incremental_sync(self):
+        from app.calendar_async import CalendarAPIError
+
+        try:
+            items, token = await self._list_all(syncToken=self._sync_token, **self._SYNC_PARAMS)
+        except CalendarAPIError as error:
+            if error.status_code != 410:
+                raise
+            # El token ya no es válido: sincronización completa
+            await self._full_sync()
+            return
+        for event in items:
+            self._upsert(event)
+        self._sync_token = token or self._sync_token
+        self._last_sync = _time.monotonic()
+        self.stats["incremental_syncs"] += 1
+
+    async def sync(self):
+        async with self._sync_lock:
+            if self._sync_token is None:
+                await self._full_sync()
+            else:
+                await self._incremental_sync()
+
+    async def _background_sync(self):
+        try:
+            await self.sync()
+        except Exception as error:
+            print(f"[EVENT_CACHE] Error sincronizando {self.calendar_id}: {error}")
+
+    async def _ensure_fresh(self):
+        """La primera vez espera la sincronización; después la lanza en segundo plano."""
+        if self._sync_token is None:
+            await self.sync()
+            return
+        if _time.monotonic() - self._last_sync < self._sync_interval:
+            return
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._background_sync())
+
+    async def _load_day(self, day: date):
+        start_dt = datetime.combine(day, datetime.min.time(), tzinfo=self._tz)
+        items, _ = await self._list_all(
+            timeMin=start_dt.isoformat(),
+            timeMax=(start_dt + timedelta(days=1)).isoformat(),
+            singleEvents=True,
+            orderBy="startTime",
+        )
+        self._put_day(day, items)
+
+    # --------------------------------------------------------
+    # Lecturas
+    # --------------------------------------------------------
+    async def events_for_date(self, day: date) -> List[Dict[str, Any]]:
+        await self._ensure_fresh()
+        entry = self._resident(day)
+        if entry is None:
+            self.stats["misses"] += 1
+            await self._load_day(day)
+            entry = self._days[day]
+        else:
+            self.stats["hits"] += 1
+        return sorted(entry.events.values(), key=self._sort_key)
+
+    def covers(self, time_min: datetime, time_max: datetime) -> bool:
+        """True si todos los días entre time_min y time_max están en memoria."""
+        if self._sync_token is None:
+            return False
+        day = time_min.astimezone(self._tz).date()
+        last = (time_max - timedelta(microseconds=1)).astimezone(self._tz).date()
+        while day <= last:
+            if self._resident(day) is None:
+                return False
+            day += timedelta(days=1)
+        return True
+
+    async def busy_between(self, time_min: datetime, time_max: datetime) -> List[Dict[str, str]]:
+        """Intervalos ocupados (como freebusy) entre time_min y time_max."""
+        first = time_min.astimezone(self._tz).date()
+        last = (time_max - timedelta(microseconds=1)).astimezone(self._tz).date()
+        seen, intervals = set(), []
+        day = first
+        while day <= last:
+            for event in await self.events_for_date(day):
+                if event["id"] in seen or event.get("transparency") == "transparent":
+                    continue
+                seen.add(event["id"])
+                start, end = self._bounds(event)
+                start, end = max(start, time_min), min(end, time_max)
+                if end > start:
+                    intervals.append((start, end))
+            day += timedelta(days=1)
+
+        intervals.sort()
+        merged: List[List[datetime]] = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [{"start": s.isoformat(), "end": e.isoformat()} for s, e in merged]
+
+    def _bounds(self, event: Dict[str, Any]):
+        start, end = event["start"], event["end"]
+        if "date" in start:
+            return (
+                datetime.combine(date.fromisoformat(start["date"]), datetime.min.time(), tzinfo=self._tz),
+                datetime.combine(date.fromisoformat(end["date"]), datetime.min.time(), tzinfo=self._tz),
+            )
+        return _parse_rfc3339(start["dateTime"]), _parse_rfc3339(end["dateTime"])
+
+    def _sort_key(self, event: Dict[str, Any]):
+        return self._bounds(event)[0]
+
+    # --------------------------------------------------------
+    # Escrituras locales (write-through desde nuestros endpoints)
+    # --------------------------------------------------------
+    def apply_local(self, event: Optional[Dict[str, Any]]):
+        if event and "id" in event:
+            self._upsert(event)
+
+    def remove_local(self, event_id: str):
+        self._remove(event_id)
+
+    def invalidate(self):
+        self._days.clear()
+        self._event_days.clear()
+        self._sync_token = None
+
+
+# ------------------------------------------------------------
+# Stores compartidos del proceso (uno por calendario)
+# ------------------------------------------------------------
+_stores: Dict[str, CalendarEventStore] = {}
+
+
+def get_event_store(calendar_id: str = "primary") -> Optional[CalendarEventStore]:
+    """Store del calendario, o None si la cache está deshabilitada."""
+    if not EVENT_CACHE_ENABLED:
+        return None
+    store = _stores.get(calendar_id)
+    if store is None:
+        from app.calendar_async import get_async_calendar
+
+        store = _stores[calendar_id] = CalendarEventStore(get_async_calendar, calendar_id)
+    return store
+
+
+def reset_event_stores():
+    _stores.clear()
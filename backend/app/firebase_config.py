@@ -1,24 +1,71 @@
 # app/firebase_config.py
-import firebase_admin
-from firebase_admin import credentials, firestore
-from pathlib import Path
+#
+# El cliente de Firestore se crea en el primer uso (get_db()), no al importar:
+# importar app.main no toca credenciales ni abre canales gRPC. Cada proceso
+# hijo (workers con fork) crea su propio cliente, porque los canales gRPC del
+# padre no sirven después de un fork.
 import os
+import threading
+from pathlib import Path
 
 #  Ruta absoluta al service_account.json (una carpeta arriba de /app)
 SA_PATH = Path(__file__).resolve().parents[1] / "service_account.json"
 
-if not SA_PATH.exists():
-    raise FileNotFoundError(f"No se encontró el archivo: {SA_PATH}")
+_lock = threading.Lock()
+_db = None
+_pid = None
+
+
+def get_db():
+    """Cliente de Firestore del proceso actual (se inicializa una sola vez)."""
+    global _db, _pid
+    if _db is not None and _pid == os.getpid():
+        return _db
+    with _lock:
+        if _db is None or _pid != os.getpid():
+            _db = _create_client()
+            _pid = os.getpid()
+    return _db
+
+
+def _create_client():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not SA_PATH.exists():
+        raise FileNotFoundError(f"No se encontró el archivo: {SA_PATH}")
+
+    print(f"[FIREBASE] Cargando credenciales desde: {SA_PATH}")
+
+    #  Una app por proceso: la del padre no se reutiliza tras un fork
+    name = f"asistente-{os.getpid()}"
+    if name not in firebase_admin._apps:
+        cred = credentials.Certificate(SA_PATH)
+        app = firebase_admin.initialize_app(cred, name=name)
+        print("[FIREBASE] App inicializada correctamente ✅")
+    else:
+        app = firebase_admin.get_app(name)
+        print("[FIREBASE] Reutilizando app existente")
+
+    #  Cliente de Firestore listo
+    return firestore.client(app)
+
+
+def _after_fork():
+    global _lock, _db, _pid
+    # El lock pudo quedar tomado por otro hilo del padre
+    _lock = threading.Lock()
+    _db = None
+    _pid = None
+
 
-print(f"[FIREBASE] Cargando credenciales desde: {SA_PATH}")
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
 
-#  Inicializa Firebase solo una vez
-if not firebase_admin._apps:
-    cred = credentials.Certificate(SA_PATH)
-    firebase_admin.initialize_app(cred)
-    print("[FIREBASE] App inicializada correctamente ✅")
-else:
-    print("[FIREBASE] Reutilizando app existente")
 
-#  Cliente de Firestore listo
-db = firestore.client()
+def __getattr__(name):
+    # Compatibilidad: `from app.firebase_config import db` sigue funcionando,
+    # pero inicializa Firestore en ese momento.
+    if name == "db":
+        return get_db()
+    raise AttributeError(name)
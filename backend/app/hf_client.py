@@ -4,154 +4,422 @@
 
 import os
 import json
-import requests
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 from datetime import datetime
 
+import httpx
+
+from app.intent_cache import intent_cache
+from app.intent_prompts import CLASSIFY_PROMPT, estimate_tokens, extraction_prompt, parse_label
+from app.intent_rules import classify_intent, try_fast_path
+from app.metrics import track
+from app.tracing import span
+
 # ------------------------------------------------------------
 # 1️Cargar .env manualmente (sin depender de dotenv)
 # ------------------------------------------------------------
+# Se hace al primer uso (get_settings), no al importar el módulo.
 ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
-if ENV_PATH.exists():
-    with open(ENV_PATH, "r", encoding="utf-8-sig") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
-            if "=" in line:
-                key, val = line.split("=", 1)
-                os.environ[key.strip()] = val.strip().strip('"').strip("'")
+
+
+def _load_env():
+    if ENV_PATH.exists():
+        with open(ENV_PATH, "r", encoding="utf-8-sig") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "=" in line:
+                    key, val = line.split("=", 1)
+                    os.environ[key.strip()] = val.strip().strip('"').strip("'")
+
 
 # ------------------------------------------------------------
 # Configuración general
 # ------------------------------------------------------------
-HF_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN", "REDACTED")
-HF_MODEL = os.getenv("HF_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
-HF_URL = "https://router.huggingface.co/v1/chat/completions"
+class HFSettings:
+    def __init__(self):
+        self.token = os.getenv("HUGGINGFACE_API_TOKEN", "REDACTED")
+        self.model = os.getenv("HF_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+        self.url = os.getenv("HF_URL", "https://router.huggingface.co/v1/chat/completions")
+        self.connect_timeout = float(os.getenv("HF_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(os.getenv("HF_READ_TIMEOUT", "60"))
+        self.max_concurrency = int(os.getenv("HF_MAX_CONCURRENCY", "8"))
+        self.max_retries = int(os.getenv("HF_MAX_RETRIES", "3"))
+        # 0 = prompt único con las cinco intenciones (como antes), para comparar
+        self.two_stage = os.getenv("HF_TWO_STAGE", "1") == "1"
+
+
+_settings: Optional[HFSettings] = None
+
+
+def get_settings() -> HFSettings:
+    global _settings
+    if _settings is None:
+        _load_env()
+        settings = HFSettings()
+        print("============================================================")
+        print(f"[HF_CLIENT] ENV_PATH        = {ENV_PATH}")
+        print(f"[HF_CLIENT] HF_MODEL        = {settings.model}")
+        print(f"[HF_CLIENT] HF_URL          = {settings.url}")
+        print(f"[HF_CLIENT] HF_TOKEN_SET    = {bool(settings.token)}")
+        print("============================================================")
+        _settings = settings
+    return _settings
+
+
+# ------------------------------------------------------------
+# Cliente HTTP compartido (keep-alive, concurrencia acotada, reintentos)
+# ------------------------------------------------------------
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HFRouterError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(f"Error {status_code}: {detail}")
+
+
+class HFRouterClient:
+    """
+    Cliente asyncio del endpoint /v1/chat/completions. Reutiliza conexiones,
+    limita las llamadas simultáneas al modelo y reintenta 429/5xx y errores
+    de red con backoff exponencial con jitter.
+    """
+
+    def __init__(self, url: Optional[str] = None, token: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_concurrency: Optional[int] = None, max_retries: Optional[int] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                 backoff_base: float = 0.5, backoff_cap: float = 8.0):
+        # Lo que no se pasa sale de la configuración (HF_* / .env)
+        settings = get_settings()
+        max_concurrency = max_concurrency or settings.max_concurrency
+        max_retries = settings.max_retries if max_retries is None else max_retries
+        connect_timeout = connect_timeout or settings.connect_timeout
+        read_timeout = read_timeout or settings.read_timeout
+        self.url = url or settings.url
+        self._token = settings.token if token is None else token
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+        self._latencies = deque(maxlen=1000)
+        self.stats = {"calls": 0, "retries": 0, "errors": 0, "in_flight": 0}
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self._token}",
+            "Content-Type": "application/json"
+        }
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self._backoff_cap)
+            except ValueError:
+                pass
+        # Full jitter: uniforme entre 0 y base * 2^intento
+        return random.uniform(0, min(self._backoff_cap, self._backoff_base * 2 ** attempt))
+
+    async def _send(self, payload: Dict[str, Any], stream: bool) -> httpx.Response:
+        """Envía con reintentos; regresa la respuesta 200 (abierta si stream)."""
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                request = self._client.build_request("POST", self.url, headers=self._headers(), json=payload)
+                resp = await self._client.send(request, stream=stream)
+                if resp.status_code == 200:
+                    return resp
+                body = (await resp.aread()).decode(errors="replace")
+                await resp.aclose()
+                if resp.status_code not in RETRY_STATUS or attempt >= self._max_retries:
+                    raise HFRouterError(resp.status_code, body)
+                retry_after = resp.headers.get("retry-after")
+            except httpx.TransportError as e:
+                if attempt >= self._max_retries:
+                    raise HFRouterError(503, str(e) or e.__class__.__name__)
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._tracked():
+            resp = await self._send(payload, stream=False)
+            return resp.json()
+
+    async def chat_stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Fragmentos de texto del modelo (formato SSE de OpenAI)."""
+        async with self._tracked():
+            resp = await self._send({**payload, "stream": True}, stream=True)
+            try:
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    delta = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+            finally:
+                await resp.aclose()
+
+    @asynccontextmanager
+    async def _tracked(self):
+        async with self._semaphore:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            t0 = time.perf_counter()
+            try:
+                with track("hf_router", "chat.completions"):
+                    yield
+            except BaseException:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self._latencies.append(time.perf_counter() - t0)
+                self.stats["in_flight"] -= 1
+
+    def latency_snapshot(self) -> Dict[str, Any]:
+        """Latencia por llamada (incluye reintentos), en milisegundos."""
+        samples = sorted(self._latencies)
+
+        def pct(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else None
+
+        return {
+            **self.stats,
+            "last_ms": round(self._latencies[-1] * 1000, 1) if samples else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_hf_client: Optional[HFRouterClient] = None
+
+
+def get_hf_client() -> HFRouterClient:
+    global _hf_client
+    if _hf_client is None:
+        _hf_client = HFRouterClient()
+    return _hf_client
+
+
+def set_hf_client(client: Optional[HFRouterClient]):
+    """Reemplaza el cliente compartido (p.ej. por uno apuntando a un stub local)."""
+    global _hf_client
+    _hf_client = client
+
+
+async def close_hf_client():
+    global _hf_client
+    if _hf_client is not None:
+        await _hf_client.aclose()
+        _hf_client = None
+
+
+def _after_fork():
+    # Las conexiones del pool pertenecen al padre: el hijo abre las suyas
+    global _hf_client
+    _hf_client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+# Tokens por etapa ("classify" = prompt de una palabra, "extract" = esquema)
+prompt_stats: Dict[str, Any] = {
+    "local_classified": 0,
+    "llm_classified": 0,
+    "unclassified": 0,
+    "classify": {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0},
+    "extract": {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0},
+}
 
-print("============================================================")
-print(f"[HF_CLIENT] ENV_PATH        = {ENV_PATH}")
-print(f"[HF_CLIENT] HF_MODEL        = {HF_MODEL}")
-print(f"[HF_CLIENT] HF_URL          = {HF_URL}")
-print(f"[HF_CLIENT] HF_TOKEN_SET    = {bool(HF_TOKEN)}")
-print("============================================================")
 
 # ------------------------------------------------------------
 # Función principal: llamar al modelo
 # ------------------------------------------------------------
-def parse_create_intent(text: str) -> Dict[str, Any]:
+async def parse_create_intent(text: str) -> Dict[str, Any]:
     """
-    Envía una solicitud al modelo instruct/chat para convertir
-    texto libre en JSON estructurado de reunión.
+    Convierte texto libre en JSON estructurado de reunión. Los comandos
+    simples se resuelven con reglas locales y los repetidos en el mismo día
+    desde la cache de intenciones; sólo lo demás llega al modelo.
     """
-    if not HF_TOKEN:
-        return {"__error__": "No se encontró el token de Hugging Face."}
+    with span("intent.fast_path") as sp:
+        fast = try_fast_path(text)
+        sp.set(hit=fast is not None)
+    if fast is not None:
+        return fast
+
+    with span("intent.cache") as sp:
+        cached = intent_cache.get(text)
+        sp.set(hit=cached is not None)
+    if cached is not None:
+        return cached
+
+    result = await _request_intent(text)
+    if "__error__" not in result:
+        intent_cache.put(text, result)
+    return result
 
-    headers = {
-        "Authorization": f"Bearer {HF_TOKEN}",
-        "Content-Type": "application/json"
-    }
 
-    system_prompt = (
-    "Eres un asistente que analiza instrucciones en lenguaje natural y "
-    "responde ÚNICAMENTE en formato JSON válido, sin texto adicional, "
-    "según la intención del usuario. Las intenciones posibles son:\n"
-    "1. Crear una reunión (intent: create)\n"
-    "2. Cancelar una reunión (intent: cancel)\n"
-    "3. Actualizar una reunión (intent: update)\n"
-    "4. Ver todas las reuniones (intent: list)\n"
-    "5. Ver espacios libres en un momento especifico (intent:free)"
-    "\n"
-    "Responde SIEMPRE con uno de los siguientes formatos JSON válidos:\n"
-    "\n"
-    "CREAR REUNIÓN:\n"
-    "{\n"
-    '  "summary": "titulo o propósito de la reunión",\n'
-    '  "location": "Google Meet",\n'
-    '  "description": "detalle o agenda",\n'
-    '  "start": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
-    '  "end": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
-    '  "attendees": [{"email": "persona@ejemplo.com"}],\n'
-    '  "conferenceData": {"createRequest": {"requestId": "sma-12345"}},\n'
-    '  "intent": "create"\n'
-    "}\n"
-    "\n"
-    "CANCELAR REUNIÓN:\n"
-    "{\n"
-    '  "cancel_id": "id_reunion_o_nombre_identificable",\n'
-    '  "intent": "cancel"\n'
-    "}\n"
-    "\n"
-    "ACTUALIZAR REUNIÓN (el user debe ser muy especifico con el id):\n"
-    "{\n"
-    '  "update_id": "id_reunion",\n'
-    '  "fields": {\n'
-    '      "summary": "nuevo titulo opcional",\n'
-    '      "start": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
-    '      "end": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
-    '      "attendees": [{"email": "persona@ejemplo.com"}]\n'
-    '  },\n'
-    '  "intent": "update"\n'
-    "}\n"
-    "\n"
-    "LISTAR REUNIONES:\n"
-    "{\n"
-    '  "intent": "list",\n'
-    '  "limite": 10,\n'
-    '  "fecha": "2025-11-16"'
-    "}\n"
-    "VER ESPACIOS LIBRES:\n"
-    "{\n"
-    '  "intent": "free",\n'
-    '  "duration_minutes": 30,\n'
-    '  "date": "2025-11-16"'
-    "}\n"
-    "\n"
-    "Si la instrucción del usuario no tiene información suficiente para ninguna de las anteriores, "
-    "responde con:\n"
-    "{\n"
-    '  "err": "Explica brevemente qué información falta (por ejemplo: fecha, hora, id de reunión, etc.)"\n'
-    "}\n"
-    "\n"
-    f"Considera que la fecha y hora actual es: {datetime.now().isoformat()}\n"
-    "Ejemplo: si el usuario dice 'agenda reunión con Carlos mañana a las 10am por 30 minutos', "
-    "debes responder con un JSON tipo 'create' completo, incluyendo hora de inicio y fin calculadas.\n"
-    "Si dice 'cancela la reunión con Carlos de hoy', responde con un JSON tipo 'cancel'.\n"
-    "Si dice 'mueve la reunión de Carlos a las 11am', responde con un JSON tipo 'update'.\n"
-    "Si dice 'muéstrame todas mis reuniones' o 'qué tengo hoy', responde con un JSON tipo 'list'.\n"
-)
-
-
-    payload = {
-        "model": HF_MODEL,
+# ------------------------------------------------------------
+# Dos etapas: clasificar la intención y extraer sólo su esquema
+# ------------------------------------------------------------
+def _payload(system_prompt: str, text: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    return {
+        "model": get_settings().model,
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": text}
         ],
-        "temperature": 0.3,
-        "max_tokens": 512
+        "temperature": temperature,
+        "max_tokens": max_tokens
     }
 
+
+def _record_usage(stage: str, data: Optional[Dict[str, Any]], payload: Dict[str, Any],
+                  completion: str, elapsed: float):
+    """Suma y registra los tokens de una etapa (estimados si la API no trae `usage`)."""
+    usage = (data or {}).get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or sum(
+        estimate_tokens(m["content"]) for m in payload["messages"]
+    )
+    completion_tokens = usage.get("completion_tokens") or estimate_tokens(completion)
+    stats = prompt_stats[stage]
+    stats["calls"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+    print(f"[HF_CLIENT] etapa={stage} prompt_tokens={prompt_tokens} "
+          f"completion_tokens={completion_tokens} ms={elapsed * 1000:.0f}")
+
+
+def _message_content(data: Dict[str, Any]) -> str:
+    return data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+
+
+async def _classify_intent(text: str) -> Optional[str]:
+    """Etapa 1: reglas locales y, si no alcanzan, un prompt de una palabra."""
+    if not get_settings().two_stage:
+        return None
+    with span("intent.classify.local"):
+        intent = classify_intent(text)
+    if intent is not None:
+        prompt_stats["local_classified"] += 1
+        return intent
+
+    payload = _payload(CLASSIFY_PROMPT, text, max_tokens=4, temperature=0.0)
+    t0 = time.perf_counter()
     try:
-        res = requests.post(HF_URL, headers=headers, json=payload, timeout=90)
-        if res.status_code != 200:
-            return {"__error__": f"Error {res.status_code}: {res.text}"}
+        async with span("intent.classify.llm"):
+            data = await get_hf_client().chat(payload)
+    except Exception as e:
+        # Sin clasificación se usa el prompt completo
+        print(f"[HF_CLIENT] Clasificación falló: {e}")
+        prompt_stats["unclassified"] += 1
+        return None
+    message = _message_content(data)
+    _record_usage("classify", data, payload, message, time.perf_counter() - t0)
+    intent = parse_label(message)
+    prompt_stats["llm_classified" if intent else "unclassified"] += 1
+    return intent
 
-        data = res.json()
-        message = data.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
 
-        # intentar decodificar JSON del mensaje
-        try:
-            parsed = json.loads(message)
-            return parsed
-        except Exception:
-            return {"raw_response": message, "__error__": "No se pudo decodificar JSON limpio."}
+async def _extraction_payload(text: str) -> Dict[str, Any]:
+    intent = await _classify_intent(text)
+    return _payload(extraction_prompt(intent), text, max_tokens=512, temperature=0.3)
+
+
+def _decode_intent(message: str) -> Dict[str, Any]:
+    # intentar decodificar JSON del mensaje
+    try:
+        return json.loads(message.strip())
+    except Exception:
+        return {"raw_response": message, "__error__": "No se pudo decodificar JSON limpio."}
+
+
+async def _request_intent(text: str) -> Dict[str, Any]:
+    """
+    Envía una solicitud al modelo instruct/chat para convertir
+    texto libre en JSON estructurado de reunión.
+    """
+    if not get_settings().token:
+        return {"__error__": "No se encontró el token de Hugging Face."}
+
+    try:
+        payload = await _extraction_payload(text)
+        t0 = time.perf_counter()
+        async with span("intent.extract"):
+            data = await get_hf_client().chat(payload)
+        message = _message_content(data)
+        _record_usage("extract", data, payload, message, time.perf_counter() - t0)
+        return _decode_intent(message)
 
     except Exception as e:
         return {"__error__": str(e)}
 
 
+async def stream_create_intent(text: str) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Igual que parse_create_intent pero en streaming: produce ("token", texto)
+    conforme el modelo genera y al final ("intent", dict) o ("error", detalle).
+    Las respuestas por reglas o de la cache salen directo como "intent".
+    """
+    fast = try_fast_path(text)
+    if fast is not None:
+        yield "intent", fast
+        return
+
+    cached = intent_cache.get(text)
+    if cached is not None:
+        yield "intent", cached
+        return
+
+    if not get_settings().token:
+        yield "error", "No se encontró el token de Hugging Face."
+        return
+
+    parts = []
+    try:
+        payload = await _extraction_payload(text)
+        t0 = time.perf_counter()
+        async for delta in get_hf_client().chat_stream(payload):
+            parts.append(delta)
+            yield "token", delta
+    except Exception as e:
+        yield "error", str(e)
+        return
+    _record_usage("extract", None, payload, "".join(parts), time.perf_counter() - t0)
+
+    result = _decode_intent("".join(parts))
+    if "__error__" in result:
+        yield "error", result["__error__"]
+        return
+    intent_cache.put(text, result)
+    yield "intent", result
+
+
 # ------------------------------------------------------------
 # Prueba directa
 # ------------------------------------------------------------
@@ -160,6 +428,6 @@ if __name__ == "__main__":
         "agenda mañana 16:00 por 45 min con maria@example.com y hector@example.com, "
         "tema roadmap de IA"
     )
-    result = parse_create_intent(test_text)
+    result = asyncio.run(parse_create_intent(test_text))
     print("\n--- Resultado del modelo ---")
     print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -0,0 +1,138 @@
+# ============================================================
+# Idempotency-Key para operaciones que crean recursos
+# ============================================================
+#
+# Si el frontend o un proxy reintenta POST /v1/meetings tras un timeout, la
+# misma Idempotency-Key regresa la respuesta guardada sin volver a llamar a
+# Calendar ni a Firestore. Dos peticiones simultáneas con la misma clave no
+# compiten: la segunda espera el resultado de la primera.
+#
+# El almacén es local al proceso (LRU acotado con TTL). Entre workers o tras
+# un reinicio la protección la da Calendar: el id del evento se deriva de la
+# clave (event_id_for), así que un segundo insert responde 409 y se reutiliza
+# el evento existente.
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# (status, cuerpo JSON)
+StoredResponse = Tuple[int, Any]
+
+
+class IdempotencyConflict(Exception):
+    """La clave ya se usó con un cuerpo distinto."""
+
+
+def fingerprint(body: Any) -> str:
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def event_id_for(key: str) -> str:
+    """Id de evento de Calendar determinista (base32hex: a-v y 0-9)."""
+    digest = hashlib.sha256(f"event|{key}".encode()).digest()
+    return base64.b32hexencode(digest).decode().lower().rstrip("=")
+
+
+def request_id_for(key: str) -> str:
+    """conferenceData.createRequest.requestId estable para la misma clave."""
+    return "idem-" + hashlib.sha256(f"conference|{key}".encode()).hexdigest()[:32]
+
+
+class IdempotencyStore:
+    """
+    Respuestas completadas por clave (LRU con TTL) y, para las que siguen en
+    curso, un Future que comparten las peticiones repetidas.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self._ttl = ttl
+        self._max_keys = max_keys
+        # key -> (expira, fingerprint, respuesta)
+        self._done: "OrderedDict[str, Tuple[float, str, StoredResponse]]" = OrderedDict()
+        # key -> (fingerprint, Future); sólo se toca desde el event loop
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.stats = {"executed": 0, "replayed": 0, "joined": 0, "conflicts": 0, "failed": 0}
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, StoredResponse]]:
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        expires, fp, response = entry
+        if expires < time.monotonic():
+            del self._done[key]
+            return None
+        self._done.move_to_end(key)
+        return fp, response
+
+    def _store(self, key: str, fp: str, response: StoredResponse):
+        self._done[key] = (time.monotonic() + self._ttl, fp, response)
+        self._done.move_to_end(key)
+        while len(self._done) > self._max_keys:
+            self._done.popitem(last=False)
+
+    async def run(self, key: str, fp: str,
+                  fn: Callable[[], Awaitable[StoredResponse]]) -> Tuple[StoredResponse, bool]:
+        """
+        Ejecuta fn una sola vez por clave. Regresa (respuesta, repetida).
+        Si fn falla no se guarda nada: el cliente puede reintentar con la
+        misma clave (y quien esperaba recibe el mismo error).
+        """
+        done = self._lookup(key)
+        if done is not None:
+            self._check(done[0], fp)
+            self.stats["replayed"] += 1
+            return done[1], True
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self._check(pending[0], fp)
+            self.stats["joined"] += 1
+            # shield: si este cliente se desconecta no se cancela la original
+            return await asyncio.shield(pending[1]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fp, future)
+        try:
+            response = await fn()
+        except asyncio.CancelledError:
+            self.stats["failed"] += 1
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            future.set_exception(e)
+            # Marcarla como leída: sin peticiones repetidas nadie más la consume
+            future.exception()
+            raise
+        else:
+            self.stats["executed"] += 1
+            # Sólo las respuestas exitosas son definitivas
+            if response[0] < 500:
+                self._store(key, fp, response)
+            future.set_result(response)
+            return response, False
+        finally:
+            self._in_flight.pop(key, None)
+
+    def _check(self, stored_fp: str, fp: str):
+        if stored_fp != fp:
+            self.stats["conflicts"] += 1
+            raise IdempotencyConflict("La Idempotency-Key ya se usó con otro cuerpo")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._done), "in_flight": len(self._in_flight),
+                "max_keys": self._max_keys, "ttl_seconds": self._ttl}
+
+
+idempotency_store = IdempotencyStore()
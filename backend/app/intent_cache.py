@@ -0,0 +1,133 @@
+# ============================================================
+# Cache de intenciones del LLM
+# ============================================================
+#
+# La clave es el texto normalizado + la fecha del día: "mañana" no significa
+# lo mismo hoy que ayer, así que una entrada sólo sirve durante su día.
+# Memoria LRU acotada y, opcionalmente, respaldo en SQLite para que la cache
+# sobreviva reinicios (INTENT_CACHE_DB=ruta/al/archivo.sqlite).
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "1024"))
+INTENT_CACHE_DB = os.getenv("INTENT_CACHE_DB", "")
+
+# Expresiones relativas a la hora actual ("en 20 minutos", "ahorita"): su
+# resultado cambia dentro del mismo día, así que no se guardan.
+_TIME_RELATIVE = re.compile(
+    r"\b(ahora|ahorita|en\s+(un|una|media|\d+)\s*(min|minutos?|horas?|hrs?|h)\b|dentro\s+de)"
+)
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCT = " \t.,;:!?¡¿"
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos, espacios colapsados y sin puntuación en los extremos."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _SPACES.sub(" ", text).strip(_EDGE_PUNCT)
+
+
+class IntentCache:
+    """LRU en memoria con respaldo opcional en SQLite."""
+
+    def __init__(self, max_entries: int = INTENT_CACHE_SIZE, db_path: str = INTENT_CACHE_DB):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "skipped": 0}
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS intents ("
+                " key TEXT PRIMARY KEY, bucket TEXT NOT NULL, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            # Lo de días anteriores ya no sirve
+            self._db.execute("DELETE FROM intents WHERE bucket < ?", (self._bucket(),))
+            self._db.commit()
+
+    @staticmethod
+    def _bucket(now: Optional[datetime] = None) -> str:
+        return (now or datetime.now()).date().isoformat()
+
+    def key_for(self, text: str, now: Optional[datetime] = None) -> Optional[str]:
+        """Clave de cache, o None si el texto depende de la hora actual."""
+        normalized = normalize_text(text)
+        if not normalized or _TIME_RELATIVE.search(normalized):
+            return None
+        return f"{self._bucket(now)}|{normalized}"
+
+    def get(self, text: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        key = self.key_for(text, now)
+        if key is None:
+            self.stats["skipped"] += 1
+            return None
+
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return json.loads(value)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM intents WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._store(key, row[0])
+                    self.stats["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, text: str, intent: Dict[str, Any], now: Optional[datetime] = None):
+        key = self.key_for(text, now)
+        if key is None:
+            return
+        value = json.dumps(intent, ensure_ascii=False)
+        with self._lock:
+            self._store(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO intents (key, bucket, value, created) VALUES (?, ?, ?, ?)",
+                    (key, key.split("|", 1)[0], value, time.time()),
+                )
+                self._db.commit()
+
+    def _store(self, key: str, value: str):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hit_ratio = (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "max_entries": self._max_entries,
+            "persistent": self._db is not None,
+            "hit_ratio": round(hit_ratio, 4),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM intents")
+                self._db.commit()
+
+
+intent_cache = IntentCache()
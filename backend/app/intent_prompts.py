@@ -0,0 +1,150 @@
+# ============================================================
+# Prompts del LLM — compilados una sola vez al importar
+# ============================================================
+#
+# Clasificación en dos etapas: primero se decide la intención (con las reglas
+# locales o con un prompt mínimo) y después sólo se envía el esquema JSON de
+# esa intención. Lo único que cambia por llamada es la fecha actual, que se
+# sustituye en una plantilla ya armada.
+
+from datetime import datetime
+from string import Template
+from typing import Dict, Optional
+
+INTENTS = ("create", "cancel", "update", "list", "free")
+
+_INTRO = (
+    "Eres un asistente que analiza instrucciones en lenguaje natural y "
+    "responde ÚNICAMENTE en formato JSON válido, sin texto adicional.\n"
+)
+
+_SCHEMAS: Dict[str, str] = {
+    "create": (
+        "CREAR REUNIÓN:\n"
+        "{\n"
+        '  "summary": "titulo o propósito de la reunión",\n'
+        '  "location": "Google Meet",\n'
+        '  "description": "detalle o agenda",\n'
+        '  "start": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
+        '  "end": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
+        '  "attendees": [{"email": "persona@ejemplo.com"}],\n'
+        '  "conferenceData": {"createRequest": {"requestId": "sma-12345"}},\n'
+        '  "intent": "create"\n'
+        "}\n"
+    ),
+    "cancel": (
+        "CANCELAR REUNIÓN:\n"
+        "{\n"
+        '  "cancel_id": "id_reunion_o_nombre_identificable",\n'
+        '  "intent": "cancel"\n'
+        "}\n"
+    ),
+    "update": (
+        "ACTUALIZAR REUNIÓN (el user debe ser muy especifico con el id):\n"
+        "{\n"
+        '  "update_id": "id_reunion",\n'
+        '  "fields": {\n'
+        '      "summary": "nuevo titulo opcional",\n'
+        '      "start": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
+        '      "end": {"dateTime": "YYYY-MM-DDTHH:MM:SS", "timeZone": "America/Mexico_City"},\n'
+        '      "attendees": [{"email": "persona@ejemplo.com"}]\n'
+        "  },\n"
+        '  "intent": "update"\n'
+        "}\n"
+    ),
+    "list": (
+        "LISTAR REUNIONES:\n"
+        "{\n"
+        '  "intent": "list",\n'
+        '  "limite": 10,\n'
+        '  "fecha": "2025-11-16"\n'
+        "}\n"
+    ),
+    "free": (
+        "VER ESPACIOS LIBRES:\n"
+        "{\n"
+        '  "intent": "free",\n'
+        '  "duration_minutes": 30,\n'
+        '  "date": "2025-11-16"\n'
+        "}\n"
+    ),
+}
+
+_EXAMPLES: Dict[str, str] = {
+    "create": (
+        "Ejemplo: si el usuario dice 'agenda reunión con Carlos mañana a las 10am por 30 minutos', "
+        "responde con el JSON completo, incluyendo hora de inicio y fin calculadas.\n"
+    ),
+    "cancel": "Ejemplo: 'cancela la reunión con Carlos de hoy'.\n",
+    "update": "Ejemplo: 'mueve la reunión de Carlos a las 11am'.\n",
+    "list": "Ejemplo: 'muéstrame todas mis reuniones' o 'qué tengo hoy'.\n",
+    "free": "Ejemplo: '¿qué espacios libres de una hora tengo el viernes?'.\n",
+}
+
+_MISSING = (
+    "Si la instrucción no tiene información suficiente, responde con:\n"
+    "{\n"
+    '  "err": "Explica brevemente qué información falta (por ejemplo: fecha, hora, id de reunión, etc.)"\n'
+    "}\n"
+)
+
+_NOW = "Considera que la fecha y hora actual es: $now\n"
+
+
+def _single_intent_template(intent: str) -> Template:
+    return Template(
+        _INTRO
+        + "Responde SIEMPRE con este formato JSON:\n\n"
+        + _SCHEMAS[intent]
+        + "\n"
+        + _MISSING
+        + "\n"
+        + _NOW
+        + _EXAMPLES[intent]
+    )
+
+
+# Prompt completo (las cinco intenciones), para cuando no se pudo clasificar
+_FULL_TEMPLATE = Template(
+    _INTRO
+    + "Las intenciones posibles son:\n"
+    "1. Crear una reunión (intent: create)\n"
+    "2. Cancelar una reunión (intent: cancel)\n"
+    "3. Actualizar una reunión (intent: update)\n"
+    "4. Ver todas las reuniones (intent: list)\n"
+    "5. Ver espacios libres en un momento especifico (intent:free)\n"
+    "\n"
+    "Responde SIEMPRE con uno de los siguientes formatos JSON válidos:\n\n"
+    + "\n".join(_SCHEMAS[name] for name in INTENTS)
+    + "\n"
+    + _MISSING
+    + "\n"
+    + _NOW
+    + "".join(_EXAMPLES[name] for name in INTENTS)
+)
+
+_TEMPLATES: Dict[str, Template] = {name: _single_intent_template(name) for name in INTENTS}
+
+# Etapa 1: una sola palabra de salida
+CLASSIFY_PROMPT = (
+    "Clasifica la instrucción del usuario sobre su calendario. Responde con UNA sola palabra:\n"
+    "create (agendar una reunión), cancel (cancelar), update (mover o modificar), "
+    "list (ver reuniones), free (ver espacios libres) o none (ninguna).\n"
+)
+
+
+def extraction_prompt(intent: Optional[str], now: Optional[datetime] = None) -> str:
+    """Prompt de la etapa 2: sólo el esquema de `intent` (o todos si es None)."""
+    template = _TEMPLATES.get(intent, _FULL_TEMPLATE)
+    return template.substitute(now=(now or datetime.now()).isoformat())
+
+
+def parse_label(message: str) -> Optional[str]:
+    """Intención que devolvió el clasificador, o None si no es una conocida."""
+    words = message.strip().lower().strip(".\"'` ").split()
+    return words[0] if words and words[0] in INTENTS else None
+
+
+def estimate_tokens(text: str) -> int:
+    """Aproximación (~4 caracteres por token) cuando la API no reporta `usage`."""
+    return max(1, len(text) // 4)
@@ -0,0 +1,334 @@
+# ============================================================
+# Parser de intenciones por reglas — camino rápido sin LLM
+# ============================================================
+#
+# Reconoce los comandos simples más comunes (ver reuniones, espacios libres,
+# cancelar/mover por id, agendar con fecha y hora explícitas) y regresa
+# exactamente los mismos JSON que define el system prompt de hf_client.py.
+# Si la instrucción es ambigua o le falta algo, la confianza es baja y se
+# deja la decisión al modelo.
+
+import os
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.intent_cache import normalize_text
+
+TIMEZONE = "America/Mexico_City"
+INTENT_RULES_ENABLED = os.getenv("INTENT_RULES_ENABLED", "1") == "1"
+INTENT_RULES_MIN_CONFIDENCE = float(os.getenv("INTENT_RULES_MIN_CONFIDENCE", "0.85"))
+# Tope de confianza cuando la instrucción es ambigua (debajo del umbral)
+AMBIGUOUS_CONFIDENCE = 0.6
+DEFAULT_DURATION_MIN = 30
+
+rule_stats = {"handled": 0, "fallback": 0}
+
+# ------------------------------------------------------------
+# Vocabulario (texto ya normalizado: minúsculas y sin acentos)
+# ------------------------------------------------------------
+_WEEKDAYS = {"lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3, "viernes": 4, "sabado": 5, "domingo": 6}
+_MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+_KEYWORDS = {
+    "cancel": re.compile(r"\b(cancela\w*|elimina\w*|borra\w*|quita\w*)\b"),
+    "update": re.compile(r"\b(mueve\w*|muevan|cambia\w*|reprograma\w*|actualiza\w*|recorre\w*|pasa la)\b"),
+    "free": re.compile(r"\b(libres?|disponibles?|disponibilidad|espacios?|huecos?|horarios? libres?)\b"),
+    "list": re.compile(
+        r"\b(que tengo|mis reuniones|mis juntas|muestrame|ensename|lista\w*|ver (las |mis )?(reuniones|juntas)"
+        r"|que reuniones|cuales (son )?(mis )?(reuniones|juntas)|mi agenda|(reuniones|juntas) (de|para) )"
+    ),
+    # "mi/la agenda" es sustantivo, no la orden de agendar
+    "create": re.compile(
+        r"\b((?<!mi )(?<!la )(?<!tu )(?<!su )(?<!una )agenda|agendame|agendar|programa|programame|crea|creame"
+        r"|organiza|nueva reunion|nueva junta)\b"
+    ),
+}
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_SLASH_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_TEXT_DATE = re.compile(r"\b(\d{1,2}) de (" + "|".join(_MONTHS) + r")(?: (?:de|del) (\d{4}))?\b")
+_WEEKDAY = re.compile(r"\b(?:el |este |proximo |el proximo )?(" + "|".join(_WEEKDAYS) + r")\b")
+_TIME = re.compile(
+    r"\b(?:a las |a la |las |para las )?(\d{1,2})(?::(\d{2}))?\s*"
+    r"(am|a\.m\.|pm|p\.m\.|hrs|hr|h|de la manana|de la tarde|de la noche)?\b"
+)
+# "por 2 h" es duración pero "a las 10 h" es hora: las abreviaturas piden prefijo
+_DURATION = re.compile(
+    r"\b(?:(?:por|durante|dura|de)\s+(\d+(?:\.\d+)?|una?|media)\s*(minutos?|mins?|horas?|hrs?|h)"
+    r"|(\d+(?:\.\d+)?)\s*(minutos?|mins?|horas?))\b"
+)
+_HOUR_AND_HALF = re.compile(r"\b(una )?hora y media\b")
+_EVENT_ID = re.compile(r"\b(?:id|evento|reunion|junta)\s*(?:con id\s*|id\s*)?[:#]?\s*([a-v0-9]{10,})\b")
+# Se aplica al texto original (con acentos y mayúsculas) para conservar el título
+_TOPIC = re.compile(r"\b(?:tema|sobre|acerca de|para revisar|para hablar de|asunto)\s*:?\s*(.+)$", re.IGNORECASE)
+# El tema termina donde empiezan fecha, hora, duración o invitados
+_TOPIC_END = re.compile(
+    r"[,;]|\s(?:con|y)\s*$|\s(?:con|y)\s+\S+@|\s(?:ma[ñn]ana|hoy|pasado|a las|el (?:"
+    + "|".join(_WEEKDAYS) + r"|mi[ée]rcoles|s[áa]bado)|por \d|durante)\b",
+    re.IGNORECASE,
+)
+
+
+# ------------------------------------------------------------
+# Extractores
+# ------------------------------------------------------------
+def _extract_date(text: str, today: date) -> Tuple[Optional[date], bool]:
+    """Regresa (fecha, explícita). Sin mención de fecha: (None, False)."""
+    if re.search(r"\bpasado manana\b", text):
+        return today + timedelta(days=2), True
+    if re.search(r"\bmanana\b", text.replace("de la manana", "")):
+        return today + timedelta(days=1), True
+    if re.search(r"\bhoy\b", text):
+        return today, True
+
+    m = _ISO_DATE.search(text)
+    if m:
+        try:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3))), True
+        except ValueError:
+            return None, False
+
+    m = _TEXT_DATE.search(text)
+    if m:
+        year = int(m.group(3)) if m.group(3) else today.year
+        try:
+            found = date(year, _MONTHS[m.group(2)], int(m.group(1)))
+        except ValueError:
+            return None, False
+        if not m.group(3) and found < today:
+            found = found.replace(year=year + 1)
+        return found, True
+
+    m = _SLASH_DATE.search(text)
+    if m:
+        year = int(m.group(3)) if m.group(3) else today.year
+        if year < 100:
+            year += 2000
+        first, second = int(m.group(1)), int(m.group(2))
+        # dd/mm; si no es válida pero mm/dd sí ("12/13"), se toma mm/dd
+        if second > 12 >= first:
+            first, second = second, first
+        try:
+            found = date(year, second, first)
+        except ValueError:
+            return None, False
+        if not m.group(3) and found < today:
+            found = found.replace(year=year + 1)
+        return found, True
+
+    m = _WEEKDAY.search(text)
+    if m:
+        ahead = (_WEEKDAYS[m.group(1)] - today.weekday()) % 7 or 7
+        return today + timedelta(days=ahead), True
+
+    return None, False
+
+
+def _mentions_date(text: str) -> bool:
+    return bool(_ISO_DATE.search(text) or _TEXT_DATE.search(text) or _SLASH_DATE.search(text))
+
+
+def _extract_time(text: str) -> Optional[time]:
+    # Quita fechas para que "16/11" o "2025-11-16" no parezcan horas
+    cleaned = _EMAIL.sub(" ", text)
+    cleaned = _DURATION.sub(" ", _SLASH_DATE.sub(" ", _ISO_DATE.sub(" ", _TEXT_DATE.sub(" ", cleaned))))
+    cleaned = _HOUR_AND_HALF.sub(" ", cleaned)
+    for m in _TIME.finditer(cleaned):
+        hour, minute, suffix = int(m.group(1)), int(m.group(2) or 0), (m.group(3) or "")
+        prefixed = m.group(0).startswith(("a las", "a la", "las", "para las"))
+        if not (m.group(2) or suffix or prefixed):
+            continue
+        if suffix in ("pm", "p.m.", "de la tarde", "de la noche") and hour < 12:
+            hour += 12
+        if suffix in ("am", "a.m.", "de la manana") and hour == 12:
+            hour = 0
+        if hour > 23 or minute > 59:
+            continue
+        return time(hour, minute)
+    return None
+
+
+def _extract_duration(text: str) -> Optional[int]:
+    if _HOUR_AND_HALF.search(text):
+        return 90
+    if re.search(r"\bmedia hora\b", text):
+        return 30
+    m = _DURATION.search(_EMAIL.sub(" ", text))
+    if not m:
+        return None
+    amount, unit = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+    value = 1.0 if amount in ("un", "una") else 0.5 if amount == "media" else float(amount)
+    minutes = value * 60 if unit.startswith("h") else value
+    return int(minutes) if minutes > 0 else None
+
+
+def _extract_emails(original: str) -> List[str]:
+    return list(dict.fromkeys(m.group(0).lower().rstrip(".") for m in _EMAIL.finditer(original)))
+
+
+def _extract_event_id(text: str) -> Optional[str]:
+    m = _EVENT_ID.search(text)
+    if m and re.search(r"\d", m.group(1)):
+        return m.group(1)
+    return None
+
+
+def _extract_topic(original: str) -> Optional[str]:
+    m = _TOPIC.search(original.strip())
+    if not m:
+        return None
+    topic = m.group(1)
+    end = _TOPIC_END.search(topic)
+    if end:
+        topic = topic[:end.start()]
+    topic = _EMAIL.sub("", topic).strip(" ,.;")
+    return topic or None
+
+
+def _classify(text: str) -> List[str]:
+    return [name for name, pattern in _KEYWORDS.items() if pattern.search(text)]
+
+
+def _resolve(found: List[str]) -> Optional[str]:
+    """Una sola intención a partir de las palabras clave, o None si es ambiguo."""
+    # "agenda" también es sustantivo: "mi agenda de hoy" es una consulta
+    if "create" in found and ("list" in found or "free" in found):
+        found = [name for name in found if name != "create"]
+    if "update" in found and "cancel" in found:
+        return None
+    for dominant in ("cancel", "update", "free"):
+        if len(found) > 1 and dominant in found:
+            found = [dominant]
+    return found[0] if len(found) == 1 else None
+
+
+def classify_intent(text: str) -> Optional[str]:
+    """
+    Sólo la intención (create/cancel/update/list/free) por palabras clave,
+    aunque falten datos para armar el JSON. None si no hay una clara.
+    """
+    if not INTENT_RULES_ENABLED:
+        return None
+    return _resolve(_classify(normalize_text(text)))
+
+
+def _event_time(day: date, at: time) -> Dict[str, str]:
+    return {"dateTime": datetime.combine(day, at).strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": TIMEZONE}
+
+
+# ------------------------------------------------------------
+# Parser
+# ------------------------------------------------------------
+def parse_intent_fast(text: str, now: Optional[datetime] = None) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Regresa (intent, confianza). intent tiene la misma forma que la
+    respuesta del LLM; (None, 0.0) si no se reconoce el comando.
+    """
+    now = now or datetime.now()
+    today = now.date()
+    norm = normalize_text(text)
+    if not norm:
+        return None, 0.0
+
+    found = _classify(norm)
+    intent = _resolve(found)
+    if intent is None:
+        return None, 0.0
+
+    day, explicit_day = _extract_date(norm, today)
+    if day is None and _mentions_date(norm):
+        # Hay una fecha escrita que no se pudo interpretar ("31/02")
+        return None, 0.3
+
+    # Palabras clave de varias intenciones: la elegida es una suposición
+    cap = AMBIGUOUS_CONFIDENCE if len(found) > 1 else 1.0
+
+    if intent in ("list", "free") and _extract_time(norm):
+        # Consultar o buscar huecos no lleva hora: si la hay, probablemente es
+        # otra cosa ("lista de pendientes para mañana a las 9") o se perdería
+        cap = min(cap, AMBIGUOUS_CONFIDENCE)
+
+    if intent == "list":
+        return (
+            {"intent": "list", "limite": 10, "fecha": (day or today).isoformat()},
+            min(0.95 if explicit_day else 0.85, cap),
+        )
+
+    if intent == "free":
+        duration = _extract_duration(norm) or DEFAULT_DURATION_MIN
+        return (
+            {"intent": "free", "duration_minutes": duration, "date": (day or today).isoformat()},
+            min(0.95 if explicit_day else 0.85, cap),
+        )
+
+    if intent == "cancel":
+        event_id = _extract_event_id(norm)
+        if not event_id:
+            # "cancela la reunión con Carlos": identificar por nombre queda al LLM
+            return None, 0.3
+        return {"cancel_id": event_id, "intent": "cancel"}, min(0.95, cap)
+
+    if intent == "update":
+        event_id = _extract_event_id(norm)
+        at = _extract_time(norm)
+        if not event_id or not (at or explicit_day):
+            return None, 0.3
+        fields: Dict[str, Any] = {}
+        if at:
+            start = datetime.combine(day or today, at)
+            duration = _extract_duration(norm) or DEFAULT_DURATION_MIN
+            fields["start"] = _event_time(start.date(), start.time())
+            end = start + timedelta(minutes=duration)
+            fields["end"] = _event_time(end.date(), end.time())
+        emails = _extract_emails(text)
+        if emails:
+            fields["attendees"] = [{"email": e} for e in emails]
+        if not fields:
+            return None, 0.3
+        return {"update_id": event_id, "fields": fields, "intent": "update"}, min(0.9 if at else 0.6, cap)
+
+    # create
+    at = _extract_time(norm)
+    if not (explicit_day and at):
+        return None, 0.3
+    if _extract_event_id(norm):
+        # Menciona una reunión existente: puede ser mover o cancelar
+        return None, 0.4
+    duration = _extract_duration(norm) or DEFAULT_DURATION_MIN
+    start = datetime.combine(day, at)
+    end = start + timedelta(minutes=duration)
+    emails = _extract_emails(text)
+    topic = _extract_topic(text)
+    summary = topic or ("Reunión con " + ", ".join(e.split("@")[0] for e in emails) if emails else None)
+    if not summary:
+        return None, 0.4
+    intent_json = {
+        "summary": summary,
+        "location": "Google Meet",
+        "description": topic or summary,
+        "start": _event_time(start.date(), start.time()),
+        "end": _event_time(end.date(), end.time()),
+        "attendees": [{"email": e} for e in emails],
+        "conferenceData": {"createRequest": {"requestId": f"sma-{uuid.uuid4().hex[:12]}"}},
+        "intent": "create",
+    }
+    # Sin tema explícito el título es una suposición: mejor que lo decida el LLM
+    return intent_json, min(0.9 if topic else 0.7, cap)
+
+
+def try_fast_path(text: str, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Intent por reglas si la confianza alcanza el umbral; si no, None."""
+    if not INTENT_RULES_ENABLED:
+        return None
+    intent, confidence = parse_intent_fast(text, now)
+    if intent is not None and confidence >= INTENT_RULES_MIN_CONFIDENCE:
+        rule_stats["handled"] += 1
+        return intent
+    rule_stats["fallback"] += 1
+    return None
@@ -1,24 +1,95 @@
-from app.calendar import create_calendar_meeting, cancel_calendar_meeting, find_free_slots_for_day, list_events_for_date, update_calendar_meeting
-from fastapi import FastAPI, HTTPException, Query
+from app.calendar_async import (
+    BatchCall,
+    CalendarAPIError,
+    abatch_calendar_operations,
+    acancel_calendar_meeting,
+    acreate_calendar_meeting,
+    afind_free_slots_for_day,
+    afind_free_slots_for_range,
+    afind_group_slots,
+    afind_slot_suggestions,
+    alist_events_for_date,
+    aupdate_calendar_meeting,
+    close_async_calendar,
+    get_async_calendar,
+)
+import math
+import os
+import re
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
-from firebase_admin import firestore as fb_fs
-from app.firebase_config import db
+from typing import List, Literal, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from app.firebase_config import get_db
+from app.action_log import ActionLogWriter
+from app.mirror_outbox import DELETE as MIRROR_DELETE, MERGE as MIRROR_MERGE, SET as MIRROR_SET, MirrorOutbox
+from app.mirror_outbox import apply_op as apply_mirror_op
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, track
+from app.metrics import render as render_metrics
+from app.tracing import TracingMiddleware, span
+from app.calendar import CalendarAuthorizationRequired
+from app.calendar_quota import CalendarRateLimited, calendar_scheduler
+from app.credential_pool import CalendarUserMiddleware, credential_pool, current_calendar_user
+from app.idempotency import (
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IdempotencyConflict,
+    event_id_for,
+    fingerprint,
+    idempotency_store,
+    request_id_for,
+)
 from fastapi.encoders import jsonable_encoder
-from app.hf_client import parse_create_intent
-from datetime import date
+from app.hf_client import close_hf_client, get_hf_client, parse_create_intent, prompt_stats, stream_create_intent
+from app.intent_cache import intent_cache
+from app.intent_rules import rule_stats
+from datetime import date, time
 
 # ============================================================
 # CONFIGURACIÓN BÁSICA
 # ============================================================
-app = FastAPI(title="Asistente de Juntas API", version="0.4")
+# Los clientes (Firestore, Calendar, HF) se crean en el primer uso. Con
+# WARM_CLIENTS_ON_STARTUP=1 se crean aquí, antes de aceptar peticiones.
+WARM_CLIENTS_ON_STARTUP = os.getenv("WARM_CLIENTS_ON_STARTUP", "0") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARM_CLIENTS_ON_STARTUP:
+        await run_in_threadpool(get_db)
+        get_async_calendar()
+        get_hf_client()
+    # Operaciones espejo que quedaron pendientes de la ejecución anterior
+    await run_in_threadpool(mirror_outbox.resume)
+    # Acciones que se guardaron en disco (cola llena o Firestore caído al apagar)
+    await run_in_threadpool(action_log.resume)
+    yield
+    # Cierra los pools de conexiones compartidos (Google Calendar y HF)
+    await close_async_calendar()
+    await close_hf_client()
+    # Escribe las acciones que sigan en cola
+    await run_in_threadpool(action_log.close)
+    await run_in_threadpool(mirror_outbox.close)
+    # Access tokens refrescados de los usuarios que siguen en memoria
+    await run_in_threadpool(credential_pool.close)
+
+
+app = FastAPI(title="Asistente de Juntas API", version="0.4", lifespan=lifespan)
+
+action_log = ActionLogWriter(get_db)
+mirror_outbox = MirrorOutbox(get_db)
 
 
 
 # --- CORS (para permitir llamadas desde el frontend) ---
-import os
+import base64
+import json
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 # Puedes controlar orígenes por variable de entorno (coma-separados)
 _frontend_origins = os.getenv(
@@ -37,6 +108,35 @@ app.add_middleware(
     expose_headers=["*"],            # (opcional) Habilita lectura de headers de respuesta
 )
 
+# gzip para respuestas grandes si el cliente lo acepta (SSE no se comprime)
+RESPONSE_GZIP_MIN_SIZE = int(os.getenv("RESPONSE_GZIP_MIN_SIZE", "1000"))
+if RESPONSE_GZIP_MIN_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_GZIP_MIN_SIZE)
+
+# Latencia y errores por ruta (se exponen en GET /metrics)
+app.add_middleware(MetricsMiddleware)
+# Trazas opt-in (TRACE_SAMPLE_RATE o header X-Debug-Trace con secreto), ver app/tracing.py
+app.add_middleware(TracingMiddleware)
+# Usuario de Calendar por petición (X-Calendar-User verificado; apagado por
+# defecto con CALENDAR_USER_AUTH=off), ver app/credential_pool.py
+app.add_middleware(CalendarUserMiddleware)
+
+
+@app.exception_handler(CalendarRateLimited)
+async def calendar_rate_limited(request, exc: CalendarRateLimited):
+    # Sin cuota de Calendar: el cliente puede reintentar después
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
+@app.exception_handler(CalendarAuthorizationRequired)
+async def calendar_authorization_required(request, exc: CalendarAuthorizationRequired):
+    # Nunca se abre el consentimiento en una petición: se autoriza por la CLI
+    return JSONResponse(status_code=401, content={"detail": str(exc), "user": exc.user_id})
+
 
 # ============================================================
 # MODELOS DE REUNIONES
@@ -93,6 +193,33 @@ class MeetingUpdate(BaseModel):
     end: Optional[DateTimeField] = None
     attendees: Optional[List[Attendee]] = None
 
+# Vista compacta de un evento para GET /v1/meetings: lo que la API ya pide
+# con fields= (CALENDAR_EVENT_FIELDS), sin transparency
+class EventTime(BaseModel):
+    dateTime: Optional[str] = None
+    date: Optional[str] = None        # eventos de día completo
+    timeZone: Optional[str] = None
+
+class EventAttendee(BaseModel):
+    email: Optional[str] = None
+    responseStatus: Optional[str] = None
+
+class EventSummary(BaseModel):
+    id: str
+    status: Optional[str] = None
+    summary: Optional[str] = None
+    location: Optional[str] = None
+    start: Optional[EventTime] = None
+    end: Optional[EventTime] = None
+    hangoutLink: Optional[str] = None
+    attendees: Optional[List[EventAttendee]] = None
+
+class MeetingsOut(BaseModel):
+    ok: bool
+    events: List[EventSummary]
+
+EVENT_SUMMARY_FIELDS = tuple(EventSummary.model_fields)
+
 
 # ============================================================
 # MODELOS DE ACCIONES (NUEVA TABLA)
@@ -123,19 +250,20 @@ def _combine_iso(date: Optional[str], time: Optional[str]) -> str:
 
 
 def log_action(action: str, action_id: str, user: str, date_iso: Optional[str] = None) -> Dict[str, Any]:
-    """Guarda una acción (create/cancel) en la colección 'actions'."""
+    """
+    Registra una acción (create/cancel) en la colección 'actions'. La
+    escritura es diferida (ActionLogWriter): se regresa el registro local.
+    """
+    when = datetime.fromisoformat(date_iso) if date_iso else datetime.now(timezone.utc)
     doc = {
         "action": action,
         "action_id": action_id,
         "user": user,
-        "date": fb_fs.SERVER_TIMESTAMP if not date_iso else datetime.fromisoformat(date_iso)
+        "date": when,
     }
-    ref = db.collection("actions").document()
-    ref.set(doc)
-    saved = ref.get().to_dict()
-    saved["id"] = ref.id
-    d = saved.get("date")
-    saved["date"] = d.isoformat(timespec="seconds") if isinstance(d, datetime) else str(d)
+    saved = dict(doc)
+    saved["id"] = action_log.append(doc)
+    saved["date"] = when.isoformat(timespec="seconds")
     return saved
 
 
@@ -151,78 +279,363 @@ class FreeSlotsRequest(BaseModel):
     duration_minutes: int = 30
 
 @app.post("/v1/meetings/free", response_model=Any)
-def list_free_slots(body: FreeSlotsRequest):
-    slots = find_free_slots_for_day(
+async def list_free_slots(body: FreeSlotsRequest):
+    slots = await afind_free_slots_for_day(
         date=body.date,
         min_slot_minutes=body.duration_minutes,
     )
     return {"ok": True, "slots": slots}
 
-@app.get("/v1/meetings", response_model=Any)
-def list_meetings(fecha: str = Query(..., description="Fecha en formato YYYY-MM-DD")):
+# Rango máximo que se consulta en un solo freebusy.query
+MAX_RANGE_DAYS = 62
+
+class FreeSlotsRangeRequest(BaseModel):
+    start_date: date                      # "2025-11-17"
+    end_date: date                        # "2025-11-21" (incluido)
+    work_start: time = time(9, 0)         # "09:00"
+    work_end: time = time(18, 0)          # "18:00"
+    exclude_weekdays: List[int] = Field(default_factory=lambda: [5, 6], description="0=lunes … 6=domingo")
+    exclude_dates: List[date] = Field(default_factory=list)
+    duration_minutes: int = 30
+
+@app.post("/v1/meetings/free/range", response_model=Any)
+async def list_free_slots_range(body: FreeSlotsRangeRequest):
+    if body.end_date < body.start_date:
+        raise HTTPException(status_code=400, detail="end_date debe ser posterior a start_date")
+    if (body.end_date - body.start_date).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede exceder {MAX_RANGE_DAYS} días")
+    if body.work_end <= body.work_start:
+        raise HTTPException(status_code=400, detail="work_end debe ser posterior a work_start")
+
+    by_day = await afind_free_slots_for_range(
+        start_date=body.start_date,
+        end_date=body.end_date,
+        work_start=body.work_start,
+        work_end=body.work_end,
+        exclude_weekdays=body.exclude_weekdays,
+        exclude_dates=body.exclude_dates,
+        min_slot_minutes=body.duration_minutes,
+    )
+    days = [{"date": day, "slots": slots} for day, slots in by_day.items()]
+    return {"ok": True, "days": days}
+
+# Página máxima de sugerencias: el costo es proporcional a la página, no al rango
+SLOT_SUGGESTIONS_MAX_PAGE = 200
+
+class SlotSuggestionsRequest(BaseModel):
+    start_date: date
+    end_date: date                        # incluido
+    work_start: time = time(9, 0)
+    work_end: time = time(18, 0)
+    exclude_weekdays: List[int] = Field(default_factory=lambda: [5, 6], description="0=lunes … 6=domingo")
+    exclude_dates: List[date] = Field(default_factory=list)
+    duration_minutes: int = Field(30, gt=0)
+    step_minutes: Optional[int] = Field(None, gt=0, description="Entre inicios; por defecto la duración")
+    align_minutes: Optional[int] = Field(None, gt=0, le=1440, description="Redondea el inicio, p.ej. 15 -> :00/:15/:30/:45")
+    limit: int = Field(10, gt=0, le=SLOT_SUGGESTIONS_MAX_PAGE)
+    cursor: Optional[str] = Field(None, description="next_cursor de la página anterior")
+
+# El cursor de sugerencias es opaco: base64 del inicio del último slot entregado
+def _encode_slot_cursor(slot_start: datetime) -> str:
+    return base64.urlsafe_b64encode(slot_start.isoformat().encode()).decode().rstrip("=")
+
+def _decode_slot_cursor(cursor: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after = datetime.fromisoformat(raw.decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if after.tzinfo is None:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return after
+
+@app.post("/v1/meetings/free/suggestions", response_model=Any)
+async def list_slot_suggestions(body: SlotSuggestionsRequest):
+    """
+    Slots reservables de duración fija, en orden cronológico y paginados.
+    Se calculan sólo los de la página pedida; `next_cursor` es null en la última.
+    """
+    if body.end_date < body.start_date:
+        raise HTTPException(status_code=400, detail="end_date debe ser posterior a start_date")
+    if (body.end_date - body.start_date).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede exceder {MAX_RANGE_DAYS} días")
+    if body.work_end <= body.work_start:
+        raise HTTPException(status_code=400, detail="work_end debe ser posterior a work_start")
+
+    slots, has_more = await afind_slot_suggestions(
+        start_date=body.start_date,
+        end_date=body.end_date,
+        work_start=body.work_start,
+        work_end=body.work_end,
+        duration_minutes=body.duration_minutes,
+        step_minutes=body.step_minutes,
+        align_minutes=body.align_minutes,
+        limit=body.limit,
+        after=_decode_slot_cursor(body.cursor) if body.cursor else None,
+        exclude_weekdays=body.exclude_weekdays,
+        exclude_dates=body.exclude_dates,
+    )
+    return {
+        "ok": True,
+        "slots": [{"date": day, "start": start, "end": end} for day, start, end in slots],
+        "next_cursor": _encode_slot_cursor(slots[-1][1]) if has_more else None,
+    }
+
+# La matriz de grupo es asistentes × minutos del rango: límites más cortos que
+# MAX_RANGE_DAYS para que una sola petición no agote la memoria
+GROUP_MAX_ATTENDEES = 200
+GROUP_MAX_RANGE_DAYS = 14
+
+class GroupSlotsRequest(BaseModel):
+    attendees: List[EmailStr] = Field(..., min_length=1, max_length=GROUP_MAX_ATTENDEES,
+                                      description="Calendarios a considerar")
+    start_date: date
+    end_date: date
+    work_start: time = time(9, 0)
+    work_end: time = time(18, 0)
+    exclude_weekdays: List[int] = Field(default_factory=lambda: [5, 6], description="0=lunes … 6=domingo")
+    exclude_dates: List[date] = Field(default_factory=list)
+    duration_minutes: int = Field(30, gt=0)
+    step_minutes: int = Field(15, gt=0)
+    top_k: int = Field(10, gt=0, le=100)
+
+@app.post("/v1/meetings/free/group", response_model=Any)
+async def list_group_slots(body: GroupSlotsRequest):
+    if body.end_date < body.start_date:
+        raise HTTPException(status_code=400, detail="end_date debe ser posterior a start_date")
+    if (body.end_date - body.start_date).days >= GROUP_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede exceder {GROUP_MAX_RANGE_DAYS} días")
+    if body.work_end <= body.work_start:
+        raise HTTPException(status_code=400, detail="work_end debe ser posterior a work_start")
+
+    slots, errors = await afind_group_slots(
+        attendees=list(dict.fromkeys(body.attendees)),
+        start_date=body.start_date,
+        end_date=body.end_date,
+        work_start=body.work_start,
+        work_end=body.work_end,
+        duration_minutes=body.duration_minutes,
+        step_minutes=body.step_minutes,
+        top_k=body.top_k,
+        exclude_weekdays=body.exclude_weekdays,
+        exclude_dates=body.exclude_dates,
+    )
+    return {"ok": True, "slots": slots, "errors": errors}
+
+def _parse_event_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(names) - set(EVENT_SUMMARY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    # "id" siempre se incluye
+    return ["id"] + [f for f in EVENT_SUMMARY_FIELDS if f in names and f != "id"]
+
+@app.get("/v1/meetings", response_model=MeetingsOut, response_model_exclude_none=True)
+async def list_meetings(
+    fecha: str = Query(..., description="Fecha en formato YYYY-MM-DD"),
+    fields: Optional[str] = Query(None, description="Campos de EventSummary separados por coma (p.ej. summary,start,end)"),
+):
+    """Eventos del día como EventSummary; lo que no está en el modelo no se envía."""
     fecha_dt = datetime.strptime(fecha, "%Y-%m-%d").date()
-    evts = list_events_for_date(fecha_dt)
+    projection = _parse_event_fields(fields)
+    evts = await alist_events_for_date(fecha_dt)
+    if projection is not None:
+        # Dicts nuevos: la lista es compartida por el single-flight
+        evts = [{k: e[k] for k in projection if k in e} for e in evts]
     return {"ok": True, "events": evts}
 
+# El documento de cada reunión usa el id del evento de Calendar (las
+# reuniones antiguas se re-indexan con `python -m app.migrate_meetings`).
+# create/update/cancel no esperan a Firestore: la escritura espejo va al
+# outbox local (app/mirror_outbox.py) y se aplica en segundo plano.
+def _encode(model) -> Dict[str, Any]:
+    with span("jsonable_encoder", model=type(model).__name__):
+        return jsonable_encoder(model, exclude_none=True, by_alias=True)
+
+def _meeting_ref(meeting_id: str):
+    return get_db().collection("meetings").document(meeting_id)
+
 @app.post("/v1/meetings", response_model=Any)
-def create_meeting(evt: MeetingEvent):
-    data = jsonable_encoder(evt, exclude_none=True, by_alias=True)
-    doc = create_calendar_meeting(data)
-    ref = db.collection("meetings").document()
-    ref.set(doc)
+async def create_meeting(
+    evt: MeetingEvent,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """
+    Con Idempotency-Key, un reintento regresa la respuesta original (header
+    Idempotent-Replayed: true) sin volver a crear el evento ni el documento.
+    """
+    data = _encode(evt)
+    if not idempotency_key:
+        _set_conference_request_id(data, f"sma-{uuid.uuid4().hex}")
+        return await _create_meeting(data)
+
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+    # La misma clave de dos usuarios son dos reuniones distintas
+    user = current_calendar_user.get()
+    key = f"POST /v1/meetings|{idempotency_key}" if user is None else f"POST /v1/meetings|{user}|{idempotency_key}"
+
+    async def execute():
+        body = dict(data, id=event_id_for(key))
+        _set_conference_request_id(body, request_id_for(key))
+        return 200, await _create_meeting(body)
+
+    try:
+        (status, content), replayed = await idempotency_store.run(key, fingerprint(data), execute)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    headers = {"Idempotent-Replayed": "true"} if replayed else {}
+    return JSONResponse(content=content, status_code=status, headers=headers)
+
+def _set_conference_request_id(data: Dict[str, Any], request_id: str):
+    # El requestId que traiga el cliente (o invente el LLM, p.ej. "sma-12345")
+    # se reemplaza: Calendar ignora solicitudes de conferencia repetidas
+    create = (data.get("conferenceData") or {}).get("createRequest")
+    if create is not None:
+        data["conferenceData"] = {**data["conferenceData"], "createRequest": {**create, "requestId": request_id}}
+
+async def _create_meeting(data: Dict[str, Any]) -> Dict[str, Any]:
+    doc = await acreate_calendar_meeting(data)
+    if doc is None:
+        raise HTTPException(status_code=502, detail="No se pudo crear el evento en Calendar")
+    # INSERT + commit en SQLite: fuera del event loop (puede esperar el lock del outbox)
+    await run_in_threadpool(mirror_outbox.enqueue, doc["id"], MIRROR_SET, doc)
     return {"ok":True, "id": doc["id"]}
 
 @app.delete("/v1/meetings/{meeting_id}", response_model=Any)
-def cancel_meeting(meeting_id: str):
-    cancel_calendar_meeting(meeting_id)
-    docs = db.collection("meetings").where("id", "==", meeting_id).stream()
-
-    batch = db.batch()
-    count = 0
-    
-    for doc in docs:
-        batch.delete(doc.reference)
-        count += 1
-
-    batch.commit()
+async def cancel_meeting(meeting_id: str):
+    if not await acancel_calendar_meeting(meeting_id):
+        # Sin confirmación de Calendar el documento se conserva
+        raise HTTPException(status_code=502, detail="No se pudo cancelar el evento en Calendar")
+    await run_in_threadpool(mirror_outbox.enqueue, meeting_id, MIRROR_DELETE)
     return {"ok":True, "id":meeting_id}
 
 @app.put("/v1/meetings/{meeting_id}", response_model=Any)
-def update_meeting(meeting_id: str, body: MeetingUpdate):
-    data = jsonable_encoder(body, exclude_none=True, by_alias=True)
-    update_calendar_meeting(meeting_id, data)
-    query = db.collection("meetings").where("id", "==", meeting_id).limit(1).stream()
-    doc_ref = None
-    for d in query:
-        doc_ref = d.reference
-        break
-
-    if not doc_ref:
-        raise HTTPException(status_code=404, detail="Meeting no encontrada en Firestore")
-
-    doc_ref.update(data)
+async def update_meeting(meeting_id: str, body: MeetingUpdate):
+    data = _encode(body)
+    try:
+        updated = await aupdate_calendar_meeting(meeting_id, data)
+    except CalendarAPIError:
+        # 5xx, 403 sin permiso...: no es que la reunión no exista
+        raise HTTPException(status_code=502, detail="No se pudo actualizar el evento en Calendar")
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Meeting no encontrada en Calendar")
+
+    # El evento completo que regresa Calendar: el espejo no depende del estado
+    # previo del documento (merge conserva campos propios como "status")
+    await run_in_threadpool(mirror_outbox.enqueue, meeting_id, MIRROR_MERGE, updated)
+
     return {
         "ok": True,
         "id": meeting_id
     }
 
+# ============================================================
+# OPERACIONES EN LOTE
+# ============================================================
+MAX_BATCH_OPERATIONS = 500
+# Ids de evento de Calendar: base32hex (a-v, 0-9) y, en las instancias de
+# eventos recurrentes, "<id>_<fecha>T<hora>Z". Nada que cambie la ruta o rompa
+# el cuerpo multipart del batch (/, ?, espacios, CR/LF...)
+EVENT_ID_PATTERN = re.compile(r"[A-Za-z0-9_]{1,1024}")
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "cancel"]
+    id: Optional[str] = Field(None, description="Id de la reunión (update/cancel)")
+    event: Optional[MeetingEvent] = Field(None, description="Reunión a crear (create)")
+    updates: Optional[MeetingUpdate] = Field(None, description="Campos a cambiar (update)")
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+def _batch_call(op: BatchOperation):
+    """Traduce una operación a su llamada de Calendar; None si está incompleta."""
+    if op.op == "create" and op.event is not None:
+        body = _encode(op.event)
+        return BatchCall("POST", "/calendars/primary/events", {"conferenceDataVersion": 1}, body)
+    if op.op == "update" and op.id and op.updates is not None:
+        body = _encode(op.updates)
+        return BatchCall("PATCH", f"/calendars/primary/events/{quote(op.id, safe='')}",
+                         {"conferenceDataVersion": 1}, body)
+    if op.op == "cancel" and op.id:
+        return BatchCall("DELETE", f"/calendars/primary/events/{quote(op.id, safe='')}", {"sendUpdates": "all"})
+    return None
+
+@app.post("/v1/meetings/batch", response_model=Any)
+async def batch_meetings(body: BatchRequest):
+    """
+    Crea, actualiza o cancela varias reuniones a la vez: Calendar recibe
+    peticiones batch de hasta 50 llamadas y el espejo en Firestore va al
+    outbox en una sola transacción. Cada operación trae su propio resultado.
+    """
+    results: List[Dict[str, Any]] = []
+    calls, call_index = [], []
+    for i, op in enumerate(body.operations):
+        results.append({"index": i, "op": op.op, "id": op.id, "ok": False})
+        if op.id is not None and not EVENT_ID_PATTERN.fullmatch(op.id):
+            results[i].update(status=400, error="Id de evento inválido")
+            continue
+        call = _batch_call(op)
+        if call is None:
+            results[i].update(status=400, error="Operación incompleta")
+            continue
+        calls.append(call)
+        call_index.append(i)
+
+    responses = await abatch_calendar_operations(calls) if calls else []
+
+    # Lo que Calendar confirmó va al mismo outbox que los endpoints individuales:
+    # así el espejo de cada reunión respeta el orden de sus operaciones
+    mirror_ops = []
+    for i, (status, payload) in zip(call_index, responses):
+        op = body.operations[i]
+        results[i]["status"] = status
+        if status >= 300:
+            results[i]["error"] = payload
+            continue
+        results[i]["ok"] = True
+        if op.op == "create":
+            results[i]["id"] = payload["id"]
+            mirror_ops.append((payload["id"], MIRROR_SET, payload))
+        elif op.op == "update":
+            # El evento completo que regresa Calendar, igual que PUT
+            mirror_ops.append((op.id, MIRROR_MERGE, payload))
+        else:
+            mirror_ops.append((op.id, MIRROR_DELETE, None))
+
+    if mirror_ops:
+        await run_in_threadpool(mirror_outbox.enqueue_many, mirror_ops)
+
+    return {"ok": all(r["ok"] for r in results), "results": results}
+
+def _mirrored_meeting(meeting_id: str) -> Optional[Dict[str, Any]]:
+    """La reunión como quedará en Firestore: el documento más lo pendiente en el outbox."""
+    pending = mirror_outbox.pending_for(meeting_id)
+    if pending is not None and pending[0] != MIRROR_MERGE:
+        # set/delete pendiente: no depende de lo que haya hoy en Firestore
+        return apply_mirror_op(None, *pending)
+    with track("firestore", "get"):
+        snap = _meeting_ref(meeting_id).get()
+    doc = snap.to_dict() if snap.exists else None
+    return apply_mirror_op(doc, *pending) if pending is not None else doc
+
 @app.post("/v1/meetings/{meeting_id}/cancel")
 def cancel_meeting(meeting_id: str, body: ActionLogCreate):
-    ref = db.collection("meetings").document(meeting_id)
-    snap = ref.get()
-    if not snap.exists:
+    current = _mirrored_meeting(meeting_id)
+    if current is None:
         raise HTTPException(status_code=404, detail="Meeting not found")
 
-    ref.update({
-        "status": "canceled",
-        "canceled_at": fb_fs.SERVER_TIMESTAMP
-    })
+    # Por el outbox, como el resto de escrituras del espejo: no se adelanta a
+    # un set/merge de la misma reunión que siga pendiente
+    changes = {"status": "canceled", "canceled_at": datetime.now(timezone.utc)}
+    mirror_outbox.enqueue(meeting_id, MIRROR_MERGE, changes)
 
     # 🔹 Registrar acción CANCEL
     log_action("cancel", meeting_id, body.user)
 
-    updated = ref.get().to_dict()
-    updated["id"] = meeting_id
+    updated = {**current, **changes, "id": meeting_id}
     for k in ("created_at", "start", "end", "canceled_at"):
         v = updated.get(k)
         if isinstance(v, datetime):
@@ -230,18 +643,104 @@ def cancel_meeting(meeting_id: str, body: ActionLogCreate):
     return {"ok": True, "meeting": updated}
 
 
+# Paginación por cursor: orden (date desc, id desc) y el cursor es opaco
+# (base64 de [fecha, id] del último documento de la página)
+ACTION_FIELDS = ("action", "action_id", "user", "date")
+ACTIONS_MAX_PAGE = 500
+ACTIONS_EXPORT_PAGE = 500
+# Igual a firestore.Query.DESCENDING, sin importar el SDK para obtenerlo
+DESCENDING = "DESCENDING"
+
+def _encode_cursor(snap) -> str:
+    raw = json.dumps([snap.get("date").isoformat(), snap.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date_iso, doc_id = json.loads(raw)
+        return {"date": datetime.fromisoformat(date_iso), "__name__": doc_id}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(names) - set(ACTION_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(sorted(unknown))}")
+    # "date" siempre se lee: hace falta para el cursor
+    return sorted(set(names) | {"date"})
+
+def _actions_query(fields: Optional[List[str]], after: Optional[Dict[str, Any]], limit: int):
+    query = (
+        get_db().collection("actions")
+        .order_by("date", direction=DESCENDING)
+        .order_by("__name__", direction=DESCENDING)
+    )
+    if fields is not None:
+        query = query.select(fields)
+    if after is not None:
+        query = query.start_after(after)
+    return query.limit(limit)
+
+def _action_out(snap, fields: Optional[List[str]], requested: Optional[str]) -> Dict[str, Any]:
+    data = snap.to_dict()
+    if fields is not None and "date" not in requested.split(","):
+        data.pop("date", None)
+    data["id"] = snap.id
+    dt = data.get("date")
+    if isinstance(dt, datetime):
+        data["date"] = dt.isoformat(timespec="seconds")
+    return data
+
 @app.get("/v1/actions", response_model=List[ActionLogOut])
-def list_actions(limit: int = 50):
-    docs = db.collection("actions").order_by("date", direction=fb_fs.Query.DESCENDING).limit(limit).stream()
-    out = []
-    for d in docs:
-        data = d.to_dict()
-        data["id"] = d.id
-        dt = data.get("date")
-        if isinstance(dt, datetime):
-            data["date"] = dt.isoformat(timespec="seconds")
-        out.append(data)
-    return out
+def list_actions(
+    limit: Optional[int] = Query(None, ge=1, description=f"Por página (máx. {ACTIONS_MAX_PAGE}, 50 por defecto); en ndjson, total a exportar"),
+    cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    fields: Optional[str] = Query(None, description="Campos a incluir, separados por coma (p.ej. action,user)"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson: un documento por línea, en streaming"),
+):
+    """
+    Acciones más recientes primero. En json la siguiente página viene en el
+    header X-Next-Cursor; en ndjson se recorre toda la colección (o hasta
+    `limit`) página por página con memoria constante.
+    """
+    # Que lo recién registrado (aún en cola) aparezca en el listado
+    action_log.flush()
+    projection = _parse_fields(fields)
+    after = _decode_cursor(cursor) if cursor else None
+
+    if format == "ndjson":
+        return StreamingResponse(_export_actions(projection, fields, after, limit),
+                                 media_type="application/x-ndjson")
+
+    page_size = min(limit or 50, ACTIONS_MAX_PAGE)
+    out, last = [], None
+    with track("firestore", "query"):
+        for snap in _actions_query(projection, after, page_size).stream():
+            out.append(_action_out(snap, projection, fields))
+            last = snap
+    headers = {"X-Next-Cursor": _encode_cursor(last)} if last is not None and len(out) == page_size else {}
+    return JSONResponse(content=out, headers=headers)
+
+def _export_actions(projection, requested, after, limit):
+    """Documento por documento conforme Firestore los entrega (corre en el threadpool)."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = ACTIONS_EXPORT_PAGE if remaining is None else min(remaining, ACTIONS_EXPORT_PAGE)
+        count, last = 0, None
+        for snap in _actions_query(projection, after, page_size).stream():
+            yield json.dumps(_action_out(snap, projection, requested), ensure_ascii=False) + "\n"
+            count, last = count + 1, snap
+        if remaining is not None:
+            remaining -= count
+        if count < page_size:
+            return
+        after = {"date": last.get("date"), "__name__": last.id}
+    # Se cortó por `limit`: última línea con el cursor para continuar
+    yield json.dumps({"next_cursor": _encode_cursor(last)}) + "\n"
 
 
 # ============================================================
@@ -253,21 +752,81 @@ class IntentIn(BaseModel):
 
 
 @app.post("/v1/intent/create/parse")
-def intent_create_parse(payload: IntentIn):
+async def intent_create_parse(payload: IntentIn):
     """Convierte texto libre a JSON de reunión usando el modelo HF."""
-    data = parse_create_intent(payload.text)
+    data = await parse_create_intent(payload.text)
     if "__error__" in data:
         raise HTTPException(status_code=502, detail=data["__error__"])
     return {"intent": data}
 
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/intent/create/parse/stream")
+async def intent_create_parse_stream(payload: IntentIn):
+    """
+    Igual que /v1/intent/create/parse pero con Server-Sent Events: un evento
+    `token` por fragmento generado y al final `intent` (o `error`).
+    """
+    async def events():
+        async for kind, value in stream_create_intent(payload.text):
+            if kind == "token":
+                yield _sse("token", {"text": value})
+            elif kind == "intent":
+                yield _sse("intent", {"intent": value})
+            else:
+                yield _sse("error", {"detail": value})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/v1/mirror/outbox/stats")
+def mirror_outbox_stats():
+    """Operaciones espejo aplicadas, descartadas por una posterior y pendientes."""
+    return mirror_outbox.snapshot()
+
+@app.get("/v1/calendar/credentials/stats")
+def calendar_credentials_stats():
+    """Usuarios en memoria y guardados, refresh hechos y expulsiones del LRU."""
+    return credential_pool.snapshot()
+
+@app.get("/v1/calendar/quota/stats")
+def calendar_quota_stats():
+    """Llamadas esperando cuota por prioridad y tokens disponibles por bucket."""
+    return calendar_scheduler.snapshot()
+
+
+@app.get("/v1/intent/cache/stats")
+def intent_cache_stats():
+    """Aciertos/fallos de la cache de intenciones y del parser por reglas."""
+    return {**intent_cache.snapshot(), "fast_path": dict(rule_stats)}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Latencia, errores y peticiones en curso por ruta y por dependencia (formato Prometheus)."""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/v1/intent/llm/stats")
+def intent_llm_stats():
+    """Llamadas, reintentos, latencias (p50/p95/p99) y tokens por etapa contra el router de HF."""
+    return {**get_hf_client().latency_snapshot(), "prompts": prompt_stats}
+
+
 @app.post("/v1/meetings/create_from_text")
-def create_meeting_from_text(payload: IntentIn):
+async def create_meeting_from_text(payload: IntentIn):
     """
     Parsear texto natural con LLM y crear reunión directamente.
     Ej: 'agenda mañana 16:00 por 45 min con maria@x.com y hector@y.com, tema roadmap'
     """
-    intent = parse_create_intent(payload.text)
+    intent = await parse_create_intent(payload.text)
     if "title" not in intent or not intent["title"]:
         return {"ok": False, "error": "No se detectó 'title' en el texto."}
 
@@ -293,12 +852,16 @@ def create_meeting_from_text(payload: IntentIn):
         "created_at": datetime.now().isoformat(timespec="seconds"),
     }
 
-    ref = db.collection("meetings").document()
-    ref.set(doc)
-    doc["id"] = ref.id
+    def save():
+        ref = get_db().collection("meetings").document()
+        with track("firestore", "set"):
+            ref.set(doc)
+        doc["id"] = ref.id
+
+        # Registrar acción CREATE (automática)
+        actor = (doc.get("attendees") or ["system@local"])[0]
+        log_action("create", doc["id"], actor)
 
-    # Registrar acción CREATE (automática)
-    actor = (doc.get("attendees") or ["system@local"])[0]
-    log_action("create", doc["id"], actor)
+    await run_in_threadpool(save)
 
     return {"ok": True, "meeting": doc, "intent": intent}
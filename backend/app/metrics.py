@@ -0,0 +1,235 @@
+# ============================================================
+# Métricas en formato de texto de Prometheus
+# ============================================================
+#
+# Contadores, gauges e histogramas mínimos (sin dependencias) para ver a
+# dónde se va el tiempo de cada petición: Calendar, Firestore o el LLM.
+# Registrar una observación es un par de búsquedas en dict y un bisect bajo
+# un lock, así que puede quedarse activo en producción. GET /metrics expone
+# todo con render().
+#
+#   with track("firestore", "set"):
+#       ref.set(doc)
+#
+#   async with track("calendar", "events.insert"):
+#       ...
+
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.tracing import current_trace, span
+
+# Segundos: desde lecturas en memoria hasta llamadas lentas al LLM
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _label_str(self, values: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{self._label_str(k)} {v:g}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Por serie: [conteo por bucket (no acumulado)..., +Inf], suma
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *labels: str):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{self._label_str(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{self._label_str(labels)} {cumulative}")
+        return lines
+
+
+# ------------------------------------------------------------
+# Registro del proceso
+# ------------------------------------------------------------
+_registry: List[_Metric] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help_text, labels))
+
+
+def gauge(name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, help_text, labels))
+
+
+def histogram(name: str, help_text: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------------------------------------------------
+# Métricas de la app
+# ------------------------------------------------------------
+HTTP_REQUESTS = counter("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "Latencia por ruta", ("method", "route"))
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "Peticiones HTTP en curso")
+
+UPSTREAM_LATENCY = histogram(
+    "upstream_request_duration_seconds", "Latencia por llamada a dependencias", ("service", "operation"),
+)
+UPSTREAM_ERRORS = counter("upstream_errors_total", "Llamadas a dependencias con error", ("service", "operation"))
+UPSTREAM_IN_FLIGHT = gauge("upstream_requests_in_flight", "Llamadas a dependencias en curso", ("service",))
+
+
+class track:
+    """
+    Mide una llamada a una dependencia (sirve con `with` y `async with`).
+    Una excepción cuenta como error y se propaga. Si la petición se está
+    trazando, la llamada también queda como span ("calendar.events.insert").
+    """
+
+    __slots__ = ("service", "operation", "_t0", "_span")
+
+    def __init__(self, service: str, operation: str):
+        self.service = service
+        self.operation = operation
+        self._t0 = 0.0
+        self._span = None
+
+    def __enter__(self):
+        UPSTREAM_IN_FLIGHT.inc(self.service)
+        if current_trace() is not None:
+            self._span = span(f"{self.service}.{self.operation}").__enter__()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        UPSTREAM_LATENCY.observe(time.perf_counter() - self._t0, self.service, self.operation)
+        if self._span is not None:
+            self._span.__exit__(exc_type, exc, tb)
+        UPSTREAM_IN_FLIGHT.dec(self.service)
+        if exc_type is not None:
+            UPSTREAM_ERRORS.inc(self.service, self.operation)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, que agrega overhead y
+    bufferiza streams). La ruta se etiqueta con su plantilla
+    (/v1/meetings/{meeting_id}) para no crear una serie por id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            HTTP_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            HTTP_LATENCY.observe(elapsed, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status["code"]))
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    path: Optional[str] = getattr(route, "path", None)
+    # Rutas que no existen se agrupan para acotar la cardinalidad
+    return path or "unmatched"
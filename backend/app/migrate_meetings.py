@@ -0,0 +1,113 @@
+# ============================================================
+# Migración: re-indexar "meetings" por id de evento de Calendar
+# ============================================================
+#
+# Antes las reuniones se guardaban con un id aleatorio (document()) y el id
+# del evento en el campo "id". Este comando copia cada documento a
+# meetings/<id del evento> y borra el original, con commits de db.batch().
+# Si el evento tiene varios documentos se copia el más reciente ("updated",
+# luego "created_at"); si meetings/<id del evento> ya existe (lo escribió el
+# código nuevo) no se pisa: sólo se le agregan los campos que no tenga.
+#
+#   cd backend
+#   python -m app.migrate_meetings --dry-run
+#   python -m app.migrate_meetings
+
+import argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+FIRESTORE_BATCH_LIMIT = 500
+
+_OLDEST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return _OLDEST
+    if not isinstance(value, datetime):
+        return _OLDEST
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def _recency(data: Dict[str, Any]):
+    """Orden entre duplicados: "updated" de Calendar y luego "created_at"."""
+    return _as_datetime(data.get("updated")), _as_datetime(data.get("created_at"))
+
+
+def migrate(db, dry_run: bool = False, batch_limit: int = FIRESTORE_BATCH_LIMIT) -> Dict[str, int]:
+    stats = {"scanned": 0, "migrated": 0, "merged_into_existing": 0, "duplicates": 0,
+             "already_keyed": 0, "without_id": 0, "commits": 0}
+    meetings = db.collection("meetings")
+
+    # Documentos con id aleatorio, agrupados por evento
+    legacy: Dict[str, List[Any]] = {}
+    for snap in meetings.stream():
+        stats["scanned"] += 1
+        data = snap.to_dict() or {}
+        event_id = data.get("id")
+        if not event_id:
+            # p.ej. reuniones creadas desde texto, que no tienen evento
+            stats["without_id"] += 1
+        elif snap.id == event_id:
+            stats["already_keyed"] += 1
+        else:
+            legacy.setdefault(event_id, []).append(snap)
+
+    batch, writes = db.batch(), 0
+    event_ids = list(legacy)
+    for start in range(0, len(event_ids), batch_limit):
+        chunk = event_ids[start:start + batch_limit]
+        # El código nuevo pudo escribir meetings/<evento> (create, o un merge del
+        # outbox tras un update): leerlos justo antes de decidir
+        existing = {snap.id: snap.to_dict() for snap in db.get_all([meetings.document(e) for e in chunk])
+                    if snap.exists}
+        for event_id in chunk:
+            snaps = sorted(legacy[event_id], key=lambda snap: _recency(snap.to_dict() or {}), reverse=True)
+            newest = snaps[0].to_dict() or {}
+            stats["duplicates"] += len(snaps) - 1
+            target = existing.get(event_id)
+            if target is None:
+                stats["migrated"] += 1
+                write = newest
+            else:
+                # Lo que ya está bajo el id del evento es más reciente: sólo se
+                # completan los campos que le falten
+                stats["merged_into_existing"] += 1
+                write = {k: v for k, v in newest.items() if k not in target}
+            if dry_run:
+                continue
+            needed = len(snaps) + (1 if write else 0)
+            if writes and writes + needed > batch_limit:
+                batch.commit()
+                stats["commits"] += 1
+                batch, writes = db.batch(), 0
+            if write:
+                batch.set(meetings.document(event_id), write, merge=target is not None)
+            for snap in snaps:
+                batch.delete(snap.reference)
+            writes += needed
+
+    if writes and not dry_run:
+        batch.commit()
+        stats["commits"] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-indexa la colección meetings por id de evento")
+    parser.add_argument("--dry-run", action="store_true", help="sólo contar, sin escribir")
+    args = parser.parse_args()
+
+    from app.firebase_config import get_db
+
+    stats = migrate(get_db(), dry_run=args.dry_run)
+    prefix = "[MIGRACIÓN] (dry-run) " if args.dry_run else "[MIGRACIÓN] "
+    print(prefix + ", ".join(f"{k}={v}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
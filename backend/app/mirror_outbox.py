@@ -0,0 +1,350 @@
+# ============================================================
+# Outbox local para reflejar reuniones en Firestore
+# ============================================================
+#
+# create/update/cancel ya no esperan a Firestore: en cuanto Calendar confirma
+# la escritura, la operación espejo se guarda en un SQLite local (outbox) y la
+# petición responde. Un hilo en segundo plano la aplica en Firestore con
+# commits de db.batch() y reintentos con backoff; lo que quede pendiente al
+# apagar (o tras una caída del proceso) se aplica al volver a arrancar.
+#
+# Orden por reunión: las operaciones pendientes de una misma reunión se
+# combinan en una sola escritura (un set seguido de merges es un set con los
+# campos combinados; un delete descarta lo anterior), así que el resultado es
+# el mismo que aplicarlas una por una. Con varios workers compartiendo el
+# archivo, cada uno reclama reuniones con un lease para no aplicarlas dos
+# veces ni fuera de orden.
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.metrics import counter, gauge, histogram, track
+
+MIRROR_OUTBOX_DB = os.getenv(
+    "MIRROR_OUTBOX_DB", str(Path(__file__).resolve().parents[1] / "mirror_outbox.sqlite")
+)
+MIRROR_OUTBOX_BATCH_SIZE = int(os.getenv("MIRROR_OUTBOX_BATCH_SIZE", "200"))
+MIRROR_OUTBOX_POLL_INTERVAL = float(os.getenv("MIRROR_OUTBOX_POLL_INTERVAL", "0.5"))
+MIRROR_OUTBOX_LEASE_SECONDS = float(os.getenv("MIRROR_OUTBOX_LEASE_SECONDS", "60"))
+MIRROR_OUTBOX_BACKOFF_CAP = float(os.getenv("MIRROR_OUTBOX_BACKOFF_CAP", "300"))
+# NORMAL (WAL) sobrevive a una caída del proceso; FULL también a una del sistema
+MIRROR_OUTBOX_SYNCHRONOUS = os.getenv("MIRROR_OUTBOX_SYNCHRONOUS", "NORMAL")
+
+FIRESTORE_BATCH_LIMIT = 500
+
+# Operaciones espejo
+SET = "set"
+MERGE = "merge"
+DELETE = "delete"
+
+PENDING = gauge("mirror_outbox_pending", "Operaciones espejo pendientes en el outbox")
+APPLIED = counter("mirror_outbox_applied_total", "Operaciones espejo aplicadas en Firestore")
+FAILED = counter("mirror_outbox_failed_commits_total", "Commits del outbox que fallaron")
+LAG = histogram("mirror_outbox_lag_seconds", "Tiempo entre encolar y aplicar en Firestore",
+                buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    meeting_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_meeting ON outbox (meeting_id, seq);
+"""
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    # Las fechas se guardan como {"$date": iso} para volver a ser datetime al aplicarlas
+    def default(value):
+        return {"$date": value.isoformat()} if isinstance(value, datetime) else str(value)
+    return json.dumps(data, ensure_ascii=False, default=default)
+
+
+def _loads(text: str) -> Dict[str, Any]:
+    def hook(obj):
+        return datetime.fromisoformat(obj["$date"]) if len(obj) == 1 and "$date" in obj else obj
+    return json.loads(text, object_hook=hook)
+
+
+def _merge(base: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Como set(..., merge=True) de Firestore: los mapas anidados se combinan."""
+    out = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = _merge(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+
+def _fold(rows) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Combina las operaciones (op, data, created) de una reunión, en orden, en una sola."""
+    op, doc = MERGE, {}
+    for row_op, row_data, _ in rows:
+        data = _loads(row_data) if row_data is not None else None
+        if row_op == DELETE:
+            op, doc = DELETE, None
+        elif row_op == SET:
+            op, doc = SET, data
+        elif op == DELETE:
+            # Un merge sobre un documento borrado lo crea sólo con esos campos
+            op, doc = SET, data
+        else:
+            doc = _merge(doc, data)
+    return op, doc
+
+
+def apply_op(doc: Optional[Dict[str, Any]], op: str, data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """El documento que queda al aplicar la operación (None si no existe)."""
+    if op == DELETE:
+        return None
+    if op == SET or doc is None:
+        return data
+    return _merge(doc, data)
+
+
+class MirrorOutbox:
+    def __init__(self, db_getter, db_path: str = MIRROR_OUTBOX_DB, collection: str = "meetings",
+                 batch_size: int = MIRROR_OUTBOX_BATCH_SIZE,
+                 poll_interval: float = MIRROR_OUTBOX_POLL_INTERVAL):
+        # Función que regresa el cliente de Firestore (se inicializa al primer uso)
+        self._db_getter = db_getter
+        self._path = db_path
+        self._collection = collection
+        self._batch_size = min(batch_size, FIRESTORE_BATCH_LIMIT)
+        self._poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        # Serializa el uso de la conexión SQLite entre hilos
+        self._conn_lock = threading.Lock()
+        self._cond = threading.Condition()
+        # Serializa las rondas de aplicación (hilo de fondo y flush() explícitos)
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.stats = {"enqueued": 0, "applied": 0, "superseded": 0, "commits": 0, "failed_commits": 0}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # La conexión SQLite y el hilo del padre no sirven en el hijo
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={MIRROR_OUTBOX_SYNCHRONOUS}")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # --------------------------------------------------------
+    # Encolar
+    # --------------------------------------------------------
+    def enqueue(self, meeting_id: str, op: str, data: Optional[Dict[str, Any]] = None):
+        """Guarda la operación espejo (durable) y despierta al hilo de fondo."""
+        self.enqueue_many([(meeting_id, op, data)])
+
+    def enqueue_many(self, ops: Iterable[Tuple[str, str, Optional[Dict[str, Any]]]]):
+        """Como enqueue() para varias (meeting_id, op, data), en una sola transacción."""
+        now = time.time()
+        rows = [(meeting_id, op, _dumps(data) if data is not None else None, now)
+                for meeting_id, op, data in ops]
+        if not rows:
+            return
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO outbox (meeting_id, op, data, created) VALUES (?, ?, ?, ?)", rows
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self.stats["enqueued"] += len(rows)
+        PENDING.inc(amount=len(rows))
+        with self._cond:
+            self._ensure_thread()
+            self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._closed:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="mirror-outbox", daemon=True)
+            self._thread.start()
+
+    def resume(self):
+        """Al arrancar: si quedó algo pendiente de una ejecución anterior, aplicarlo."""
+        if not Path(self._path).exists():
+            return
+        pending = self.pending()
+        PENDING.set(pending)
+        if pending:
+            print(f"[MIRROR_OUTBOX] {pending} operaciones pendientes de una ejecución anterior")
+            with self._cond:
+                self._ensure_thread()
+
+    # --------------------------------------------------------
+    # Aplicar
+    # --------------------------------------------------------
+    def _run(self):
+        while True:
+            try:
+                applied = self.flush()
+            except Exception as e:
+                # p.ej. SQLite bloqueado por otro worker: reintentar en la siguiente vuelta
+                print(f"[MIRROR_OUTBOX] Error leyendo el outbox: {e}")
+                applied = 0
+            with self._cond:
+                if self._closed:
+                    return
+                if not applied:
+                    # Nada listo: esperar nuevas operaciones o a que venza un backoff
+                    self._cond.wait(self._poll_interval)
+
+    def _claim(self) -> Dict[str, tuple]:
+        """Reclama las reuniones listas: {meeting_id: (última seq, op combinada, data, created)}."""
+        now = time.time()
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                heads = conn.execute(
+                    "SELECT meeting_id, MAX(seq) FROM outbox GROUP BY meeting_id"
+                    " HAVING MAX(next_attempt) <= ? AND MAX(lease_until) <= ?"
+                    " ORDER BY MIN(seq) LIMIT ?",
+                    (now, now, self._batch_size),
+                ).fetchall()
+                claimed = {}
+                for meeting_id, seq in heads:
+                    conn.execute(
+                        "UPDATE outbox SET lease_until = ? WHERE meeting_id = ? AND seq <= ?",
+                        (now + MIRROR_OUTBOX_LEASE_SECONDS, meeting_id, seq),
+                    )
+                    rows = conn.execute(
+                        "SELECT op, data, created FROM outbox WHERE meeting_id = ? AND seq <= ? ORDER BY seq",
+                        (meeting_id, seq),
+                    ).fetchall()
+                    op, data = _fold(rows)
+                    claimed[meeting_id] = (seq, op, data, rows[0][2])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    def flush(self) -> int:
+        """Aplica lo que esté listo; regresa cuántas reuniones se reflejaron."""
+        total = 0
+        with self._flush_lock:
+            while True:
+                claimed = self._claim()
+                if not claimed:
+                    return total
+                try:
+                    db = self._db_getter()
+                    batch = db.batch()
+                    coll = db.collection(self._collection)
+                    for meeting_id, (_, op, data, _) in claimed.items():
+                        ref = coll.document(meeting_id)
+                        if op == DELETE:
+                            batch.delete(ref)
+                        else:
+                            batch.set(ref, data, merge=(op == MERGE))
+                    with track("firestore", "batch.commit"):
+                        batch.commit()
+                except Exception as e:
+                    self._release(claimed, str(e))
+                    return total
+                self._done(claimed)
+                total += len(claimed)
+
+    def _done(self, claimed: Dict[str, tuple]):
+        now = time.time()
+        removed = 0
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            for meeting_id, (seq, _, _, created) in claimed.items():
+                removed += conn.execute(
+                    "DELETE FROM outbox WHERE meeting_id = ? AND seq <= ?", (meeting_id, seq)
+                ).rowcount
+                LAG.observe(max(0.0, now - created))
+            conn.execute("COMMIT")
+        self.stats["commits"] += 1
+        self.stats["applied"] += len(claimed)
+        self.stats["superseded"] += removed - len(claimed)
+        APPLIED.inc(amount=len(claimed))
+        PENDING.dec(amount=removed)
+
+    def _release(self, claimed: Dict[str, tuple], error: str):
+        self.stats["failed_commits"] += 1
+        FAILED.inc()
+        print(f"[MIRROR_OUTBOX] Error aplicando {len(claimed)} operaciones: {error}")
+        now = time.time()
+        with self._conn_lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            for meeting_id, (seq, _, _, _) in claimed.items():
+                attempts = conn.execute(
+                    "SELECT attempts FROM outbox WHERE seq = ?", (seq,)
+                ).fetchone()[0] + 1
+                # Backoff exponencial con jitter; nunca se descarta (es durable)
+                delay = random.uniform(0.5, 1.0) * min(MIRROR_OUTBOX_BACKOFF_CAP, 2 ** attempts)
+                conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt = ?, lease_until = 0, last_error = ?"
+                    " WHERE meeting_id = ? AND seq <= ?",
+                    (attempts, now + delay, error[:500], meeting_id, seq),
+                )
+            conn.execute("COMMIT")
+
+    # --------------------------------------------------------
+    # Ciclo de vida
+    # --------------------------------------------------------
+    def close(self, timeout: float = 10.0):
+        """Intenta aplicar lo pendiente; lo que no alcance queda en SQLite."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._conn is not None:
+            self.flush()
+            left = self.pending()
+            if left:
+                print(f"[MIRROR_OUTBOX] {left} operaciones quedan en {self._path} para el próximo arranque")
+
+    def pending_for(self, meeting_id: str) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Las operaciones aún sin aplicar de una reunión, combinadas; None si no hay."""
+        with self._conn_lock:
+            rows = self._connection().execute(
+                "SELECT op, data, created FROM outbox WHERE meeting_id = ? ORDER BY seq", (meeting_id,)
+            ).fetchall()
+        return _fold(rows) if rows else None
+
+    def pending(self) -> int:
+        with self._conn_lock:
+            return self._connection().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "pending": self.pending(), "path": self._path}
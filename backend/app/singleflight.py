@@ -0,0 +1,96 @@
+# ============================================================
+# Single-flight: una sola llamada para lecturas idénticas simultáneas
+# ============================================================
+#
+# A las 9 am muchos usuarios piden lo mismo (GET /v1/meetings?fecha=hoy,
+# POST /v1/meetings/free). Las llamadas con la misma clave que coinciden en
+# el tiempo comparten una sola ejecución y su resultado; además el resultado
+# se reutiliza durante COALESCE_WINDOW_SECONDS. Las escrituras propias
+# (crear/actualizar/cancelar) descartan los resultados recientes.
+#
+# Los resultados se comparten entre peticiones: quien los reciba no debe
+# modificarlos.
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.metrics import counter, gauge
+
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "2"))
+COALESCE_MAX_ENTRIES = int(os.getenv("COALESCE_MAX_ENTRIES", "1024"))
+
+COALESCED = counter("coalesce_calls_total", "Lecturas por resultado del single-flight",
+                    ("flight", "outcome"))
+COALESCE_RATIO = gauge("coalesce_ratio", "Fracción de lecturas que no llamaron a la dependencia",
+                       ("flight",))
+
+
+class SingleFlight:
+    def __init__(self, name: str, window: float = COALESCE_WINDOW_SECONDS,
+                 max_entries: int = COALESCE_MAX_ENTRIES):
+        self.name = name
+        self._window = window
+        self._max_entries = max_entries
+        # Sólo se tocan desde el event loop
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Sube con cada invalidate(): lo que empezó antes no se guarda
+        self._generation = 0
+        self.stats = {"executed": 0, "joined": 0, "reused": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self._window > 0:
+            entry = self._recent.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[0] <= self._window:
+                    self._count("reused")
+                    return entry[1]
+                del self._recent[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._count("joined")
+        else:
+            self._count("executed")
+            # La llamada corre en su propia tarea: si el cliente que la
+            # originó se desconecta, los demás siguen esperando el resultado
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, key=key, gen=self._generation: self._done(key, t, gen))
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task, generation: int):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self._window <= 0 or generation != self._generation:
+            return
+        self._recent[key] = (time.monotonic(), task.result())
+        self._recent.move_to_end(key)
+        while len(self._recent) > self._max_entries:
+            self._recent.popitem(last=False)
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        COALESCED.inc(self.name, outcome)
+        total = self.stats["executed"] + self.stats["joined"] + self.stats["reused"]
+        COALESCE_RATIO.set((total - self.stats["executed"]) / total, self.name)
+
+    def invalidate(self):
+        """
+        Descarta los resultados recientes. Las llamadas en curso terminan para
+        quien ya las espera, pero las nuevas peticiones hacen su propia llamada.
+        """
+        self._generation += 1
+        self._recent.clear()
+        self._in_flight.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = sum(self.stats.values())
+        ratio = (total - self.stats["executed"]) / total if total else 0.0
+        return {**self.stats, "in_flight": len(self._in_flight), "recent": len(self._recent),
+                "window_seconds": self._window, "coalescing_ratio": round(ratio, 4)}
@@ -0,0 +1,356 @@
+# ============================================================
+# Trazas por petición (opt-in) y profiler por muestreo
+# ============================================================
+#
+# Para ver en qué se va el tiempo dentro de UNA petición: refresh de
+# credenciales, build() del cliente de Calendar, jsonable_encoder, llamadas a
+# Calendar / Firestore / HF... Cada petición muestreada arma un árbol de spans
+# (contextvars, así que sigue a la petición a través de run_in_threadpool) y,
+# si se pide, un perfil por muestreo de las pilas de sus hilos. Se exporta a
+# TRACE_DIR en formato Chrome trace (chrome://tracing, ui.perfetto.dev).
+# El hilo del event loop es compartido: su perfil incluye también lo que
+# hagan otras peticiones concurrentes en ese momento.
+#
+# Se activa al azar con TRACE_SAMPLE_RATE / TRACE_PROFILE_RATE o, si se
+# habilita (TRACE_HEADER_ENABLED=1 y TRACE_SECRET), por petición con el header
+# X-Debug-Trace ("1" = spans, "profile" = spans + perfil) acompañado de
+# X-Debug-Trace-Token con el secreto compartido. En TRACE_DIR se conservan
+# sólo las TRACE_MAX_FILES trazas más recientes. Sin traza activa, span() es
+# una lectura de ContextVar.
+#
+#   with span("calendar.build"):
+#       ...
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import anyio
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_PROFILE_RATE = float(os.getenv("TRACE_PROFILE_RATE", "0"))
+TRACE_HEADER = os.getenv("TRACE_HEADER", "X-Debug-Trace")
+# El header sólo se respeta con TRACE_HEADER_ENABLED=1 y el secreto correcto:
+# sin él cualquier cliente podría escribir archivos en el servidor
+TRACE_HEADER_ENABLED = os.getenv("TRACE_HEADER_ENABLED", "0") == "1"
+TRACE_TOKEN_HEADER = os.getenv("TRACE_TOKEN_HEADER", "X-Debug-Trace-Token")
+TRACE_SECRET = os.getenv("TRACE_SECRET", "")
+TRACE_DIR = Path(os.getenv("TRACE_DIR", Path(__file__).resolve().parents[1] / "traces"))
+# Trazas que se conservan en TRACE_DIR; las más viejas se borran
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "200"))
+TRACE_PROFILE_INTERVAL_MS = float(os.getenv("TRACE_PROFILE_INTERVAL_MS", "5"))
+# Perfiles simultáneos como máximo (cada uno es un hilo que recorre pilas)
+TRACE_MAX_PROFILES = int(os.getenv("TRACE_MAX_PROFILES", "1"))
+
+_MAX_STACK_DEPTH = 64
+
+_trace_var: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_span_var: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+_profile_slots = threading.BoundedSemaphore(TRACE_MAX_PROFILES)
+# Serializa export + rotación entre hilos
+_export_lock = threading.Lock()
+
+if TRACE_HEADER_ENABLED and not TRACE_SECRET:
+    print(f"[TRACE] TRACE_HEADER_ENABLED=1 sin TRACE_SECRET: el header {TRACE_HEADER} se ignora")
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "attrs", "start_ns", "end_ns", "tid")
+
+    def __init__(self, span_id: int, parent: Optional[int], name: str, attrs: Dict[str, Any]):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+        self.tid = threading.get_native_id()
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.spans: List[Span] = []
+        self.start_ns = time.perf_counter_ns()
+        self.wall_start = time.time()
+        # ident -> native id de los hilos que ejecutaron spans de esta traza
+        self.threads: Dict[int, int] = {}
+        self.samples: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def open(self, name: str, parent: Optional[Span], attrs: Dict[str, Any]) -> Span:
+        with self._lock:
+            sp = Span(len(self.spans), parent.id if parent else None, name, attrs)
+            self.spans.append(sp)
+            self.threads[threading.get_ident()] = sp.tid
+        return sp
+
+
+class span:
+    """
+    Abre un span hijo del span actual (sirve con `with` y `async with`).
+    Si la petición no se está trazando no hace nada.
+    """
+
+    __slots__ = ("name", "attrs", "_span", "_token")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        trace = _trace_var.get()
+        if trace is not None:
+            self._span = trace.open(self.name, _span_var.get(), self.attrs)
+            self._token = _span_var.set(self._span)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        sp = self._span
+        if sp is None:
+            return False
+        sp.end_ns = time.perf_counter_ns()
+        if exc_type is not None:
+            sp.attrs["error"] = exc_type.__name__
+        try:
+            _span_var.reset(self._token)
+        except ValueError:
+            # Cerrado desde otro contexto (p.ej. un generador que cambió de tarea)
+            _span_var.set(None)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+    def set(self, **attrs):
+        if self._span is not None:
+            self._span.attrs.update(attrs)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace_var.get()
+
+
+# ------------------------------------------------------------
+# Profiler por muestreo
+# ------------------------------------------------------------
+class _Sampler(threading.Thread):
+    """Toma las pilas de los hilos de la traza cada TRACE_PROFILE_INTERVAL_MS."""
+
+    def __init__(self, trace: Trace, interval: float):
+        super().__init__(name=f"trace-sampler-{trace.id}", daemon=True)
+        self.trace = trace
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        trace = self.trace
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            now = time.perf_counter_ns()
+            with trace._lock:
+                threads = list(trace.threads.items())
+            for ident, tid in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    trace.samples.append((now, tid, _stack(frame)))
+
+
+def _stack(frame) -> tuple:
+    stack = []
+    while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    # De la raíz a la hoja
+    return tuple(reversed(stack))
+
+
+# ------------------------------------------------------------
+# Exportación (Chrome trace event format)
+# ------------------------------------------------------------
+def to_chrome(trace: Trace) -> Dict[str, Any]:
+    pid = os.getpid()
+    t0 = trace.start_ns
+
+    def us(ns):
+        return (ns - t0) / 1000
+
+    events = []
+    for sp in trace.spans:
+        end = sp.end_ns or time.perf_counter_ns()
+        events.append({
+            "name": sp.name, "cat": "span", "ph": "X", "pid": pid, "tid": sp.tid,
+            "ts": us(sp.start_ns), "dur": (end - sp.start_ns) / 1000,
+            "args": {k: _jsonable(v) for k, v in sp.attrs.items()},
+        })
+
+    # Cada pila se guarda como cadena de stackFrames (hoja -> padre)
+    frames: Dict[tuple, int] = {}
+    stack_frames: Dict[str, Dict[str, Any]] = {}
+    samples = []
+    for ts, tid, stack in trace.samples:
+        parent = None
+        for depth in range(1, len(stack) + 1):
+            key = stack[:depth]
+            sf = frames.get(key)
+            if sf is None:
+                sf = frames[key] = len(frames)
+                entry = {"name": key[-1], "category": "python"}
+                if parent is not None:
+                    entry["parent"] = str(parent)
+                stack_frames[str(sf)] = entry
+            parent = sf
+        if parent is not None:
+            samples.append({"cpu": 0, "tid": tid, "ts": us(ts), "name": "sample",
+                            "sf": str(parent), "weight": 1})
+
+    return {
+        "traceEvents": events,
+        "stackFrames": stack_frames,
+        "samples": samples,
+        "displayTimeUnit": "ms",
+        "otherData": {"trace_id": trace.id, "name": trace.name, "started_at": trace.wall_start},
+        # Árbol legible sin visor: {name, ms, attrs, children}
+        "spanTree": span_tree(trace),
+    }
+
+
+def span_tree(trace: Trace) -> List[Dict[str, Any]]:
+    nodes = {}
+    roots = []
+    for sp in trace.spans:
+        end = sp.end_ns or time.perf_counter_ns()
+        node = {"name": sp.name, "ms": round((end - sp.start_ns) / 1e6, 3),
+                "attrs": {k: _jsonable(v) for k, v in sp.attrs.items()}, "children": []}
+        nodes[sp.id] = node
+        (nodes[sp.parent]["children"] if sp.parent in nodes else roots).append(node)
+    return roots
+
+
+def _jsonable(value):
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _rotate(keep: int):
+    # El nombre empieza con la fecha: orden alfabético = orden cronológico
+    files = sorted(TRACE_DIR.glob("*.json"))
+    for old in files[: max(len(files) - keep, 0)]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def export(trace: Trace) -> Path:
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.wall_start))
+    path = TRACE_DIR / f"{stamp}-{trace.id}.json"
+    data = json.dumps(to_chrome(trace), ensure_ascii=False)
+    with _export_lock:
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(data)
+        _rotate(TRACE_MAX_FILES)
+    return path
+
+
+# ------------------------------------------------------------
+# Middleware
+# ------------------------------------------------------------
+def _requested(scope) -> Optional[str]:
+    """Valor del header de depuración si trae el secreto correcto; si no, None."""
+    wanted, token_header = TRACE_HEADER.lower().encode(), TRACE_TOKEN_HEADER.lower().encode()
+    value = token = None
+    for key, raw in scope.get("headers", ()):
+        if key == wanted:
+            value = raw.decode("latin-1").strip().lower()
+        elif key == token_header:
+            token = raw
+    if value is None or token is None:
+        return None
+    if not hmac.compare_digest(token, TRACE_SECRET.encode()):
+        return None
+    return value
+
+
+def _decide(scope) -> tuple:
+    """(trazar, perfilar) para esta petición."""
+    if TRACE_HEADER_ENABLED and TRACE_SECRET:
+        value = _requested(scope)
+        if value == "profile":
+            return True, True
+        if value in ("1", "true", "yes"):
+            return True, False
+    if TRACE_PROFILE_RATE and random.random() < TRACE_PROFILE_RATE:
+        return True, True
+    if TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE:
+        return True, False
+    return False, False
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI: abre el span raíz de las peticiones muestreadas, agrega
+    el header X-Trace-Id a la respuesta y exporta la traza al terminar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traced, profiled = _decide(scope)
+        if not traced:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        trace_token = _trace_var.set(trace)
+        sampler = None
+        if profiled and _profile_slots.acquire(blocking=False):
+            sampler = _Sampler(trace, TRACE_PROFILE_INTERVAL_MS / 1000)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set(status=message["status"])
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace.id.encode())]
+            await send(message)
+
+        root = span("request", method=scope["method"], path=scope["path"], profiled=sampler is not None)
+        try:
+            with root:
+                if sampler is not None:
+                    sampler.start()
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace_var.reset(trace_token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.set(route=route)
+
+            def finish():
+                if sampler is not None:
+                    sampler.stop_event.set()
+                    sampler.join()
+                    _profile_slots.release()
+                return export(trace)
+
+            # La respuesta ya salió: detener el muestreo y escribir fuera del event loop
+            path = await anyio.to_thread.run_sync(finish)
+            print(f"[TRACE] {trace.name} -> {path} ({len(trace.spans)} spans, {len(trace.samples)} muestras)")
@@ -0,0 +1,105 @@
+# ============================================================
+# Benchmark — disponibilidad de grupo vs. número de asistentes
+# ============================================================
+#
+# Compara app.availability.group_slots (NumPy) contra un recorrido en
+# Python puro (cada slot candidato contra los intervalos de cada
+# asistente) para una semana laboral con calendarios sintéticos.
+#
+#   cd backend
+#   python -m bench.bench_availability --attendees 20 50 100 200 --json
+
+import argparse
+import json
+import random
+import time as _time
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.availability import group_slots
+from app.calendar import working_windows
+
+
+def synthetic_busy(windows, rng: random.Random, meetings_per_day: int):
+    busy = []
+    for _, win_start, win_end in windows:
+        span = int((win_end - win_start).total_seconds() // 60)
+        for _ in range(meetings_per_day):
+            start = win_start + timedelta(minutes=rng.randrange(0, span, 15))
+            end = start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90)))
+            busy.append((start, end))
+    busy.sort()
+    return [
+        {"start": s.astimezone(timezone.utc).isoformat(), "end": e.astimezone(timezone.utc).isoformat()}
+        for s, e in busy
+    ]
+
+
+def python_baseline(busy_by_attendee, windows, duration, step, top_k):
+    parsed = {
+        a: [(datetime.fromisoformat(b["start"]), datetime.fromisoformat(b["end"])) for b in busy]
+        for a, busy in busy_by_attendee.items()
+    }
+    delta = timedelta(minutes=duration)
+    scored = []
+    for _, win_start, win_end in windows:
+        cursor = win_start
+        while cursor + delta <= win_end:
+            end = cursor + delta
+            free = sum(
+                1 for intervals in parsed.values()
+                if all(e <= cursor or s >= end for s, e in intervals)
+            )
+            scored.append((-free, cursor))
+            cursor += timedelta(minutes=step)
+    scored.sort()
+    return scored[:top_k]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = _time.perf_counter()
+        fn()
+        best = min(best, _time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de disponibilidad de grupo")
+    parser.add_argument("--attendees", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--meetings-per-day", type=int, default=4)
+    parser.add_argument("--duration", type=int, default=30)
+    parser.add_argument("--step", type=int, default=15)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    start = date(2025, 11, 17)
+    windows = working_windows(start, start + timedelta(days=args.days - 1), time(9), time(18))
+    rng = random.Random(42)
+
+    results = []
+    for n in args.attendees:
+        busy = {f"user{i}@example.com": synthetic_busy(windows, rng, args.meetings_per_day) for i in range(n)}
+        numpy_s = timed(lambda: group_slots(busy, windows, args.duration, args.step, args.top_k), args.repeat)
+        row = {"attendees": n, "numpy_ms": round(numpy_s * 1000, 3)}
+        if not args.skip_baseline:
+            python_s = timed(lambda: python_baseline(busy, windows, args.duration, args.step, args.top_k), 1)
+            row["python_ms"] = round(python_s * 1000, 3)
+            row["speedup"] = round(python_s / numpy_s, 1)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'asistentes':>10} {'numpy ms':>10} {'python ms':>10} {'speedup':>8}")
+    for row in results:
+        print(f"{row['attendees']:>10} {row['numpy_ms']:>10} {row.get('python_ms', '-'):>10} {row.get('speedup', '-'):>8}")
+
+
+if __name__ == "__main__":
+    main()
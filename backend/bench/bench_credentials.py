@@ -0,0 +1,174 @@
+# ============================================================
+# Prueba de carga — credenciales de Calendar por usuario
+# ============================================================
+#
+# Miles de usuarios sintéticos con credenciales cifradas en un SQLite
+# temporal (todas con el access token vencido) contra GET /v1/meetings con
+# X-Calendar-User (firmado con HMAC, CALENDAR_USER_AUTH=hmac). El refresh de
+# Google se reemplaza por uno falso con latencia, así que se puede comprobar
+# sin red que:
+#   - cada usuario se refresca una sola vez aunque lleguen muchas peticiones
+#     suyas a la vez y aunque salga del LRU y vuelva (se guardó cifrado);
+#   - ninguna llamada a Calendar sale con un token vencido;
+#   - los usuarios revocados reciben 401 sin abrir ningún flujo interactivo.
+#
+#   cd backend
+#   python -m bench.bench_credentials --users 5000 --max-users 1000 --requests 20000
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time as _time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict
+
+import httpx
+
+from bench.bench_endpoints import drive, git_commit, install_fake_firestore
+
+
+class TokenAudit(httpx.AsyncBaseTransport):
+    """Envuelve el transporte del fake de Calendar y cuenta los tokens que recibe."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self.inner = inner
+        self.tokens = Counter()
+
+    async def handle_async_request(self, request):
+        self.tokens[request.headers.get("authorization", "").split(" ")[-1].split(":")[0]] += 1
+        return await self.inner.handle_async_request(request)
+
+
+def fake_refresher(latency: float, revoked: set, counts: Counter, lock: threading.Lock):
+    from app.credential_pool import CredentialsRevoked
+
+    def refresh(info: Dict[str, Any]) -> Dict[str, Any]:
+        _time.sleep(latency)
+        user = info["client_id"]
+        if user in revoked:
+            raise CredentialsRevoked("invalid_grant")
+        with lock:
+            counts[user] += 1
+        expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+        return dict(info, token=f"fresh:{user}", expiry=expiry.strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+    return refresh
+
+
+async def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp()
+    os.environ.setdefault("CREDENTIAL_STORE_DB", os.path.join(workdir, "credentials.sqlite"))
+    os.environ.setdefault("CREDENTIAL_STORE_KEY_FILE", os.path.join(workdir, "credential_store.key"))
+    os.environ.setdefault("CREDENTIAL_POOL_MAX_USERS", str(args.max_users))
+    os.environ.setdefault("MIRROR_OUTBOX_DB", os.path.join(workdir, "mirror_outbox.sqlite"))
+    os.environ.setdefault("CALENDAR_USER_QPS", "1e9")
+    os.environ.setdefault("CALENDAR_USER_BURST", "1e9")
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "1e9")
+    os.environ.setdefault("CALENDAR_PROJECT_BURST", "1e9")
+    os.environ.setdefault("CALENDAR_USER_AUTH", "hmac")
+    os.environ.setdefault("CALENDAR_USER_SECRET", "bench-secret")
+    install_fake_firestore(0.0)
+
+    # Importar después de configurar el entorno
+    from app.calendar_async import AsyncCalendarClient, close_async_calendar, set_async_calendar
+    from app.credential_pool import credential_pool, sign_calendar_user
+    from app.main import app
+    from fakes.calendar_server import FakeCalendarStore, create_app as create_calendar
+
+    users = [f"user{n:05d}@example.com" for n in range(args.users)]
+    revoked = set(rng.sample(users, int(args.users * args.revoked)))
+    t0 = _time.perf_counter()
+    stale = (datetime.now(timezone.utc) - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    for user in users:
+        # client_id = usuario: así el refresh falso sabe de quién es
+        credential_pool.save(user, {"token": f"stale:{user}", "expiry": stale, "refresh_token": "r",
+                                    "client_id": user, "client_secret": "s"})
+    seed_seconds = _time.perf_counter() - t0
+
+    counts, lock = Counter(), threading.Lock()
+    credential_pool.refresher = fake_refresher(args.refresh_latency, revoked, counts, lock)
+
+    async def static_token():
+        return "default-token"
+
+    audit = TokenAudit(httpx.ASGITransport(app=create_calendar(FakeCalendarStore(), latency=args.calendar_latency)))
+    set_async_calendar(AsyncCalendarClient(base_url="http://calendar.fake", token_provider=static_token,
+                                           transport=audit))
+
+    # 80% del tráfico sobre el 20% de los usuarios; el resto, cola larga
+    hot = users[: max(1, len(users) // 5)]
+
+    def pick(n: int) -> str:
+        return rng.choice(hot) if rng.random() < 0.8 else rng.choice(users)
+
+    def request(user: str) -> Dict[str, Any]:
+        return {"method": "GET", "url": "/v1/meetings", "params": {"fecha": "2026-01-15", "fields": "summary"},
+                "headers": {"X-Calendar-User": user, "X-Calendar-User-Signature": sign_calendar_user(user)}}
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # Ráfaga: muchas peticiones simultáneas de un mismo usuario frío
+        cold = next(u for u in reversed(users) if u not in revoked)
+        results["burst_same_user"] = await drive(client, lambda n: request(cold), args.burst, args.burst)
+        results["burst_same_user"]["refreshes"] = counts[cold]
+        results["mixed_users"] = await drive(client, lambda n: request(pick(n)), args.requests, args.concurrency)
+
+    touched = set(counts)
+    await close_async_calendar()
+    snapshot = credential_pool.snapshot()
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "users": args.users,
+            "max_users": args.max_users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "burst": args.burst,
+            "refresh_latency": args.refresh_latency,
+            "calendar_latency": args.calendar_latency,
+            "revoked_users": len(revoked),
+        },
+        "seed_seconds": round(seed_seconds, 3),
+        "scenarios": results,
+        "refreshed_users": len(touched),
+        "max_refreshes_per_user": max(counts.values(), default=0),
+        "stale_tokens_sent": sum(v for k, v in audit.tokens.items() if k == "stale"),
+        "pool": snapshot,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga con miles de usuarios de Calendar sintéticos")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--max-users", type=int, default=1000, help="tamaño del LRU en memoria")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--burst", type=int, default=500, help="peticiones simultáneas del mismo usuario")
+    parser.add_argument("--refresh-latency", type=float, default=0.05, help="segundos por refresh")
+    parser.add_argument("--calendar-latency", type=float, default=0.01, help="segundos por petición")
+    parser.add_argument("--revoked", type=float, default=0.01, help="fracción de usuarios revocados")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="además de imprimir, guardar el JSON en este archivo")
+    args = parser.parse_args()
+
+    # Los logs de la app (print) van a stderr para que stdout sea sólo el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# ============================================================
+# Benchmark — endpoints de app.main bajo carga, sin red
+# ============================================================
+#
+# Levanta la app en proceso con fakes de Firestore (fakes/firestore.py),
+# Google Calendar (fakes/calendar_server.py) y el router de Hugging Face
+# (fakes/hf_router.py), cada uno con latencia inyectada, y lanza tráfico
+# concurrente contra los endpoints principales. Reporta throughput y
+# p50/p95/p99 por endpoint en JSON para comparar entre commits:
+#
+#   cd backend
+#   python -m bench.bench_endpoints --requests 500 --concurrency 32 --out bench.json
+#   python -m bench.bench_endpoints --firestore-latency 0.03 --llm-latency 0.4
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time as _time
+import types
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from fakes.firestore import FakeFirestore
+
+TIMEZONE_OFFSET = "-06:00"
+
+
+def install_fake_firestore(latency: float) -> FakeFirestore:
+    """Reemplaza app.firebase_config antes de importar app.main: get_db() regresa el fake."""
+    db = FakeFirestore(latency=latency)
+    module = types.ModuleType("app.firebase_config")
+    module.db = db
+    module.get_db = lambda: db
+    sys.modules["app.firebase_config"] = module
+    return db
+
+
+def percentile(sorted_values: List[float], q: float):
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] * 1000, 2)
+
+
+def seed(calendar_store, db: FakeFirestore, days: List[date], rng: random.Random, per_day: int, actions: int):
+    for day in days:
+        for _ in range(per_day):
+            start = datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(8, 17),
+                                                                           minutes=rng.choice((0, 30)))
+            end = start + timedelta(minutes=rng.choice((30, 45, 60)))
+            calendar_store.insert("primary", {
+                "summary": "Reunión sintética",
+                "start": {"dateTime": start.isoformat() + TIMEZONE_OFFSET},
+                "end": {"dateTime": end.isoformat() + TIMEZONE_OFFSET},
+            })
+    now = datetime.now(timezone.utc)
+    batch = db.batch()
+    for n in range(actions):
+        batch.set(db.collection("actions").document(), {
+            "action": rng.choice(("create", "cancel")),
+            "action_id": f"evt{n:06d}",
+            "user": f"user{n % 20}@example.com",
+            "date": now - timedelta(minutes=n),
+        })
+        if (n + 1) % 500 == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def scenarios(days: List[date], rng: random.Random) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    """Nombre del escenario -> función que arma la petición n."""
+
+    def meeting_body(n: int):
+        day = rng.choice(days)
+        start = datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(8, 17))
+        return {
+            "summary": f"Bench {n}",
+            "start": {"dateTime": start.isoformat() + TIMEZONE_OFFSET, "timeZone": "America/Mexico_City"},
+            "end": {"dateTime": (start + timedelta(minutes=30)).isoformat() + TIMEZONE_OFFSET,
+                    "timeZone": "America/Mexico_City"},
+            "attendees": [{"email": "bench@example.com"}],
+        }
+
+    return {
+        "GET /v1/meetings": lambda n: {
+            "method": "GET", "url": "/v1/meetings", "params": {"fecha": rng.choice(days).isoformat()},
+        },
+        "POST /v1/meetings": lambda n: {"method": "POST", "url": "/v1/meetings", "json": meeting_body(n)},
+        "POST /v1/meetings/free": lambda n: {
+            "method": "POST", "url": "/v1/meetings/free",
+            "json": {"date": rng.choice(days).isoformat(), "duration_minutes": rng.choice((30, 60))},
+        },
+        # Textos únicos: ni las reglas ni la cache los resuelven, van al LLM
+        "POST /v1/intent/create/parse": lambda n: {
+            "method": "POST", "url": "/v1/intent/create/parse",
+            "json": {"text": f"oye, lo del proyecto {n} con el equipo, ¿cómo quedamos?"},
+        },
+        "GET /v1/actions": lambda n: {"method": "GET", "url": "/v1/actions", "params": {"limit": 50}},
+    }
+
+
+async def drive(client: httpx.AsyncClient, build: Callable[[int], Dict[str, Any]],
+                requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            t0 = _time.perf_counter()
+            try:
+                resp = await client.request(**build(n))
+                ok = resp.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(_time.perf_counter() - t0)
+            errors += not ok
+
+    t0 = _time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = _time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else None,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    db = install_fake_firestore(args.firestore_latency)
+    # Cuota de Calendar (app/calendar_quota.py): sin límite salvo que se pida,
+    # para medir la app y no el token bucket
+    qps = args.calendar_user_qps or 1e9
+    os.environ.setdefault("CALENDAR_USER_QPS", str(qps))
+    os.environ.setdefault("CALENDAR_USER_BURST", str(max(qps * 2, 1)))
+    os.environ.setdefault("CALENDAR_PROJECT_QPS", "1e9")
+    os.environ.setdefault("CALENDAR_PROJECT_BURST", "1e9")
+    # Outbox del espejo (app/mirror_outbox.py) en un archivo desechable
+    os.environ.setdefault("MIRROR_OUTBOX_DB", os.path.join(tempfile.mkdtemp(), "mirror_outbox.sqlite"))
+
+    # Importar después de instalar el fake de Firestore
+    import app.hf_client as hf_client
+    from app.calendar_async import AsyncCalendarClient, close_async_calendar, set_async_calendar
+    from app.event_cache import reset_event_stores
+    from app.main import app
+    from fakes.calendar_server import FakeCalendarStore, create_app as create_calendar
+    from fakes.hf_router import FakeHFRouter, create_app as create_hf
+
+    today = date.today()
+    days = [today + timedelta(days=offset) for offset in range(args.days)]
+    calendar_store = FakeCalendarStore()
+    seed(calendar_store, db, days, rng, args.events_per_day, args.actions)
+
+    async def static_token():
+        return "bench-token"
+
+    set_async_calendar(AsyncCalendarClient(
+        base_url="http://calendar.fake",
+        token_provider=static_token,
+        transport=httpx.ASGITransport(app=create_calendar(calendar_store, latency=args.calendar_latency)),
+    ))
+    settings = hf_client.get_settings()
+    settings.token = settings.token or "bench-token"
+    hf_client.set_hf_client(hf_client.HFRouterClient(
+        url="http://hf.fake/v1/chat/completions",
+        token="bench-token",
+        transport=httpx.ASGITransport(app=create_hf(FakeHFRouter(latency=args.llm_latency))),
+    ))
+    reset_event_stores()
+
+    selected = scenarios(days, rng)
+    if args.only:
+        selected = {name: build for name, build in selected.items() if any(o in name for o in args.only)}
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for name, build in selected.items():
+            # Calentamiento: primera sincronización de la cache, conexiones, etc.
+            await drive(client, build, min(args.concurrency, args.requests), args.concurrency)
+            results[name] = await drive(client, build, args.requests, args.concurrency)
+
+    await close_async_calendar()
+    await hf_client.close_hf_client()
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "firestore_latency": args.firestore_latency,
+            "calendar_latency": args.calendar_latency,
+            "llm_latency": args.llm_latency,
+            "calendar_user_qps": args.calendar_user_qps,
+            "days": args.days,
+            "events_per_day": args.events_per_day,
+            "actions": args.actions,
+        },
+        "endpoints": results,
+        "firestore_rpcs": db.stats["rpcs"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga concurrente contra app.main con fakes en proceso")
+    parser.add_argument("--requests", type=int, default=300, help="peticiones por endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--firestore-latency", type=float, default=0.01, help="segundos por RPC")
+    parser.add_argument("--calendar-latency", type=float, default=0.03, help="segundos por petición")
+    parser.add_argument("--llm-latency", type=float, default=0.25, help="segundos por completion")
+    parser.add_argument("--calendar-user-qps", type=float, default=0,
+                        help="cuota de Calendar por usuario (0 = sin límite)")
+    parser.add_argument("--days", type=int, default=14, help="días con eventos sembrados")
+    parser.add_argument("--events-per-day", type=int, default=6)
+    parser.add_argument("--actions", type=int, default=2000, help="documentos en 'actions'")
+    parser.add_argument("--only", nargs="*", help="sólo escenarios que contengan estos textos")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="además de imprimir, guardar el JSON en este archivo")
+    args = parser.parse_args()
+
+    # Los logs de la app (print) van a stderr para que stdout sea sólo el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
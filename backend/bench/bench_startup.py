@@ -0,0 +1,100 @@
+# ============================================================
+# Benchmark — tiempo de importación y de arranque en frío
+# ============================================================
+#
+# Cada corrida es un intérprete nuevo (como un worker recién creado):
+#   - import_ms:   `import app.main`
+#   - startup_ms:  import + lifespan de FastAPI + primera petición a "/"
+#   - heavy_modules: SDKs pesados que quedaron cargados tras importar (deben
+#     cargarse hasta el primer uso: Firestore, discovery de Google, NumPy…)
+#
+#   cd backend
+#   python -m bench.bench_startup --runs 7
+#   python -m bench.bench_startup --max-import-ms 800   # exit 1 si hay regresión
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+# Módulos que no deben cargarse al importar app.main
+HEAVY_MODULES = (
+    "firebase_admin",
+    "google.cloud.firestore",
+    "grpc",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "numpy",
+)
+
+_PROBE = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+heavy = [m for m in HEAVY if m in sys.modules]
+
+async def first_request():
+    import httpx
+    asgi = app.main.app
+    async with asgi.router.lifespan_context(asgi):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi), base_url="http://startup") as c:
+            (await c.get("/")).raise_for_status()
+
+asyncio.run(first_request())
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "startup_ms": (t2 - t0) * 1000,
+                  "modules": len(sys.modules), "heavy": heavy}))
+"""
+
+
+def probe() -> dict:
+    code = f"HEAVY = {HEAVY_MODULES!r}\n" + _PROBE
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip())
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el arranque en frío de app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, help="falla si la mediana de import_ms lo supera")
+    parser.add_argument("--max-startup-ms", type=float, help="falla si la mediana de startup_ms lo supera")
+    args = parser.parse_args()
+
+    # Una corrida descartada para calentar la cache de disco y de bytecode
+    probe()
+    runs = [probe() for _ in range(args.runs)]
+    import_ms = sorted(r["import_ms"] for r in runs)
+    startup_ms = sorted(r["startup_ms"] for r in runs)
+    report = {
+        "runs": args.runs,
+        "import_ms": {"median": round(statistics.median(import_ms), 1), "min": round(import_ms[0], 1),
+                      "max": round(import_ms[-1], 1)},
+        "startup_ms": {"median": round(statistics.median(startup_ms), 1), "min": round(startup_ms[0], 1),
+                       "max": round(startup_ms[-1], 1)},
+        "modules_loaded": runs[-1]["modules"],
+        "heavy_modules": runs[-1]["heavy"],
+    }
+
+    failures = []
+    if report["heavy_modules"]:
+        failures.append(f"módulos pesados al importar: {', '.join(report['heavy_modules'])}")
+    if args.max_import_ms and report["import_ms"]["median"] > args.max_import_ms:
+        failures.append(f"import_ms {report['import_ms']['median']} > {args.max_import_ms}")
+    if args.max_startup_ms and report["startup_ms"]["median"] > args.max_startup_ms:
+        failures.append(f"startup_ms {report['startup_ms']['median']} > {args.max_startup_ms}")
+    report["ok"] = not failures
+    report["failures"] = failures
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
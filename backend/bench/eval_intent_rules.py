@@ -0,0 +1,140 @@
+# ============================================================
+# Evaluación del parser por reglas contra un corpus etiquetado
+# ============================================================
+#
+# Mide cobertura (qué fracción resuelve el camino rápido sin LLM) y
+# acuerdo con las etiquetas de bench/intent_corpus.jsonl. Con --llm además
+# compara cada respuesta de las reglas con la del modelo (requiere token).
+#
+#   cd backend
+#   python -m bench.eval_intent_rules
+#   python -m bench.eval_intent_rules --llm --json
+
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.intent_rules import INTENT_RULES_MIN_CONFIDENCE, parse_intent_fast
+
+CORPUS = Path(__file__).resolve().parent / "intent_corpus.jsonl"
+# Las etiquetas del corpus están escritas para este "ahora" (viernes)
+REFERENCE_NOW = datetime(2025, 11, 14, 9, 0)
+
+
+def key_fields(intent: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Campos que deben coincidir, en la misma forma que las etiquetas."""
+    if not intent or "intent" not in intent:
+        return None
+    kind = intent["intent"]
+    if kind == "list":
+        return {"intent": kind, "fecha": intent.get("fecha")}
+    if kind == "free":
+        return {"intent": kind, "date": intent.get("date"), "duration_minutes": intent.get("duration_minutes")}
+    if kind == "cancel":
+        return {"intent": kind, "cancel_id": intent.get("cancel_id")}
+    if kind == "update":
+        start = (intent.get("fields") or {}).get("start") or {}
+        return {"intent": kind, "update_id": intent.get("update_id"), "start": start.get("dateTime")}
+    if kind == "create":
+        return {
+            "intent": kind,
+            "summary": (intent.get("summary") or "").strip().lower(),
+            "start": (intent.get("start") or {}).get("dateTime", "")[:19],
+            "end": (intent.get("end") or {}).get("dateTime", "")[:19],
+            "attendees": sorted(a.get("email", "").lower() for a in intent.get("attendees") or []),
+        }
+    return {"intent": kind}
+
+
+def normalize_label(expected: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if expected is None:
+        return None
+    label = dict(expected)
+    if label.get("intent") == "create":
+        label["summary"] = label["summary"].strip().lower()
+        label["attendees"] = sorted(a.lower() for a in label["attendees"])
+    return label
+
+
+async def llm_intents(texts):
+    """Respuestas del modelo para cada texto, en paralelo sobre el cliente compartido."""
+    from app.hf_client import _request_intent, close_hf_client
+
+    try:
+        return await asyncio.gather(*(_request_intent(t) for t in texts))
+    finally:
+        await close_hf_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa el parser de intenciones por reglas")
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--threshold", type=float, default=INTENT_RULES_MIN_CONFIDENCE)
+    parser.add_argument("--llm", action="store_true", help="compara también contra el modelo de HF")
+    parser.add_argument("--json", action="store_true", help="salida en JSON")
+    args = parser.parse_args()
+
+    rows = [json.loads(line) for line in args.corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+    # Contra el LLM se usa la fecha real, porque el prompt usa datetime.now()
+    now = datetime.now() if args.llm else REFERENCE_NOW
+    llm_by_text = {}
+    if args.llm:
+        texts = [r["text"] for r in rows]
+        llm_by_text = dict(zip(texts, asyncio.run(llm_intents(texts))))
+
+    handled = agree = correct_fallback = 0
+    llm_compared = llm_agree = 0
+    mismatches = []
+    for row in rows:
+        intent, confidence = parse_intent_fast(row["text"], now)
+        taken = intent is not None and confidence >= args.threshold
+        label = normalize_label(row["expected"])
+
+        if not taken:
+            correct_fallback += label is None
+            if label is not None:
+                mismatches.append({"text": row["text"], "expected": label, "got": None})
+            continue
+
+        handled += 1
+        got = key_fields(intent)
+        if args.llm:
+            llm_compared += 1
+            llm_agree += got == key_fields(llm_by_text[row["text"]])
+        elif got == label:
+            agree += 1
+        else:
+            mismatches.append({"text": row["text"], "expected": label, "got": got})
+
+    total = len(rows)
+    summary = {
+        "total": total,
+        "threshold": args.threshold,
+        "coverage": round(handled / total, 4) if total else 0.0,
+        "handled": handled,
+        "fallback": total - handled,
+    }
+    if args.llm:
+        summary["llm_agreement"] = round(llm_agree / llm_compared, 4) if llm_compared else None
+    else:
+        labelled_fallbacks = sum(1 for r in rows if r["expected"] is None)
+        summary["label_agreement"] = round(agree / handled, 4) if handled else None
+        summary["correct_fallbacks"] = f"{correct_fallback}/{labelled_fallbacks}"
+        summary["mismatches"] = mismatches
+
+    if args.json:
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return
+    for key, value in summary.items():
+        if key == "mismatches":
+            for m in value:
+                print(f"  ✗ {m['text']!r}\n      esperado: {m['expected']}\n      obtenido: {m['got']}")
+        else:
+            print(f"{key:>18}: {value}")
+
+
+if __name__ == "__main__":
+    main()
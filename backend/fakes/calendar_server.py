@@ -0,0 +1,255 @@
+# ============================================================
+# Fake de Google Calendar v3 — servidor HTTP local
+# ============================================================
+#
+# Implementa en memoria las rutas que usa app/calendar_async.py para poder
+# probar sin red ni credenciales:
+#
+#   uvicorn fakes.calendar_server:app --port 8089
+#   CALENDAR_API_BASE=http://127.0.0.1:8089 uvicorn app.main:app
+#
+# También se puede usar en proceso con httpx.ASGITransport(app=create_app()).
+# `latency` agrega una espera por petición HTTP (un batch cuenta como una).
+# events.list respeta `fields=` (respuesta parcial) y las respuestas se
+# comprimen con gzip si el cliente lo acepta, como la API real.
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from starlette.middleware.gzip import GZipMiddleware
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _event_bounds(event: Dict[str, Any]):
+    start = event.get("start", {})
+    end = event.get("end", {})
+    start_s = start.get("dateTime") or f"{start.get('date')}T00:00:00+00:00"
+    end_s = end.get("dateTime") or f"{end.get('date')}T00:00:00+00:00"
+    return _parse_rfc3339(start_s), _parse_rfc3339(end_s)
+
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_fields(mask: str) -> Dict[str, Any]:
+    """'items(id,start),nextPageToken' -> {"items": {"id": {}, "start": {}}, "nextPageToken": {}}."""
+    root: Dict[str, Any] = {}
+    stack = [root]
+    name = ""
+    for ch in mask + ",":
+        if ch in ",()":
+            if name.strip():
+                stack[-1].setdefault(name.strip(), {})
+            if ch == "(":
+                stack.append(stack[-1][name.strip()])
+            elif ch == ")":
+                stack.pop()
+            name = ""
+        else:
+            name += ch
+    return root
+
+
+def project(value: Any, spec: Dict[str, Any]) -> Any:
+    """Aplica la máscara de parse_fields a un recurso (listas campo por campo)."""
+    if not spec:
+        return value
+    if isinstance(value, list):
+        return [project(v, spec) for v in value]
+    if not isinstance(value, dict):
+        return value
+    return {k: project(value[k], sub) for k, sub in spec.items() if k in value}
+
+
+class FakeCalendarStore:
+    """Eventos por calendario; 'primary' es un calendario más."""
+
+    def __init__(self):
+        self.calendars: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Número de cambio por evento, para responder a syncToken
+        self.seq = 0
+        self.changed_at: Dict[str, int] = {}
+        # Tokens anteriores a este valor responden 410 Gone
+        self.min_sync_token = 0
+
+    def events(self, calendar_id: str) -> Dict[str, Dict[str, Any]]:
+        return self.calendars.setdefault(calendar_id, {})
+
+    def touch(self, event: Dict[str, Any]):
+        self.seq += 1
+        self.changed_at[event["id"]] = self.seq
+        event["updated"] = _utc(datetime.now(timezone.utc))
+
+    def insert(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        event = dict(body)
+        event.setdefault("id", uuid.uuid4().hex)
+        event["status"] = "confirmed"
+        self.touch(event)
+        self.events(calendar_id)[event["id"]] = event
+        return event
+
+    def changes_since(self, calendar_id: str, token: int) -> List[Dict[str, Any]]:
+        return [e for e in self.events(calendar_id).values() if self.changed_at.get(e["id"], 0) > token]
+
+    def in_range(self, calendar_id: str, time_min=None, time_max=None,
+                 show_deleted: bool = False) -> List[Dict[str, Any]]:
+        lo = _parse_rfc3339(time_min) if time_min else None
+        hi = _parse_rfc3339(time_max) if time_max else None
+        out = []
+        for event in self.events(calendar_id).values():
+            if event.get("status") == "cancelled" and not show_deleted:
+                continue
+            start, end = _event_bounds(event)
+            if lo and end <= lo:
+                continue
+            if hi and start >= hi:
+                continue
+            out.append(event)
+        out.sort(key=lambda e: _event_bounds(e)[0])
+        return out
+
+    def busy(self, calendar_id: str, time_min: str, time_max: str) -> List[Dict[str, str]]:
+        lo, hi = _parse_rfc3339(time_min), _parse_rfc3339(time_max)
+        merged: List[List[datetime]] = []
+        for event in self.in_range(calendar_id, time_min, time_max):
+            if event.get("transparency") == "transparent":
+                continue
+            start, end = _event_bounds(event)
+            start, end = max(start, lo), min(end, hi)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [{"start": _utc(s), "end": _utc(e)} for s, e in merged]
+
+
+def create_app(store: FakeCalendarStore = None, latency: float = 0.0) -> FastAPI:
+    store = store or FakeCalendarStore()
+    fake = FastAPI(title="Fake Google Calendar")
+    fake.state.store = store
+    fake.state.latency = latency
+    fake.add_middleware(GZipMiddleware, minimum_size=500)
+
+    @fake.middleware("http")
+    async def inject_latency(request: Request, call_next):
+        if fake.state.latency and "x-batch-item" not in request.headers:
+            await asyncio.sleep(fake.state.latency)
+        return await call_next(request)
+
+    @fake.post("/calendars/{calendar_id}/events")
+    async def events_insert(calendar_id: str, request: Request):
+        body = await request.json()
+        if body.get("id") in store.events(calendar_id):
+            raise HTTPException(status_code=409, detail="The requested identifier already exists.")
+        return store.insert(calendar_id, body)
+
+    @fake.get("/calendars/{calendar_id}/events/{event_id}")
+    async def events_get(calendar_id: str, event_id: str):
+        event = store.events(calendar_id).get(event_id)
+        if event is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return event
+
+    @fake.patch("/calendars/{calendar_id}/events/{event_id}")
+    async def events_patch(calendar_id: str, event_id: str, request: Request):
+        event = store.events(calendar_id).get(event_id)
+        if event is None or event.get("status") == "cancelled":
+            raise HTTPException(status_code=404, detail="Not Found")
+        event.update(await request.json())
+        store.touch(event)
+        return event
+
+    @fake.delete("/calendars/{calendar_id}/events/{event_id}")
+    async def events_delete(calendar_id: str, event_id: str):
+        event = store.events(calendar_id).get(event_id)
+        if event is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if event.get("status") == "cancelled":
+            raise HTTPException(status_code=410, detail="Resource has been deleted")
+        event["status"] = "cancelled"
+        store.touch(event)
+        return Response(status_code=204)
+
+    @fake.get("/calendars/{calendar_id}/events")
+    async def events_list(calendar_id: str, timeMin: str = None, timeMax: str = None,
+                          syncToken: str = None, showDeleted: bool = False, fields: str = None):
+        if syncToken is not None:
+            # Como Google: syncToken no se combina con timeMin/timeMax
+            if timeMin is not None or timeMax is not None:
+                raise HTTPException(status_code=400, detail="syncToken cannot be used with timeMin/timeMax")
+            if not syncToken.isdigit() or int(syncToken) < store.min_sync_token:
+                raise HTTPException(status_code=410, detail="Sync token is no longer valid")
+            items = store.changes_since(calendar_id, int(syncToken))
+        else:
+            items = store.in_range(calendar_id, timeMin, timeMax, show_deleted=showDeleted)
+        result = {"kind": "calendar#events", "items": items, "nextSyncToken": str(store.seq)}
+        return project(result, parse_fields(fields)) if fields else result
+
+    @fake.post("/freeBusy")
+    async def freebusy_query(request: Request):
+        body = await request.json()
+        calendars = {
+            item["id"]: {"busy": store.busy(item["id"], body["timeMin"], body["timeMax"])}
+            for item in body.get("items", [])
+        }
+        return {
+            "kind": "calendar#freeBusy",
+            "timeMin": body["timeMin"],
+            "timeMax": body["timeMax"],
+            "calendars": calendars,
+        }
+
+    @fake.post("/batch")
+    async def batch(request: Request):
+        # Cada parte es una petición application/http que se despacha a
+        # este mismo fake; la respuesta se arma como multipart/mixed.
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {request.headers['content-type']}\r\n\r\n".encode() + await request.body()
+        )
+        boundary = f"batch_{uuid.uuid4().hex}"
+        out = []
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), base_url="http://fake") as inner:
+            for part in message.iter_parts():
+                raw = (part.get_payload(decode=True) or b"").replace(b"\r\n", b"\n")
+                head, _, body = raw.partition(b"\n\n")
+                method, target, _ = head.split(b"\n", 1)[0].decode().split(" ", 2)
+                content_id = part.get("Content-ID", "").strip("<>")
+                resp = await inner.request(
+                    method, target, content=body.strip() or None,
+                    headers={"Content-Type": "application/json", "X-Batch-Item": content_id},
+                )
+                reason = resp.reason_phrase or "OK"
+                out.append(
+                    f"--{boundary}\r\n"
+                    "Content-Type: application/http\r\n"
+                    f"Content-ID: <response-{content_id}>\r\n\r\n"
+                    f"HTTP/1.1 {resp.status_code} {reason}\r\n"
+                    "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                    f"{resp.text}\r\n"
+                )
+        out.append(f"--{boundary}--\r\n")
+        return Response(content="".join(out), media_type=f"multipart/mixed; boundary={boundary}")
+
+    return fake
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=8089)
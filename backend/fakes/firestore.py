@@ -0,0 +1,267 @@
+# ============================================================
+# Fake de Firestore — en memoria, con latencia configurable
+# ============================================================
+#
+# Implementa la parte del cliente de firebase_admin que usa app/main.py
+# (collection/document/set/update/delete/get, where/order_by/limit/stream y
+# batch) para medir y probar sin credenciales. Cada llamada que en el
+# cliente real es un RPC duerme `latency` segundos (bloqueante, como el SDK).
+#
+#   from fakes.firestore import FakeFirestore
+#   db = FakeFirestore(latency=0.02)
+
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    from google.api_core.exceptions import NotFound
+    from google.cloud.firestore import SERVER_TIMESTAMP
+except ImportError:  # pragma: no cover - sólo sin el SDK instalado
+    SERVER_TIMESTAMP = object()
+
+    class NotFound(Exception):
+        pass
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _resolve(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Los sentinels de servidor se vuelven la hora actual, como en Firestore
+    return {
+        k: (datetime.now(timezone.utc) if v is SERVER_TIMESTAMP else v)
+        for k, v in data.items()
+    }
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, collection: "FakeCollection", doc_id: str):
+        self._collection = collection
+        self.id = doc_id
+
+    def _sleep(self):
+        self._collection._db._sleep()
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._sleep()
+        self._collection._set(self.id, data, merge)
+
+    def update(self, data: Dict[str, Any]):
+        self._sleep()
+        self._collection._update(self.id, data)
+
+    def delete(self):
+        self._sleep()
+        self._collection._delete(self.id)
+
+    def get(self) -> FakeSnapshot:
+        self._sleep()
+        return FakeSnapshot(self, self._collection._get(self.id))
+
+
+class FakeQuery:
+    def __init__(self, collection: "FakeCollection", filters=(), orders=(), limit_n=None,
+                 fields=None, cursor=None):
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit_n
+        self._fields = fields
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = dict(filters=self._filters, orders=self._orders, limit_n=self._limit,
+                     fields=self._fields, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._collection, **state)
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def limit(self, n: int) -> "FakeQuery":
+        return self._copy(limit_n=n)
+
+    def select(self, fields: List[str]) -> "FakeQuery":
+        return self._copy(fields=list(fields))
+
+    def start_after(self, cursor) -> "FakeQuery":
+        # Snapshot o dict con los valores de los campos de order_by
+        if isinstance(cursor, FakeSnapshot):
+            cursor = {**(cursor.to_dict() or {}), "__name__": cursor.id}
+        return self._copy(cursor=cursor)
+
+    def _sort_key(self, doc_id: str, data: Dict[str, Any]):
+        key = []
+        for field, direction in self._orders:
+            value = doc_id if field == "__name__" else data.get(field)
+            key.append(_Ordered(value, direction == "DESCENDING"))
+        return key
+
+    def stream(self):
+        self._collection._db._sleep()
+        rows = []
+        for doc_id, data in self._collection._items():
+            if all(field in data and _OPS[op](data.get(field), value) for field, op, value in self._filters):
+                rows.append((doc_id, data))
+        if self._orders:
+            # Como en Firestore, order_by excluye documentos sin el campo
+            rows = [r for r in rows if all(f == "__name__" or f in r[1] for f, _ in self._orders)]
+            rows.sort(key=lambda r: self._sort_key(*r))
+            if self._cursor is not None:
+                after = self._sort_key(self._cursor.get("__name__", ""), self._cursor)
+                rows = [r for r in rows if self._sort_key(*r) > after]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {k: v for k, v in data.items() if k in self._fields}
+            yield FakeSnapshot(FakeDocumentReference(self._collection, doc_id), data)
+
+    def get(self) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+
+class _Ordered:
+    """Valor comparable que respeta la dirección del order_by."""
+
+    __slots__ = ("value", "descending")
+
+    def __init__(self, value, descending: bool):
+        self.value = value
+        self.descending = descending
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return (self.value > other.value) if self.descending else (self.value < other.value)
+
+    def __gt__(self, other):
+        return other < self
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: "FakeFirestore", name: str):
+        super().__init__(self)
+        self._db = db
+        self.name = name
+        self._docs: Dict[str, Dict[str, Any]] = {}
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self, doc_id or uuid.uuid4().hex[:20])
+
+    def _items(self):
+        with self._db._lock:
+            return [(k, dict(v)) for k, v in self._docs.items()]
+
+    def _get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._db._lock:
+            data = self._docs.get(doc_id)
+            return dict(data) if data is not None else None
+
+    def _set(self, doc_id: str, data: Dict[str, Any], merge: bool = False):
+        with self._db._lock:
+            if merge and doc_id in self._docs:
+                self._docs[doc_id].update(_resolve(data))
+            else:
+                self._docs[doc_id] = _resolve(data)
+
+    def _update(self, doc_id: str, data: Dict[str, Any]):
+        with self._db._lock:
+            if doc_id not in self._docs:
+                raise NotFound(f"No document to update: {self.name}/{doc_id}")
+            self._docs[doc_id].update(_resolve(data))
+
+    def _delete(self, doc_id: str):
+        with self._db._lock:
+            self._docs.pop(doc_id, None)
+
+
+class FakeWriteBatch:
+    """Aplica todas las escrituras en un solo "RPC" al hacer commit."""
+
+    MAX_WRITES = 500
+
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes = []
+
+    def _add(self, write):
+        if len(self._writes) >= self.MAX_WRITES:
+            raise ValueError("maximum 500 writes allowed per request")
+        self._writes.append(write)
+
+    def set(self, ref: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._add(lambda: ref._collection._set(ref.id, data, merge))
+
+    def update(self, ref: FakeDocumentReference, data: Dict[str, Any]):
+        self._add(lambda: ref._collection._update(ref.id, data))
+
+    def delete(self, ref: FakeDocumentReference):
+        self._add(lambda: ref._collection._delete(ref.id))
+
+    def commit(self):
+        self._db._sleep()
+        self._db.stats["batch_writes"] += len(self._writes)
+        for write in self._writes:
+            write()
+        self._writes = []
+
+
+class FakeFirestore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._lock = threading.RLock()
+        self._collections: Dict[str, FakeCollection] = {}
+        self.stats = {"rpcs": 0, "batch_writes": 0}
+
+    def _sleep(self):
+        self.stats["rpcs"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                coll = self._collections[name] = FakeCollection(self, name)
+            return coll
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def get_all(self, references):
+        """Lectura de varios documentos en un solo RPC."""
+        self._sleep()
+        for ref in references:
+            yield FakeSnapshot(ref, ref._collection._get(ref.id))
@@ -0,0 +1,101 @@
+# ============================================================
+# Fake del router de Hugging Face — /v1/chat/completions
+# ============================================================
+#
+# Responde con el formato de OpenAI (normal y en streaming SSE) para probar
+# app/hf_client.py sin red ni token. Se pueden inyectar latencia y fallos
+# (429/503) para ejercitar los reintentos:
+#
+#   uvicorn fakes.hf_router:app --port 8090
+#   HF_URL=http://127.0.0.1:8090/v1/chat/completions HF_TOKEN=x uvicorn app.main:app
+#
+# También se puede usar en proceso con httpx.ASGITransport(app=create_app()).
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def default_reply(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Intención fija: 'list' para hoy. Suficiente para pruebas de carga."""
+    return {"intent": "list", "fecha": time.strftime("%Y-%m-%d")}
+
+
+class FakeHFRouter:
+    """Configuración del fake: respuesta, latencia y fallos a inyectar."""
+
+    def __init__(self, reply: Callable[[List[Dict[str, Any]]], Dict[str, Any]] = default_reply,
+                 latency: float = 0.0, fail_first: int = 0, fail_status: int = 503,
+                 retry_after: Optional[str] = None, chunk_size: int = 8):
+        self.reply = reply
+        self.latency = latency
+        # Las primeras `fail_first` peticiones fallan con `fail_status`
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.requests = 0
+
+
+def create_app(router: FakeHFRouter = None) -> FastAPI:
+    router = router or FakeHFRouter()
+    fake = FastAPI(title="Fake HF Router")
+    fake.state.router = router
+
+    @fake.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        router.requests += 1
+        body = await request.json()
+        if router.latency:
+            await asyncio.sleep(router.latency)
+
+        if router.requests <= router.fail_first:
+            headers = {"Retry-After": router.retry_after} if router.retry_after else {}
+            return JSONResponse({"error": "fake failure"}, status_code=router.fail_status, headers=headers)
+
+        messages = body.get("messages", [])
+        intent = router.reply(messages)
+        if messages and messages[0].get("content", "").startswith("Clasifica"):
+            # Etapa 1 del cliente: sólo la etiqueta de la intención
+            content = intent.get("intent", "none")
+        else:
+            content = json.dumps(intent, ensure_ascii=False)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content) // 4,
+                          "total_tokens": len(content) // 4},
+            }
+
+        async def chunks():
+            for i in range(0, len(content), router.chunk_size):
+                delta = {"content": content[i:i + router.chunk_size]}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return fake
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=8090)
@@ -0,0 +1,35 @@
+# ============================================================
+# Configuración común de las pruebas
+# ============================================================
+#
+# Las pruebas corren desde backend/ (python -m pytest) sin credenciales: los
+# archivos locales (outbox, spill de la bitácora) van a un directorio temporal
+# y Firestore se reemplaza con fakes/firestore.py donde haga falta.
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+# Antes de importar app.*: las constantes se leen al importar
+_TMP = tempfile.mkdtemp(prefix="backend-tests-")
+atexit.register(shutil.rmtree, _TMP, ignore_errors=True)
+os.environ.setdefault("MIRROR_OUTBOX_DB", os.path.join(_TMP, "mirror_outbox.sqlite"))
+os.environ.setdefault("ACTION_LOG_SPILL_DB", os.path.join(_TMP, "action_log_spill.sqlite"))
+os.environ.setdefault("TRACE_HEADER_ENABLED", "0")
+os.environ.setdefault("CALENDAR_USER_AUTH", "off")
+
+
+@pytest.fixture
+def fake_db():
+    from fakes.firestore import FakeFirestore
+
+    return FakeFirestore()
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.action_log import ActionLogWriter
+
+
+def _missing_credentials():
+    raise FileNotFoundError("service_account.json")
+
+
+@pytest.fixture
+def spill_path(tmp_path):
+    return str(tmp_path / "spill.sqlite")
+
+
+def _doc(i):
+    return {"action": "create", "n": i, "date": datetime(2026, 3, 9, tzinfo=timezone.utc)}
+
+
+def test_failing_db_getter_keeps_entries(spill_path):
+    writer = ActionLogWriter(_missing_credentials, flush_interval=60, max_pending=2, spill_path=spill_path)
+    for i in range(3):
+        writer.append(_doc(i))
+
+    assert writer.flush() == 0
+    assert writer.stats["dropped"] == 0
+    assert writer.stats["failed_commits"] >= 1
+    assert len(writer._pending) + writer.spilled_count() == 3
+
+
+def test_entries_are_written_once_firestore_recovers(spill_path, fake_db):
+    available = {"ok": False}
+
+    def db_getter():
+        if not available["ok"]:
+            return _missing_credentials()
+        return fake_db
+
+    writer = ActionLogWriter(db_getter, flush_interval=60, max_pending=2, spill_path=spill_path)
+    ids = [writer.append(_doc(i)) for i in range(3)]
+    writer.flush()
+
+    available["ok"] = True
+    assert writer.flush() == 3
+    assert len(writer._pending) == 0 and writer.spilled_count() == 0
+    stored = {snap.id: snap.to_dict() for snap in fake_db.collection("actions").stream()}
+    assert set(stored) == set(ids)
+    # Las fechas sobreviven al paso por disco
+    assert all(doc["date"] == _doc(0)["date"] for doc in stored.values())
+
+
+def test_close_spills_what_firestore_did_not_take(spill_path, fake_db):
+    writer = ActionLogWriter(_missing_credentials, flush_interval=60, spill_path=spill_path)
+    writer.append(_doc(0))
+    writer.close(timeout=0.5)
+    assert writer.spilled_count() == 1
+
+    # Siguiente arranque, ya con Firestore
+    restarted = ActionLogWriter(lambda: fake_db, flush_interval=60, spill_path=spill_path)
+    assert restarted.flush() == 1
+    assert len(list(fake_db.collection("actions").stream())) == 1
@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import BatchOperation, _batch_call
+
+
+@pytest.fixture
+def calendar_calls(monkeypatch):
+    """Lo que llegaría a Calendar: cada llamada responde 200 sin salir a la red."""
+    sent = []
+
+    async def fake_batch(calls):
+        sent.extend(calls)
+        return [(200, {"id": call.path.rsplit("/", 1)[1]}) for call in calls]
+
+    monkeypatch.setattr(main, "abatch_calendar_operations", fake_batch)
+    monkeypatch.setattr(main.mirror_outbox, "enqueue_many", lambda ops: None)
+    return sent
+
+
+@pytest.mark.parametrize("event_id", ["abc/../../users/me", "abc?sendUpdates=none", "abc def", "abc\r\nX-Evil: 1", ""])
+def test_invalid_ids_never_reach_calendar(calendar_calls, event_id):
+    res = TestClient(main.app).post("/v1/meetings/batch", json={"operations": [
+        {"op": "cancel", "id": event_id},
+        {"op": "cancel", "id": "evt12345"},
+    ]})
+
+    results = res.json()["results"]
+    assert results[0]["status"] == 400 and not results[0]["ok"]
+    assert results[1]["ok"]
+    assert [call.path for call in calendar_calls] == ["/calendars/primary/events/evt12345"]
+
+
+def test_recurring_instance_ids_are_accepted(calendar_calls):
+    instance = "abc123def_20261117T160000Z"
+    res = TestClient(main.app).post("/v1/meetings/batch", json={"operations": [
+        {"op": "update", "id": instance, "updates": {"summary": "x"}},
+    ]})
+    assert res.json()["ok"]
+    assert calendar_calls[0].path == f"/calendars/primary/events/{instance}"
+
+
+def test_batch_call_escapes_the_id():
+    call = _batch_call(BatchOperation(op="cancel", id="a/b?c"))
+    assert call.path == "/calendars/primary/events/a%2Fb%3Fc"
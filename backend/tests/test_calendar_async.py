@@ -0,0 +1,77 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import calendar_async
+from app.calendar_async import AsyncCalendarClient, CalendarAPIError, aupdate_calendar_meeting
+from app.calendar_quota import calendar_scheduler
+
+
+@pytest.fixture
+def calendar_status(monkeypatch):
+    """Calendar responde siempre con el status que fije la prueba."""
+    answer = {"status": 200}
+
+    def handler(request):
+        status = answer["status"]
+        if status >= 400:
+            return httpx.Response(status, json={"error": {"code": status, "message": "error"}})
+        return httpx.Response(200, json={"id": "evt1", "summary": "Daily (movida)"})
+
+    async def token():
+        return "test-token"
+
+    client = AsyncCalendarClient(base_url="http://calendar.test", token_provider=token,
+                                 transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(calendar_async, "_client", client)
+    monkeypatch.setattr(calendar_scheduler, "max_retries", 0)
+    return answer
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_update_of_missing_event_is_none(calendar_status, status):
+    calendar_status["status"] = status
+    assert asyncio.run(aupdate_calendar_meeting("evt1", {"summary": "x"})) is None
+
+
+@pytest.mark.parametrize("status", [403, 500, 503])
+def test_update_errors_propagate(calendar_status, status):
+    calendar_status["status"] = status
+    with pytest.raises(CalendarAPIError) as exc:
+        asyncio.run(aupdate_calendar_meeting("evt1", {"summary": "x"}))
+    assert exc.value.status_code == status
+
+
+@pytest.mark.parametrize("status, expected", [(404, 404), (403, 502), (500, 502)])
+def test_put_meeting_maps_calendar_errors(calendar_status, status, expected):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    calendar_status["status"] = status
+    res = TestClient(app).put("/v1/meetings/evt1", json={"summary": "x"})
+    assert res.status_code == expected
+
+
+def test_event_id_cannot_change_the_request_path(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.raw_path.decode())
+        return httpx.Response(200, json={"id": "x"})
+
+    async def token():
+        return "test-token"
+
+    client = AsyncCalendarClient(base_url="http://calendar.test", token_provider=token,
+                                 transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        await client.events_get("primary", "abc?fields=id")
+        await client.events_patch("primary", "../../users/me", {"summary": "x"})
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert seen[0].endswith("/events/abc%3Ffields%3Did")
+    assert "/events/..%2F..%2Fusers%2Fme?" in seen[1]
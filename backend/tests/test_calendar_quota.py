@@ -0,0 +1,59 @@
+import pytest
+
+from app.calendar_quota import BULK, INTERACTIVE, CalendarScheduler, priority_for
+
+
+def _scheduler(**kwargs):
+    # Proyecto sin límite: sólo cuenta el bucket del usuario (10 qps, ráfaga 20)
+    options = dict(project_qps=1e9, project_burst=1e9, user_qps=10, user_burst=20, reserve=0.2)
+    options.update(kwargs)
+    return CalendarScheduler(**options)
+
+
+def test_batch_larger_than_burst_pays_its_full_cost():
+    scheduler = _scheduler()
+    assert scheduler._try_acquire(BULK, "ana", cost=50) == 0.0
+    assert scheduler._users["ana"].tokens == pytest.approx(-30, abs=0.01)
+
+    # Otro batch de 50 espera a que se pague la deuda y se llene el bucket: (20 + 30) / 10
+    assert scheduler._try_acquire(BULK, "ana", cost=50) == pytest.approx(5.0, abs=0.01)
+    # Y una llamada suelta, a que vuelva a haber un token: (1 + 30) / 10
+    assert scheduler._try_acquire(INTERACTIVE, "ana", cost=1) == pytest.approx(3.1, abs=0.01)
+
+
+def test_debt_is_per_user():
+    scheduler = _scheduler()
+    scheduler._try_acquire(BULK, "ana", cost=50)
+    assert scheduler._try_acquire(INTERACTIVE, "beto", cost=1) == 0.0
+
+
+def test_project_bucket_also_pays_full_cost():
+    scheduler = _scheduler(project_qps=100, project_burst=30)
+    assert scheduler._try_acquire(BULK, "ana", cost=50) == 0.0
+    assert scheduler._project.tokens == pytest.approx(-20, abs=0.01)
+    # El bucket de otro usuario está lleno, pero el del proyecto tiene deuda
+    assert scheduler._try_acquire(INTERACTIVE, "beto", cost=1) == pytest.approx(0.21, abs=0.01)
+
+
+def test_bulk_leaves_the_interactive_reserve():
+    scheduler = _scheduler()
+    for _ in range(16):
+        assert scheduler._try_acquire(INTERACTIVE, "ana") == 0.0
+    # Quedan 4 tokens = la reserva (20%): el lote espera, lo interactivo no
+    assert scheduler._try_acquire(BULK, "ana", cost=1) > 0
+    assert scheduler._try_acquire(INTERACTIVE, "ana") == 0.0
+
+
+def test_only_batches_are_bulk():
+    assert priority_for("batch") == BULK
+    assert priority_for("events.insert") == INTERACTIVE
+    assert priority_for("events.list") == INTERACTIVE
+
+
+def test_5xx_is_retried_only_when_idempotent():
+    scheduler = _scheduler()
+    error = (503, {"error": {"code": 503}}, None)
+    assert scheduler._should_retry("events.insert", 0, error, idempotent=False) is None
+    assert scheduler._should_retry("events.insert", 0, error, idempotent=True)[0] == "5xx"
+    # Un 429 nunca aplicó nada: se reintenta aunque no sea idempotente
+    assert scheduler._should_retry("events.insert", 0, (429, {}, "1"), idempotent=False) == ("429", 1.0)
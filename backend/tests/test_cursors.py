@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.main import _decode_cursor, _decode_slot_cursor, _encode_cursor, _encode_slot_cursor
+
+
+def test_actions_cursor_round_trip(fake_db):
+    date = datetime(2026, 3, 9, 15, 30, 12, 345000, tzinfo=timezone.utc)
+    fake_db.collection("actions").document("abc123").set({"action": "create", "date": date})
+    snap = fake_db.collection("actions").document("abc123").get()
+
+    assert _decode_cursor(_encode_cursor(snap)) == {"date": date, "__name__": "abc123"}
+
+
+def test_slot_cursor_round_trip_keeps_offset():
+    start = datetime(2026, 3, 9, 9, 45, tzinfo=timezone(timedelta(hours=-6)))
+    cursor = _encode_slot_cursor(start)
+
+    assert "=" not in cursor
+    decoded = _decode_slot_cursor(cursor)
+    assert decoded == start
+    assert decoded.utcoffset() == timedelta(hours=-6)
+
+
+@pytest.mark.parametrize("decode", [_decode_cursor, _decode_slot_cursor])
+@pytest.mark.parametrize("cursor", ["", "no-es-base64!", "W10"])
+def test_invalid_cursors_are_400(decode, cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_slot_cursor_without_timezone_is_400():
+    naive = _encode_slot_cursor(datetime(2026, 3, 9, 9, 45))
+    with pytest.raises(HTTPException) as exc:
+        _decode_slot_cursor(naive)
+    assert exc.value.status_code == 400
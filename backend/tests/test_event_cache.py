@@ -0,0 +1,65 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from app.event_cache import CalendarEventStore
+
+
+class SpyCalendar:
+    """Registra los parámetros de cada events.list y no regresa eventos."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def events_list(self, calendar_id, **params):
+        self.calls.append(params)
+        return {"items": [], "nextSyncToken": "token-1"}
+
+
+def _store(spy, **kwargs):
+    options = dict(max_days=10, sync_past_days=2, sync_interval=0)
+    options.update(kwargs)
+    return CalendarEventStore(lambda: spy, **options)
+
+
+def test_full_sync_is_bounded_to_the_resident_window():
+    spy = SpyCalendar()
+    store = _store(spy)
+    asyncio.run(store.sync())
+
+    params = spy.calls[0]
+    time_min = datetime.fromisoformat(params["timeMin"])
+    time_max = datetime.fromisoformat(params["timeMax"])
+    assert time_max - time_min == timedelta(days=10)
+    assert params["singleEvents"] is True
+
+
+def test_incremental_sync_repeats_params_without_time_bounds():
+    spy = SpyCalendar()
+    store = _store(spy)
+
+    async def scenario():
+        await store.sync()
+        await store.sync()
+
+    asyncio.run(scenario())
+    full, incremental = spy.calls
+    assert incremental["syncToken"] == "token-1"
+    assert "timeMin" not in incremental and "timeMax" not in incremental
+    assert {k: v for k, v in full.items() if k not in ("timeMin", "timeMax")} == \
+        {k: v for k, v in incremental.items() if k != "syncToken"}
+
+
+def test_day_outside_the_window_is_fetched_on_demand():
+    spy = SpyCalendar()
+    store = _store(spy, sync_interval=3600)
+    far = date.today() + timedelta(days=400)
+
+    async def scenario():
+        await store.sync()
+        return await store.events_for_date(far)
+
+    assert asyncio.run(scenario()) == []
+    assert store.stats["misses"] == 1
+    day_call = spy.calls[-1]
+    assert datetime.fromisoformat(day_call["timeMin"]).date() == far
+    assert "syncToken" not in day_call
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from app.idempotency import IdempotencyConflict, IdempotencyStore, event_id_for, fingerprint
+
+
+def _counting(response=(201, {"id": "m1"}), delay=0.0):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return response
+
+    return fn, calls
+
+
+def test_replay_returns_stored_response_without_running_again():
+    store = IdempotencyStore()
+    fn, calls = _counting()
+
+    async def scenario():
+        first = await store.run("k", fingerprint({"a": 1}), fn)
+        second = await store.run("k", fingerprint({"a": 1}), fn)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == ((201, {"id": "m1"}), False)
+    assert second == ((201, {"id": "m1"}), True)
+    assert len(calls) == 1
+    assert store.stats["replayed"] == 1
+
+
+def test_same_key_with_other_body_conflicts():
+    store = IdempotencyStore()
+    fn, calls = _counting()
+
+    async def scenario():
+        await store.run("k", fingerprint({"a": 1}), fn)
+        await store.run("k", fingerprint({"a": 2}), fn)
+
+    with pytest.raises(IdempotencyConflict):
+        asyncio.run(scenario())
+    assert len(calls) == 1
+    assert store.stats["conflicts"] == 1
+
+
+def test_concurrent_requests_join_the_first_one():
+    store = IdempotencyStore()
+    fn, calls = _counting(delay=0.05)
+    fp = fingerprint({"a": 1})
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("k", fp, fn) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [repeated for _, repeated in results].count(False) == 1
+    assert all(response == (201, {"id": "m1"}) for response, _ in results)
+    assert store.stats["joined"] == 4
+
+
+def test_concurrent_request_with_other_body_conflicts():
+    store = IdempotencyStore()
+    fn, _ = _counting(delay=0.05)
+
+    async def scenario():
+        first = asyncio.ensure_future(store.run("k", fingerprint({"a": 1}), fn))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict):
+            await store.run("k", fingerprint({"a": 2}), fn)
+        return await first
+
+    assert asyncio.run(scenario()) == ((201, {"id": "m1"}), False)
+
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Calendar no respondió")
+        return 201, {"id": "m1"}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run("k", "fp", flaky)
+        return await store.run("k", "fp", flaky)
+
+    assert asyncio.run(scenario()) == ((201, {"id": "m1"}), False)
+    assert len(attempts) == 2
+
+
+def test_server_errors_are_not_stored():
+    store = IdempotencyStore()
+    fn, calls = _counting(response=(502, {"detail": "error"}))
+
+    async def scenario():
+        await store.run("k", "fp", fn)
+        return await store.run("k", "fp", fn)
+
+    assert asyncio.run(scenario()) == ((502, {"detail": "error"}), False)
+    assert len(calls) == 2
+
+
+def test_expired_keys_run_again():
+    store = IdempotencyStore(ttl=0)
+    fn, calls = _counting()
+
+    async def scenario():
+        await store.run("k", "fp", fn)
+        return await store.run("k", "fp", fn)
+
+    assert asyncio.run(scenario())[1] is False
+    assert len(calls) == 2
+
+
+def test_event_id_is_valid_for_calendar_and_stable():
+    event_id = event_id_for("k")
+    assert event_id == event_id_for("k") != event_id_for("otra")
+    assert 5 <= len(event_id) <= 1024
+    assert set(event_id) <= set("0123456789abcdefghijklmnopqrstuv")
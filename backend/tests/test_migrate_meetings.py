@@ -0,0 +1,49 @@
+from app.migrate_meetings import migrate
+
+
+def _meetings(db):
+    return {snap.id: snap.to_dict() for snap in db.collection("meetings").stream()}
+
+
+def test_copies_legacy_docs_under_the_event_id(fake_db):
+    fake_db.collection("meetings").document("random1").set({"id": "evt1", "summary": "Daily"})
+    fake_db.collection("meetings").document("texto").set({"summary": "Sin evento"})
+
+    stats = migrate(fake_db)
+
+    assert _meetings(fake_db) == {"evt1": {"id": "evt1", "summary": "Daily"}, "texto": {"summary": "Sin evento"}}
+    assert stats["migrated"] == 1 and stats["without_id"] == 1
+
+
+def test_existing_target_is_not_overwritten(fake_db):
+    meetings = fake_db.collection("meetings")
+    # Escrito por el código nuevo (p.ej. un merge del outbox tras un update)
+    meetings.document("evt1").set({"id": "evt1", "summary": "Nuevo", "updated": "2026-03-09T10:00:00Z"})
+    meetings.document("random1").set({"id": "evt1", "summary": "Viejo", "updated": "2026-01-01T10:00:00Z",
+                                      "status": "canceled"})
+
+    stats = migrate(fake_db)
+
+    # Sólo se agregan los campos que faltaban
+    assert _meetings(fake_db) == {"evt1": {"id": "evt1", "summary": "Nuevo", "updated": "2026-03-09T10:00:00Z",
+                                           "status": "canceled"}}
+    assert stats["merged_into_existing"] == 1 and stats["migrated"] == 0
+
+
+def test_newest_duplicate_wins(fake_db):
+    meetings = fake_db.collection("meetings")
+    meetings.document("a").set({"id": "evt1", "summary": "Reciente", "updated": "2026-03-09T10:00:00.000Z"})
+    meetings.document("b").set({"id": "evt1", "summary": "Vieja", "updated": "2026-03-01T10:00:00.000Z"})
+    meetings.document("c").set({"id": "evt1", "summary": "Sin fecha"})
+
+    stats = migrate(fake_db)
+
+    assert _meetings(fake_db)["evt1"]["summary"] == "Reciente"
+    assert set(_meetings(fake_db)) == {"evt1"}
+    assert stats["duplicates"] == 2
+
+
+def test_dry_run_writes_nothing(fake_db):
+    fake_db.collection("meetings").document("random1").set({"id": "evt1"})
+    assert migrate(fake_db, dry_run=True)["migrated"] == 1
+    assert set(_meetings(fake_db)) == {"random1"}
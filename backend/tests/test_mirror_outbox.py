@@ -0,0 +1,172 @@
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app import mirror_outbox
+from app.mirror_outbox import DELETE, MERGE, SET, MirrorOutbox, _fold, apply_op
+
+
+def _rows(*ops):
+    return [(op, json.dumps(data) if data is not None else None, float(i)) for i, (op, data) in enumerate(ops)]
+
+
+def test_fold_set_then_merges_is_one_set():
+    op, doc = _fold(_rows((SET, {"title": "a", "meta": {"x": 1}}),
+                          (MERGE, {"title": "b"}),
+                          (MERGE, {"meta": {"y": 2}})))
+    assert op == SET
+    assert doc == {"title": "b", "meta": {"x": 1, "y": 2}}
+
+
+def test_fold_merges_alone_stay_a_merge():
+    assert _fold(_rows((MERGE, {"a": 1}), (MERGE, {"b": 2}))) == (MERGE, {"a": 1, "b": 2})
+
+
+def test_fold_delete_discards_previous_ops():
+    assert _fold(_rows((SET, {"a": 1}), (MERGE, {"b": 2}), (DELETE, None))) == (DELETE, None)
+
+
+def test_fold_merge_after_delete_recreates_only_those_fields():
+    assert _fold(_rows((SET, {"a": 1}), (DELETE, None), (MERGE, {"b": 2}))) == (SET, {"b": 2})
+
+
+def _insert(outbox, meeting_id, op, data=None):
+    # Directo a SQLite: enqueue() despertaría al hilo de fondo
+    outbox._connection().execute(
+        "INSERT INTO outbox (meeting_id, op, data, created) VALUES (?, ?, ?, ?)",
+        (meeting_id, op, json.dumps(data) if data is not None else None, time.time()),
+    )
+
+
+@pytest.fixture
+def outbox_path(tmp_path):
+    return str(tmp_path / "outbox.sqlite")
+
+
+def test_claimed_meetings_are_leased_to_one_worker(outbox_path, fake_db):
+    a = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    b = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    _insert(a, "m1", SET, {"title": "a"})
+    _insert(a, "m1", MERGE, {"title": "b"})
+    _insert(a, "m2", DELETE)
+
+    claimed = a._claim()
+    assert {k: v[1:3] for k, v in claimed.items()} == {"m1": (SET, {"title": "b"}), "m2": (DELETE, None)}
+    # El otro worker no ve nada mientras dure el lease
+    assert b._claim() == {}
+    # Una operación nueva de una reunión reclamada espera a que termine el lease
+    _insert(b, "m1", MERGE, {"room": "x"})
+    assert b._claim() == {}
+
+
+def test_expired_lease_can_be_claimed_again(outbox_path, fake_db, monkeypatch):
+    a = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    b = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    _insert(a, "m1", SET, {"title": "a"})
+    monkeypatch.setattr(mirror_outbox, "MIRROR_OUTBOX_LEASE_SECONDS", 0)
+    assert set(a._claim()) == {"m1"}
+    # a "se cayó" sin confirmar: b reclama lo mismo al vencer el lease
+    assert set(b._claim()) == {"m1"}
+
+
+def test_flush_applies_folded_ops_and_empties_the_outbox(outbox_path, fake_db):
+    outbox = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    fake_db.collection("meetings").document("m2").set({"title": "vieja"})
+    _insert(outbox, "m1", SET, {"title": "a", "status": "active"})
+    _insert(outbox, "m1", MERGE, {"status": "cancelled"})
+    _insert(outbox, "m2", DELETE)
+
+    assert outbox.flush() == 2
+    assert fake_db.collection("meetings").document("m1").get().to_dict() == {"title": "a", "status": "cancelled"}
+    assert not fake_db.collection("meetings").document("m2").get().exists
+    assert outbox.pending() == 0
+    assert outbox.stats["superseded"] == 1
+
+
+def test_failed_commit_keeps_ops_with_backoff(outbox_path):
+    def broken_db():
+        raise RuntimeError("Firestore no responde")
+
+    outbox = MirrorOutbox(broken_db, db_path=outbox_path)
+    _insert(outbox, "m1", SET, {"title": "a"})
+
+    assert outbox.flush() == 0
+    attempts, next_attempt, lease_until, last_error = outbox._connection().execute(
+        "SELECT attempts, next_attempt, lease_until, last_error FROM outbox"
+    ).fetchone()
+    assert attempts == 1
+    assert next_attempt > time.time()
+    assert lease_until == 0
+    assert "Firestore no responde" in last_error
+    # Nada se reintenta antes de que venza el backoff, y nada se pierde
+    assert outbox._claim() == {}
+    assert outbox.pending() == 1
+
+
+def test_enqueue_many_keeps_order_and_datetimes(outbox_path, fake_db):
+    outbox = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    canceled_at = datetime(2026, 3, 9, 15, 0, tzinfo=timezone.utc)
+    outbox.enqueue_many([
+        ("m1", SET, {"title": "a"}),
+        ("m1", MERGE, {"status": "canceled", "canceled_at": canceled_at}),
+    ])
+
+    assert outbox.pending_for("m1") == (SET, {"title": "a", "status": "canceled", "canceled_at": canceled_at})
+    assert outbox.pending_for("m2") is None
+    outbox.close()
+    assert fake_db.collection("meetings").document("m1").get().to_dict()["canceled_at"] == canceled_at
+
+
+def test_apply_op_matches_firestore_semantics():
+    assert apply_op({"a": 1}, DELETE, None) is None
+    assert apply_op({"a": 1}, SET, {"b": 2}) == {"b": 2}
+    assert apply_op({"a": 1, "m": {"x": 1}}, MERGE, {"m": {"y": 2}}) == {"a": 1, "m": {"x": 1, "y": 2}}
+    assert apply_op(None, MERGE, {"b": 2}) == {"b": 2}
+
+
+@pytest.fixture
+def app_with_outbox(outbox_path, fake_db, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    outbox = MirrorOutbox(lambda: fake_db, db_path=outbox_path)
+    monkeypatch.setattr(main, "mirror_outbox", outbox)
+    monkeypatch.setattr(main, "get_db", lambda: fake_db)
+    monkeypatch.setattr(main, "log_action", lambda *args, **kwargs: {})
+    return TestClient(main.app), outbox
+
+
+def test_status_cancel_waits_for_a_pending_create(app_with_outbox, fake_db):
+    client, outbox = app_with_outbox
+    # El create sigue en el outbox (p.ej. en backoff): Firestore aún no tiene el documento
+    outbox._connection().execute(
+        "INSERT INTO outbox (meeting_id, op, data, created, next_attempt) VALUES (?, ?, ?, ?, ?)",
+        ("m1", SET, json.dumps({"summary": "Daily"}), time.time(), time.time() + 3600),
+    )
+
+    res = client.post("/v1/meetings/m1/cancel", json={"action": "cancel", "action_id": "m1", "user": "ana@example.com"})
+    assert res.status_code == 200
+    assert res.json()["meeting"]["summary"] == "Daily"
+    assert res.json()["meeting"]["status"] == "canceled"
+
+    # Al aplicarse, el create no pisa la cancelación
+    outbox._connection().execute("UPDATE outbox SET next_attempt = 0")
+    outbox.close()
+    doc = fake_db.collection("meetings").document("m1").get().to_dict()
+    assert doc["summary"] == "Daily" and doc["status"] == "canceled"
+
+
+def test_status_cancel_of_unknown_or_deleted_meeting_is_404(app_with_outbox, fake_db):
+    client, outbox = app_with_outbox
+    body = {"action": "cancel", "action_id": "m1", "user": "ana@example.com"}
+    assert client.post("/v1/meetings/m1/cancel", json=body).status_code == 404
+
+    fake_db.collection("meetings").document("m1").set({"summary": "Daily"})
+    outbox._connection().execute(
+        "INSERT INTO outbox (meeting_id, op, data, created, next_attempt) VALUES (?, ?, NULL, ?, ?)",
+        ("m1", DELETE, time.time(), time.time() + 3600),
+    )
+    assert client.post("/v1/meetings/m1/cancel", json=body).status_code == 404
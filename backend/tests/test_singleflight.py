@@ -0,0 +1,91 @@
+import asyncio
+
+from app.singleflight import SingleFlight
+
+
+def _counting(delay=0.0):
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        n = len(calls)
+        await asyncio.sleep(delay)
+        return n
+
+    return fn, calls
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test-concurrent", window=0)
+    fn, calls = _counting(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == [1] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"executed": 1, "joined": 4, "reused": 0}
+
+
+def test_result_is_reused_within_the_window():
+    flight = SingleFlight("test-window", window=60)
+    fn, calls = _counting()
+
+    async def scenario():
+        return [await flight.do("k", fn), await flight.do("k", fn), await flight.do("otra", fn)]
+
+    assert asyncio.run(scenario()) == [1, 1, 2]
+    assert flight.stats["reused"] == 1
+
+
+def test_invalidate_drops_recent_results():
+    flight = SingleFlight("test-invalidate", window=60)
+    fn, calls = _counting()
+
+    async def scenario():
+        first = await flight.do("k", fn)
+        flight.invalidate()
+        return first, await flight.do("k", fn)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_invalidate_during_flight_does_not_store_stale_result():
+    flight = SingleFlight("test-generation", window=60)
+    fn, calls = _counting(delay=0.05)
+
+    async def scenario():
+        before = asyncio.ensure_future(flight.do("k", fn))
+        await asyncio.sleep(0)
+        # Una escritura propia mientras la lectura sigue en curso
+        flight.invalidate()
+        after = await flight.do("k", fn)
+        stale = await before
+        # La lectura vieja terminó después de invalidate(): no se reutiliza
+        return stale, after, await flight.do("k", fn)
+
+    stale, after, reused = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert (stale, after) == (1, 2)
+    assert reused == after
+
+
+def test_errors_are_not_cached():
+    flight = SingleFlight("test-errors", window=60)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("falla")
+        return "ok"
+
+    async def scenario():
+        try:
+            await flight.do("k", flaky)
+        except RuntimeError:
+            pass
+        return await flight.do("k", flaky)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert len(attempts) == 2
@@ -12,13 +12,20 @@ export default function App() {
     // 2) agrega placeholder del bot para ir rellenando (stream o no stream)
     addMessage({ role: "assistant", content: "Pensando" });
 
-    // 3) fake respuesta (sustituye por tu fetch/SSE)
-    const reply = await execUserOp(text);
-    useChatStore.setState((state) => {
-      const msgs = [...state.messages];
-      msgs[msgs.length - 1] = { role: "assistant", content: reply };
-      return { messages: msgs };
+    // 3) la intención llega por SSE; el placeholder se anima con cada token
+    const setLast = (content: string) =>
+      useChatStore.setState((state) => {
+        const msgs = [...state.messages];
+        msgs[msgs.length - 1] = { role: "assistant", content };
+        return { messages: msgs };
+      });
+
+    let tokens = 0;
+    const reply = await execUserOp(text, () => {
+      tokens += 1;
+      setLast("Pensando" + ".".repeat((tokens % 3) + 1));
     });
+    setLast(reply);
   }
 
   return (
@@ -50,8 +57,10 @@ export default function App() {
   );
 }
 
-function execUserOp(q: string) {
-  return fetch("http://127.0.0.1:8000/v1/intent/create/parse", {
+// Lee /v1/intent/create/parse/stream (Server-Sent Events): llama onToken con
+// cada fragmento y resuelve con la intención final, o null si hubo error.
+async function parseIntentStream(q: string, onToken?: (chunk: string) => void): Promise<any | null> {
+  const res = await fetch("http://127.0.0.1:8000/v1/intent/create/parse/stream", {
     method: "POST",
     headers: {
       "Content-Type": "application/json"
@@ -59,11 +68,43 @@ function execUserOp(q: string) {
     body: JSON.stringify({
       text: q   // 🔥 campo exacto que tu backend espera
     })
-  }).then(async (res) => {
-    if (!res.ok)
+  })
+  if (!res.ok || !res.body)
+    return null
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ""
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done)
+      return null
+    buffer += decoder.decode(value, { stream: true })
+
+    let sep: number
+    while ((sep = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, sep)
+      buffer = buffer.slice(sep + 2)
+      let event = "message"
+      let data = ""
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim()
+        else if (line.startsWith("data:")) data += line.slice(5).trim()
+      }
+      if (event == "token")
+        onToken?.(JSON.parse(data).text)
+      else if (event == "intent")
+        return JSON.parse(data).intent
+      else if (event == "error")
+        return null
+    }
+  }
+}
+
+function execUserOp(q: string, onToken?: (chunk: string) => void) {
+  return parseIntentStream(q, onToken).then(async (json_res) => {
+    if (json_res == null)
       return "Por favor, se más claro con tus instrucciones e intenta de nuevo"
-    let json_res = await res.json()
-    json_res = json_res.intent
     console.log(json_res)
     if (json_res.err != null)
       return json_res.err